@@ -0,0 +1,176 @@
+"""File: batch_runner.py
+
+   Author: Brian Vu
+
+   Purpose: Runs many headless covidSim simulations over a grid of
+            parameters, several replicates per point, on a process pool,
+            and boils the trajectories down to a table of per-tick
+            statistics (mean and quantiles of cur_infected).
+"""
+
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from covidSim import SimConfig, run_headless
+
+
+# the SimConfig fields that can be swept over
+GRID_FIELDS = ("population", "infected_pop", "infected_mask_type",
+               "healthy_masks", "ticks")
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def expand_grid(grid):
+    """Turns a grid like {"population": [50, 100], "healthy_masks": [0, 25]}
+       into a list of dicts, one per combination (in a stable order).  Every
+       key must be one of GRID_FIELDS; missing ones use SimConfig's
+       defaults.
+    """
+    for name in grid:
+        assert name in GRID_FIELDS   # unrecognized grid parameter
+
+    names = [name for name in GRID_FIELDS if name in grid]
+    points = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        points.append(dict(zip(names, values)))
+    return points
+
+
+def run_replicate(params, seed, engine="objects"):
+    """Runs one headless simulation and returns its cur_infected per tick.
+       This is what each pool worker runs; it is a top-level function so
+       that it can be pickled.
+
+       Parameters: the SimConfig fields, the seed for this replicate, and
+       which engine to use ("objects" for covidSim's Game, or "arrays" for
+       population_arrays)
+    """
+    config = SimConfig(seed=seed, **params)
+    if engine == "objects":
+        return run_headless(config)
+    elif engine == "arrays":
+        from population_arrays import PopulationArrays
+        rng = np.random.default_rng(seed)
+        pop = PopulationArrays.from_config(config, rng)
+        return pop.run(config.ticks, rng)
+    else:
+        assert False   # unrecognized engine
+
+
+def job_seed(seed, params, replicate):
+    """The seed of one replicate of one grid point: a hash of the base
+       seed, the point's parameters and the replicate's number.  It doesn't
+       depend on what else is in the grid, so adding a point (or more
+       replicates) leaves the seeds of the existing jobs alone - and the
+       run cache and sweep queue still recognize them.
+    """
+    text = json.dumps([seed, params, replicate], sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    # 63 bits, so that it fits in a signed 64-bit int (like a SQLite INTEGER)
+    return int.from_bytes(digest[:8], "little") >> 1
+
+
+def make_jobs(points, replicates, seed=0, engine="objects"):
+    """Returns a (params, seed, engine) job for every replicate of every
+       point, in order.  See job_seed() for the seeds.
+    """
+    jobs = []
+    for p in range(len(points)):
+        for r in range(replicates):
+            jobs.append((points[p], job_seed(seed, points[p], r), engine))
+    return jobs
+
+
+def _run_job(job):
+    params, seed, engine = job
+    return run_replicate(params, seed, engine)
+
+
+def run_batch(grid, replicates, workers=None, seed=0, engine="objects",
+              quantiles=DEFAULT_QUANTILES, cache=None):
+    """Runs every point of the grid `replicates` times across a pool of
+       `workers` processes (None means one per core).  Every replicate gets
+       its own seed, derived from `seed` (see job_seed()), so the whole
+       batch is reproducible no matter how the jobs land on the workers.
+
+       If cache (a run_cache.RunCache) is given, replicates that are
+       already in it aren't run again, and new ones are added to it; so
+       changing one point of a grid only reruns that point.
+
+       Returns a list of rows (dicts): the grid parameters, then "tick",
+       "mean" and one "qNN" column per quantile (q05, q50, ...).
+    """
+    points = expand_grid(grid)
+
+    jobs = make_jobs(points, replicates, seed, engine)
+
+    results = [None] * len(jobs)
+    if cache is not None:
+        for k in range(len(jobs)):
+            params, seed_k, engine_k = jobs[k]
+            results[k] = cache.get(SimConfig(seed=seed_k, **params), engine_k)
+    todo = [k for k in range(len(jobs)) if results[k] is None]
+
+    # hand out the jobs in chunks, so that short runs don't spend all their
+    # time talking to the pool
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(todo) > 0:
+        chunksize = max(1, len(todo) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = pool.map(_run_job, [jobs[k] for k in todo], chunksize=chunksize)
+            for k, counts in zip(todo, done):
+                results[k] = counts
+                if cache is not None:
+                    params, seed_k, engine_k = jobs[k]
+                    cache.put(SimConfig(seed=seed_k, **params), engine_k, counts)
+
+    rows = []
+    for p in range(len(points)):
+        rows += summarize(points[p], results[p*replicates: (p+1)*replicates], quantiles)
+    return rows
+
+
+def summarize(params, runs, quantiles=DEFAULT_QUANTILES):
+    """Boils the replicates of one grid point down to rows of the
+       run_batch() table.
+
+       Parameters: the grid parameters, a list of cur_infected lists (one
+       per replicate, all the same length), and the quantiles
+    """
+    runs = np.array(runs, dtype=np.float64)
+    means = runs.mean(axis=0)
+    qs = np.quantile(runs, quantiles, axis=0)
+
+    rows = []
+    for tick in range(runs.shape[1]):
+        row = dict(params)
+        row["tick"] = tick
+        row["mean"] = float(means[tick])
+        for k in range(len(quantiles)):
+            row[quantile_name(quantiles[k])] = float(qs[k][tick])
+        rows.append(row)
+    return rows
+
+
+def quantile_name(q):
+    """Returns the column name for a quantile, like "q05" for 0.05."""
+    return "q%02d" % round(q * 100)
+
+
+def write_csv(rows, path):
+    """Writes the table returned by run_batch() to a CSV file."""
+    if len(rows) == 0:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,364 @@
+"""File: benchmark.py
+
+   Author: Brian Vu
+
+   Purpose: Benchmarks the simulation core.  Runs the tick loop with
+            populations from 50 up to 100k people, for every nearby engine
+            (and renderer, if there is a display), and reports ticks per
+            second, peak memory and the time spent in each phase, as JSON.
+
+            Every case runs in a fresh process, so that the peak memory of
+            one case doesn't leak into the next.  Save the output of two
+            commits and compare them with --compare to spot regressions:
+
+              python benchmark.py -o before.json
+              (change something)
+              python benchmark.py -o after.json --compare before.json
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import queue as queue_module
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+DEFAULT_SIZES = (50, 200, 1000, 5000, 20000, 100000)
+
+# Game nearby engines, plus the structure-of-arrays population
+ENGINES = ("all_pairs", "grid", "lazy", "verlet", "arrays")
+
+# the all-pairs engine keeps n(n-1) tuples around; past this many people a
+# single tick takes minutes (and gigabytes), so those cases are skipped
+ALL_PAIRS_MAX = 2000
+
+# how many seconds a single case may take before it is recorded as failed
+CASE_TIMEOUT = 3600.0
+
+# exit codes of --compare: some case got slower; or the reports come from
+# different engine versions, so nothing could be compared
+EXIT_SLOWER = 1
+EXIT_VERSION_CHANGED = 2
+
+# the floor is scaled up with the population, so that the density (and
+# thus the number of contacts per person) stays about the same as 50 people
+# in the 600x600 room
+BASE_POPULATION = 50
+BASE_SIZE = 600
+
+
+def make_config(population, ticks, engine, seed):
+    from covidSim import SimConfig
+
+    scale = max(1.0, (population / BASE_POPULATION) ** 0.5)
+    size = int(BASE_SIZE * scale)
+    infected = max(1, population // 100)
+    nearby_engine = engine if engine != "arrays" else "grid"
+    return SimConfig(population, infected, "none", (population - infected) // 2,
+                     ticks=ticks, wid=size, hei=size, seed=seed,
+                     nearby_engine=nearby_engine, frame_rate=10**9)
+
+
+def _peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def _bench_game(config, renderer):
+    import covidSim
+    from tick_profiler import TickProfiler
+
+    game = covidSim.build_game(config, headless=(renderer == "headless"))
+    if renderer != "headless":
+        game.config_set("renderer", renderer)
+        # measure every frame, even the ones that would be late
+        game.config_set("skip_late_frames", False)
+
+    # the first tick just moves the spawned people into the game
+    game.do_nearby_calls()
+    game.do_move_calls()
+    game.do_edge_calls()
+    game.execute_removes()
+
+    prof = TickProfiler(window=config.ticks)
+    game.config_set("profiler", prof)
+
+    start = time.perf_counter()
+    for tick in range(config.ticks):
+        game.do_nearby_calls()
+        game.do_move_calls()
+        game.do_edge_calls()
+        game.execute_removes()
+        if renderer != "headless":
+            game.draw(config.population, covidSim.cur_healthy, config.healthy_masks,
+                      config.population - config.infected_pop - config.healthy_masks,
+                      config.infected_pop, config.infected_mask_type,
+                      covidSim.cur_infected, covidSim.newly_infected)
+    elapsed = time.perf_counter() - start
+    prof.close()
+
+    summary = prof.summary()
+    phases = {}
+    for name in ("nearby", "move", "edge", "removes", "draw", "pairs", "nearby_calls"):
+        phases[name] = summary[name]["mean"]
+    return elapsed, phases
+
+
+def _bench_arrays(config):
+    import numpy as np
+    from population_arrays import PopulationArrays, tick_draws
+    from sim_random import SimRandom
+
+    rng = SimRandom(config.seed).generator
+    pop = PopulationArrays.from_config(config, rng)
+    n = len(pop)
+
+    # this is PopulationArrays.step(), with a timer around every kernel
+    phases = {"infect": 0.0, "move": 0.0, "edge": 0.0}
+    start = time.perf_counter()
+    for tick in range(config.ticks):
+        t0 = time.perf_counter()
+        rolls, choices = tick_draws(rng.integers(2**63), np.arange(n))
+        pop.step_infect(rolls)
+        t1 = time.perf_counter()
+        pop.step_move()
+        t2 = time.perf_counter()
+        pop.step_edges(choices)
+        t3 = time.perf_counter()
+
+        phases["infect"] += t1 - t0
+        phases["move"] += t2 - t1
+        phases["edge"] += t3 - t2
+    elapsed = time.perf_counter() - start
+
+    for name in phases:
+        phases[name] /= config.ticks
+    return elapsed, phases
+
+
+def run_case(population, engine, renderer, ticks, seed):
+    """Runs a single benchmark case in this process, and returns its result
+       record.
+    """
+    config = make_config(population, ticks, engine, seed)
+    if engine == "arrays":
+        elapsed, phases = _bench_arrays(config)
+    else:
+        elapsed, phases = _bench_game(config, renderer)
+
+    return {
+        "engine": engine,
+        "renderer": renderer,
+        "population": population,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_sec": ticks / elapsed if elapsed > 0 else None,
+        "peak_rss_kb": _peak_rss_kb(),
+        "phases": phases,
+    }
+
+
+def _case_worker(args, queue):
+    queue.put(run_case(*args))
+
+
+def failed_case(population, engine, renderer, ticks, error):
+    """The result record of a case that didn't finish."""
+    return {
+        "engine": engine,
+        "renderer": renderer,
+        "population": population,
+        "ticks": ticks,
+        "seconds": None,
+        "ticks_per_sec": None,
+        "peak_rss_kb": None,
+        "phases": {},
+        "error": error,
+    }
+
+
+def run_case_isolated(population, engine, renderer, ticks, seed, timeout=CASE_TIMEOUT):
+    """Runs run_case() in a fresh process (so that peak_rss_kb only covers
+       this case) and returns its result.  If the process dies (say, it runs
+       out of memory) or takes longer than timeout seconds, the case is
+       recorded as failed instead.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_case_worker,
+                       args=((population, engine, renderer, ticks, seed), queue))
+    proc.start()
+
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except queue_module.Empty:
+            if proc.exitcode is not None:
+                # (one last look, in case it finished just now)
+                try:
+                    result = queue.get(timeout=1.0)
+                except queue_module.Empty:
+                    result = failed_case(population, engine, renderer, ticks,
+                                         "exited with code %d" % proc.exitcode)
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = failed_case(population, engine, renderer, ticks,
+                                     "timed out after %g s" % timeout)
+    proc.join()
+    return result
+
+
+def available_renderers():
+    """"headless", plus the tkinter renderers if there is a display to open
+       a window on.
+    """
+    renderers = ["headless"]
+    if sys.platform != "linux" or os.environ.get("DISPLAY"):
+        renderers += ["immediate", "retained"]
+    return renderers
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(sizes, engines, renderers, ticks, seed, timeout=CASE_TIMEOUT):
+    results = []
+    for engine in engines:
+        for renderer in renderers:
+            # the array engine has no renderer of its own
+            if engine == "arrays" and renderer != "headless":
+                continue
+            for population in sizes:
+                if engine == "all_pairs" and population > ALL_PAIRS_MAX:
+                    continue
+                # drawing 100k people in a window isn't a useful benchmark
+                if renderer != "headless" and population > 5000:
+                    continue
+
+                result = run_case_isolated(population, engine, renderer, ticks, seed,
+                                           timeout)
+                if result["ticks_per_sec"] is None:
+                    print("%-10s %-9s %7d people: FAILED (%s)" %
+                          (engine, renderer, population, result.get("error")),
+                          file=sys.stderr)
+                else:
+                    print("%-10s %-9s %7d people: %8.1f ticks/s  %8d KB" %
+                          (engine, renderer, population, result["ticks_per_sec"],
+                           result["peak_rss_kb"]), file=sys.stderr)
+                results.append(result)
+
+    from run_cache import ENGINE_VERSION
+    return {
+        "revision": git_revision(),
+        "engine_version": ENGINE_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "ticks": ticks,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(old, new, threshold=0.10):
+    """Prints every case whose ticks/second changed by more than threshold
+       between two run_suite() reports; returns the number of slowdowns, or
+       None if the reports can't be compared.
+    """
+    def key(r):
+        return (r["engine"], r["renderer"], r["population"])
+
+    # a different engine version simulates something else (before version
+    # 2, people walked out through the right and bottom walls of any floor
+    # bigger than 600x600 - which is every scaled-up case here), so its
+    # timings can't be compared
+    if old.get("engine_version") != new.get("engine_version"):
+        print("not comparing: engine version %s vs %s" %
+              (old.get("engine_version"), new.get("engine_version")))
+        return None
+
+    before = {}
+    for r in old["results"]:
+        before[key(r)] = r
+
+    slowdowns = 0
+    for r in new["results"]:
+        o = before.get(key(r))
+        if o is None or not o["ticks_per_sec"] or not r["ticks_per_sec"]:
+            continue
+        ratio = r["ticks_per_sec"] / o["ticks_per_sec"]
+        if ratio < 1 - threshold:
+            slowdowns += 1
+            print("SLOWER  %s: %.2fx" % (key(r), ratio))
+        elif ratio > 1 + threshold:
+            print("faster  %s: %.2fx" % (key(r), ratio))
+    return slowdowns
+
+
+def compare_exit_code(old, new, allow_version_change=False, threshold=0.10):
+    """compare(), as the exit code of --compare: 0 if nothing got slower,
+       EXIT_SLOWER if something did, and EXIT_VERSION_CHANGED if the engine
+       version changed (unless that is allowed, in which case it's 0).
+    """
+    slowdowns = compare(old, new, threshold)
+    if slowdowns is None:
+        return 0 if allow_version_change else EXIT_VERSION_CHANGED
+    return EXIT_SLOWER if slowdowns > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the covidSim core")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--renderers", nargs="+", default=None)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=CASE_TIMEOUT,
+                        help="seconds a case may take before it counts as failed")
+    parser.add_argument("-o", "--output", default=None,
+                        help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", default=None,
+                        help="an older JSON report to compare against")
+    parser.add_argument("--allow-version-change", action="store_true",
+                        help="pass --compare when the engine version changed "
+                             "(the timings aren't compared then)")
+    args = parser.parse_args()
+
+    renderers = args.renderers or available_renderers()
+    report = run_suite(args.sizes, args.engines, renderers, args.ticks, args.seed,
+                       args.timeout)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        code = compare_exit_code(old, report, args.allow_version_change)
+        if code != 0:
+            sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""File: checkpoint.py
+
+   Author: Brian Vu
+
+   Purpose: Saves the complete state of a run to a compact binary file,
+            and loads it back, so a long run can be continued from its last
+            checkpoint instead of from tick 0.  A resumed run is exactly the
+            same, number for number, as one that was never interrupted.
+
+   File layout (all little endian):
+       header:  MAGIC, then the length of the metadata, the number of
+                buffered random numbers, and the number of people (uint64s)
+       meta:    JSON (the tick, the id counter, the stats counters, the
+                SimConfig and the rng's state), padded to 8 bytes
+       buffer:  float64s - the numbers the SimRandom has drawn but not
+                handed out yet
+       people:  one RECORD_DTYPE record per person (27 bytes), in the order
+                the game iterates them
+
+   The people are read with numpy.memmap, so opening a checkpoint doesn't
+   read (or parse) the records at all; load_arrays() even runs straight out
+   of the mapped file (copy-on-write, so the file itself never changes).
+"""
+
+
+import json
+import os
+import struct
+
+import numpy as np
+
+import covidSim
+from covidSim import Healthy, Infected, SimConfig
+from obstacle_map import ObstacleMap
+from population_arrays import PopulationArrays, HEALTHY, INFECTED, TAGGED
+
+
+MAGIC = b"COVIDCK1"
+HEADER = struct.Struct("<8sQQQ")
+
+RECORD_DTYPE = np.dtype([("id", "<i8"),
+                         ("x", "<i8"),
+                         ("y", "<i8"),
+                         ("direction", "i1"),
+                         ("mask", "?"),
+                         ("state", "i1")])
+
+
+def _write(path, meta, buf, records):
+    """Writes a checkpoint file.  It goes to a temporary file first, so a
+       crash in the middle of a save leaves the previous checkpoint intact.
+    """
+    meta = json.dumps(meta).encode("utf-8")
+    meta += b" " * (-len(meta) % 8)
+    buf = np.asarray(buf, dtype="<f8")
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(meta), len(buf), len(records)))
+        f.write(meta)
+        f.write(buf.tobytes())
+        f.write(records.tobytes())
+    os.replace(tmp, path)
+
+
+def _open(path, mode="r"):
+    """Returns (meta, buffer, records) of a checkpoint file; buffer and
+       records are memmaps.
+    """
+    with open(path, "rb") as f:
+        magic, meta_len, buf_len, n = HEADER.unpack(f.read(HEADER.size))
+        assert magic == MAGIC   # not a checkpoint file
+        meta = json.loads(f.read(meta_len).decode("utf-8"))
+
+    offset = HEADER.size + meta_len
+    buf = np.zeros(0, dtype="<f8")
+    if buf_len > 0:
+        buf = np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=(buf_len,))
+    offset += 8 * buf_len
+
+    records = np.zeros(0, dtype=RECORD_DTYPE)
+    if n > 0:
+        records = np.memmap(path, dtype=RECORD_DTYPE, mode=mode, offset=offset, shape=(n,))
+    return meta, buf, records
+
+
+def _rng_state(inner):
+    """The JSON version of a bit generator (or random.Random) state."""
+    if isinstance(inner, tuple):
+        # random.Random.getstate(): (version, tuple of ints, gauss)
+        return {"python": [inner[0], list(inner[1]), inner[2]]}
+    return {"numpy": inner}
+
+
+def _rng_inner(state):
+    if "python" in state:
+        version, internal, gauss = state["python"]
+        return (version, tuple(internal), gauss)
+    return state["numpy"]
+
+
+def save_game(path, game, config):
+    """Writes a checkpoint of a covidSim game, between two ticks.
+
+       Parameters: the file name, the game, and the SimConfig it was
+       built from
+    """
+    assert not game.has_pending_changes()   # only between ticks
+
+    objs = list(game.get_objs())
+    records = np.zeros(len(objs), dtype=RECORD_DTYPE)
+    records["id"] = [o.id for o in objs]
+    records["x"] = [o.x for o in objs]
+    records["y"] = [o.y for o in objs]
+    records["direction"] = [o.number for o in objs]
+    records["mask"] = [o.mask for o in objs]
+    records["state"] = [INFECTED if isinstance(o, Infected)
+                        else TAGGED if o.tagged else HEALTHY for o in objs]
+
+    inner, buf, pos = game.rng.getstate()
+    meta = {"kind": "objects",
+            "tick": game.get_tick(),
+            "next_id": game.get_next_id(),
+            "counters": list(covidSim.get_counters()),
+            "config": vars(config),
+            "rng": _rng_state(inner)}
+    _write(path, meta, buf[pos:], records)
+
+
+def load_game(path, headless=True):
+    """Loads a checkpoint written by save_game() into a new game, and sets
+       covidSim's stats counters.  Returns (game, config); the game
+       continues from the tick the checkpoint was taken at.
+    """
+    meta, buf, records = _open(path)
+    assert meta["kind"] == "objects"
+
+    config = SimConfig(**meta["config"])
+    game = covidSim.new_game(config, headless)
+
+    objs = []
+    ids = records["id"].tolist()
+    xs = records["x"].tolist()
+    ys = records["y"].tolist()
+    directions = records["direction"].tolist()
+    masks = records["mask"].tolist()
+    states = records["state"].tolist()
+    for k in range(len(records)):
+        mask_type = "mask" if masks[k] else "none"
+        # the constructors draw from the rng; that doesn't matter, since
+        # its state is restored below
+        if states[k] == INFECTED:
+            o = Infected(config.wid, config.hei, mask_type, game.rng, ids[k])
+        else:
+            o = Healthy(config.wid, config.hei, mask_type, game.rng, ids[k])
+            if states[k] == TAGGED:
+                o.tagged = True
+                o.color = "#FD878E"
+        o.x = xs[k]
+        o.y = ys[k]
+        o.number = directions[k]
+        objs.append(o)
+
+    game.restore(objs, meta["tick"], meta["next_id"])
+    game.rng.setstate((_rng_inner(meta["rng"]), buf.tolist(), 0))
+    covidSim.set_counters(*meta["counters"])
+    return game, config
+
+
+def save_arrays(path, pop, rng, config):
+    """Writes a checkpoint of a population_arrays.PopulationArrays run.
+
+       Parameters: the file name, the population, the numpy Generator that
+       is passed to its step(), and the SimConfig
+    """
+    records = np.zeros(len(pop), dtype=RECORD_DTYPE)
+    records["id"] = pop.ids
+    records["x"] = pop.x
+    records["y"] = pop.y
+    records["direction"] = pop.direction
+    records["mask"] = pop.mask
+    records["state"] = pop.state
+
+    meta = {"kind": "arrays",
+            "tick": pop.tick,
+            "radius": pop.radius,
+            "config": vars(config),
+            "rng": _rng_state(rng.bit_generator.state)}
+    _write(path, meta, [], records)
+
+
+def load_arrays(path):
+    """Loads a checkpoint written by save_arrays().  The columns of the
+       population are views of the mapped file, so this takes the same
+       time for any population size; pages are read (and copied, when
+       they change) as the run touches them.
+
+       Returns (pop, rng, config).
+    """
+    meta, buf, records = _open(path, mode="c")
+    assert meta["kind"] == "arrays"
+
+    config = SimConfig(**meta["config"])
+    pop = PopulationArrays(records["x"], records["y"], records["direction"],
+                           records["mask"], records["state"], config.wid, config.hei,
+                           meta["radius"], records["id"])
+    pop.tick = meta["tick"]
+    if config.obstacles:
+        pop.obstacles = ObstacleMap(config.wid, config.hei, pop.radius)
+
+    rng = np.random.default_rng()
+    rng.bit_generator.state = _rng_inner(meta["rng"])
+    return pop, rng, config
+
+
+def run_with_checkpoints(config, path, every, sink=None, log=None):
+    """covidSim.run_headless(), saving a checkpoint to path every every
+       ticks.  Returns the cur_infected counts.
+    """
+    game = covidSim.build_game(config, headless=True)
+    game.event_log = log
+
+    def after_tick(game):
+        if game.get_tick() % every == 0:
+            save_game(path, game, config)
+    return covidSim.run_ticks(game, config.ticks, sink, after_tick)
+
+
+def resume(path, every=0, sink=None, log=None):
+    """Continues a run from its checkpoint up to config.ticks, still saving
+       a checkpoint every every ticks (if every > 0).  Returns the
+       cur_infected counts of the remaining ticks.
+    """
+    game, config = load_game(path)
+    game.event_log = log
+
+    after_tick = None
+    if every > 0:
+        def after_tick(game):
+            if game.get_tick() % every == 0:
+                save_game(path, game, config)
+    return covidSim.run_ticks(game, config.ticks - game.get_tick(), sink, after_tick)
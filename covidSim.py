@@ -13,6 +13,44 @@ fix rest of text
 
 import random
 from three_shapes_game import *
+from sim_random import SimRandom
+from infection_log import mask_pair_code
+from obstacle_map import ObstacleMap
+from neighbor_index import UniformGrid
+
+# Infected.nearby() only ever infects somebody within this many pixels
+INFECTION_RADIUS = 20
+
+# chance (in percent, out of randint(0, 100)) that an infected person
+# infects a healthy one, indexed by (infected mask_type, healthy mask_type)
+TRANSMISSION_PERCENT = {
+    ("none", "none"): 95,
+    ("none", "mask"): 70,
+    ("mask", "none"): 5,
+    ("mask", "mask"): 2,
+}
+
+# (dx, dy) that move() walks every tick, for each value of self.number
+MOVES = {
+    1: (0, -2),
+    2: (2, -2),
+    3: (2, 0),
+    4: (2, 2),
+    5: (0, 2),
+    6: (-2, 2),
+    7: (-2, 0),
+    8: (-2, -2),
+}
+
+# the value of self.number that walks each (dx, dy)
+DIRECTIONS = {}
+for d in MOVES:
+    DIRECTIONS[MOVES[d]] = d
+
+# the columns that run_headless() writes to a metrics_sink.MetricsSink
+# (contacts is count_contacts() at the start of the tick)
+METRIC_COLUMNS = ("tick", "healthy_mask", "healthy_no_mask", "infected_mask",
+                  "infected_no_mask", "new_infections", "contacts")
 
 
 def main():
@@ -57,49 +95,242 @@ def main():
 
     dummy = input("Press 'ENTER' to continue")
 
-    wid = 600
-    hei = 600
+    config = SimConfig(population + infected_pop, infected_pop,
+                       infected_mask_type, healthy_masks, obstacles=True)
+    game = build_game(config, headless=False)
 
+    # game loop. Runs forever, unless the game ends.
+    while not game.is_over():
+        game.do_nearby_calls()
+        game.do_move_calls()
+        game.do_edge_calls()
+        game.execute_removes()
+        game.draw(population + infected_pop, cur_healthy, healthy_masks,
+                  healthy_no_masks, infected_pop, answer, cur_infected, newly_infected)
+
+
+class SimConfig:
+    '''
+    This class holds the answers to the form in main(), so that a
+    simulation can be set up from code instead of through input().
+
+    Fields:
+        population: total number of people, including the infected ones
+        infected_pop: number of people already carrying COVID-19
+        infected_mask_type: "mask" or "none"; whether the infected people
+        wear masks
+        healthy_masks: how many of the healthy people wear masks
+        ticks: how many ticks run_headless() simulates
+        wid, hei: the size of the floor
+        seed: seed for the game's random number generator; the same seed
+        (and config) always gives the same run. None picks a random one.
+        nearby_engine: which Game nearby engine to use
+        frame_rate: frames per second of the window (if there is one)
+        obstacles: if True, people walk around the furniture instead of
+        through it
+    '''
+
+    def __init__(self, population=50, infected_pop=1, infected_mask_type="none",
+                 healthy_masks=0, ticks=1000, wid=600, hei=600, seed=None,
+                 nearby_engine="grid", frame_rate=40, obstacles=False):
+        assert 0 <= infected_pop <= population
+        assert infected_mask_type in ("mask", "none")
+        assert 0 <= healthy_masks <= population - infected_pop
+        self.population = population
+        self.infected_pop = infected_pop
+        self.infected_mask_type = infected_mask_type
+        self.healthy_masks = healthy_masks
+        self.ticks = ticks
+        self.wid = wid
+        self.hei = hei
+        self.seed = seed
+        self.nearby_engine = nearby_engine
+        self.frame_rate = frame_rate
+        self.obstacles = obstacles
+
+
+def new_game(config, headless=True):
+    '''
+    Function creates an empty game object, set up for the simulation
+    described by config (used by build_game(), and to load checkpoints)
+
+    config: SimConfig object
+    headless: if True, the game has no window and never sleeps
+    '''
     # This creates the Game object. The first param is the window name;
-    # the second is the framerate you want (20 frames per second, in this
-    # example); the last is the window / game space size.
-    game = Game("COVID-19 Simulator", 40, wid, hei)
+    # the second is the framerate you want (40 frames per second, by
+    # default); then the window / game space size.
+    game = Game("COVID-19 Simulator", config.frame_rate, config.wid, config.hei,
+                headless, SimRandom(config.seed))
 
     # This affects how the distance calculation in the "nearby" calls
     # works; the default is to measure center-to-center. But if anybody
     # wants to measure edge-to-edge, they can turn on this feature.
     # game.config_set("account_for_radii_in_dist", True)
 
+    # Infected.nearby() ignores anybody further away than INFECTION_RADIUS,
+    # so the "grid" engine (which only delivers pairs within the cutoff)
+    # gives the same results as the all-pairs one, without the O(n^2) cost.
+    game.config_set("nearby_engine", config.nearby_engine)
+    game.config_set("nearby_cutoff", INFECTION_RADIUS)
+
+    # Healthy.nearby() does nothing, so only infected people need to look
+    # for neighbors. (Their partners can still be anybody: an infected
+    # person only ever tries to infect the nearest person, whoever it is.)
+    game.register_interaction(Infected)
+
+    # Draw the background once and only move people around, instead of
+    # rebuilding the whole canvas every frame.
+    game.config_set("renderer", "retained")
+
+    # The furniture in the background; built once, looked up by walk().
+    if config.obstacles:
+        game.obstacles = ObstacleMap(config.wid, config.hei)
+    return game
+
+
+def build_game(config, headless=True):
+    '''
+    Function creates a game object, spawns all of the people described
+    by config into it and resets the stats counters
+
+    config: SimConfig object
+    headless: if True, the game has no window and never sleeps
+    '''
+    global cur_healthy, cur_infected, newly_infected
+
+    game = new_game(config, headless)
+
+    healthy_masks = config.healthy_masks
+    healthy_no_masks = config.population - config.infected_pop - healthy_masks
+
     i = 0
     while i < healthy_masks:  # fix spawn ammount
-        spawn_healthy(game, wid, hei, "mask")
+        spawn_healthy(game, config.wid, config.hei, "mask")
         i += 1
 
     l = 0
     while l < healthy_no_masks:
-        spawn_healthy(game, wid, hei, "none")
+        spawn_healthy(game, config.wid, config.hei, "none")
         l += 1
 
     j = 0
-    while j < infected_pop:
-        spawn_infected(game, wid, hei, infected_mask_type)
+    while j < config.infected_pop:
+        spawn_infected(game, config.wid, config.hei, config.infected_mask_type)
         j += 1
 
     cur_healthy = healthy_no_masks + healthy_masks
-    cur_infected = infected_pop
+    cur_infected = config.infected_pop
     newly_infected = 0
-    #global population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks, infected_pop, cur_infected, newly_infected, answer
-    # population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks, og_infected_pop, cur_infected, newly_infected, infected_mask_type):
 
-    # game loop. Runs forever, unless the game ends.
-    count = 0
-    while not game.is_over():
+    return game
+
+
+def run_headless(config, sink=None, log=None):
+    '''
+    Function runs a whole simulation without a window, as fast as
+    possible, and returns a list with the number of infected people
+    after each tick
+
+    config: SimConfig object
+    sink: optional metrics_sink.MetricsSink with METRIC_COLUMNS; gets
+    one row per tick
+    log: optional infection_log.InfectionLog; gets every transmission
+    '''
+    game = build_game(config, headless=True)
+    game.event_log = log
+    return run_ticks(game, config.ticks, sink)
+
+
+def run_ticks(game, ticks, sink=None, after_tick=None):
+    '''
+    Function runs ticks ticks of an existing game, without drawing, and
+    returns a list with the number of infected people after each tick
+
+    game: game object (from build_game(), or a loaded checkpoint)
+    ticks: how many ticks to run
+    sink: optional metrics_sink.MetricsSink with METRIC_COLUMNS
+    after_tick: optional function, called with the game after every tick
+    '''
+    counts = []
+    for k in range(ticks):
+        tick = game.get_tick()
+        before = newly_infected
+        if sink is not None:
+            contacts = count_contacts(game)
         game.do_nearby_calls()
         game.do_move_calls()
         game.do_edge_calls()
         game.execute_removes()
-        game.draw(population + infected_pop, cur_healthy, healthy_masks,
-                  healthy_no_masks, infected_pop, answer, cur_infected, newly_infected)
+        counts.append(cur_infected)
+
+        if sink is not None:
+            sink.record(tick, *tally(game), newly_infected - before, contacts)
+        if after_tick is not None:
+            after_tick(game)
+    return counts
+
+
+def get_counters():
+    '''
+    Function returns the stats counters as
+    (cur_healthy, cur_infected, newly_infected)
+    '''
+    return (cur_healthy, cur_infected, newly_infected)
+
+
+def set_counters(healthy, infected, newly):
+    '''
+    Function sets the stats counters (used when loading a checkpoint)
+    '''
+    global cur_healthy, cur_infected, newly_infected
+    cur_healthy = healthy
+    cur_infected = infected
+    newly_infected = newly
+
+
+def tally(game):
+    '''
+    Function counts the people in the game by health and mask status and
+    returns (healthy_mask, healthy_no_mask, infected_mask, infected_no_mask);
+    healthy people who got tagged count as infected
+
+    game: game object
+    '''
+    counts = [0, 0, 0, 0]
+    for o in game.get_objs():
+        infected = isinstance(o, Infected) or o.tagged
+        counts[2*infected + (not o.mask)] += 1
+    return tuple(counts)
+
+
+def count_contacts(game):
+    '''
+    Function counts the pairs of people that are within INFECTION_RADIUS
+    of each other (center to center) where at least one of the two is
+    contagious - whatever nearby engine the game uses
+
+    game: game object
+    '''
+    objs = list(game.get_objs())
+    grid = UniformGrid(INFECTION_RADIUS)
+    for i in range(len(objs)):
+        grid.insert(i, objs[i].x, objs[i].y)
+
+    limit = INFECTION_RADIUS ** 2
+    contacts = 0
+    for i in range(len(objs)):
+        o = objs[i]
+        if not isinstance(o, Infected):
+            continue
+        for j, x, y in grid.candidates(o.x, o.y):
+            # (a pair of two contagious people is counted from its lower
+            # index only)
+            if j == i or (j < i and isinstance(objs[j], Infected)):
+                continue
+            if (o.x - x)**2 + (o.y - y)**2 <= limit:
+                contacts += 1
+    return contacts
 
 
 def spawn_healthy(game, wid, hei, mask_type):
@@ -111,7 +342,7 @@ def spawn_healthy(game, wid, hei, mask_type):
     wid: int representing the width of the canvas
     hei: int representing the height of the canvas
     '''
-    healthy = Healthy(wid, hei, mask_type)
+    healthy = Healthy(wid, hei, mask_type, game.rng, game.new_id())
     game.add_obj(healthy)
 
 
@@ -124,17 +355,41 @@ def spawn_infected(game, wid, hei, mask_type):
     wid: int representing the width of the canvas
     hei: int representing the height of the canvas
     '''
-    infected = Infected(wid, hei, mask_type)
+    infected = Infected(wid, hei, mask_type, game.rng, game.new_id())
     game.add_obj(infected)
 
 
+def walk(person, game):
+    '''
+    Function moves a person one step in its direction (self.number). If
+    the game has an obstacle_map.ObstacleMap and the step would walk into
+    the furniture, the person stays put this tick and turns around instead
+
+    person: Healthy or Infected object
+    game: game object
+    '''
+    dx, dy = MOVES[person.number]
+    obstacles = game.obstacles
+    # (bounce() does all of the work; checking the free case here first
+    # just keeps the common case cheap)
+    if obstacles is not None and obstacles.blocked(person.x + dx, person.y + dy):
+        step = obstacles.bounce(person.x, person.y, dx, dy)
+        if step is not None:
+            person.number = DIRECTIONS[step]
+            return
+    person.x += dx
+    person.y += dy
+
+
 class Healthy:
     '''
     This class represents healthy people.
 
     The constructor builds a crewmate; the healthy person is represented
     by a circle and the color white with the size of 20. The person
-    also spawns in random areas of the canvas.
+    also spawns in random areas of the canvas. Every random choice the
+    person makes comes from rng (usually the game's rng); ident is the
+    person's id (from game.new_id()).
 
     Methods:
         get_xy: gettors for the coordinates of the object
@@ -146,11 +401,16 @@ class Healthy:
         draw: draws the object onto the canvas
     '''
 
-    def __init__(self, wid, hei, mask_type):
-        self.x = random.randint(0, wid)
-        self.y = random.randint(0, hei)
+    def __init__(self, wid, hei, mask_type, rng=random, ident=None):
+        self.id = ident
+        self.rng = rng
+        self.x = self.rng.randint(0, wid)
+        self.y = self.rng.randint(0, hei)
+        # where the right and bottom walls are
+        self.wid = wid
+        self.hei = hei
         self.diameter = 20
-        self.number = random.randint(1, 8)
+        self.number = self.rng.randint(1, 8)
         self.mask = None
         self.mask_type = mask_type
         self.color = "white"
@@ -171,59 +431,42 @@ class Healthy:
         pass
 
     def move(self, game):
-        if self.number == 1:
-            self.y -= 2
-        elif self.number == 2:
-            self.x += 2
-            self.y -= 2
-        elif self.number == 3:
-            self.x += 2
-        elif self.number == 4:
-            self.x += 2
-            self.y += 2
-        elif self.number == 5:
-            self.y += 2
-        elif self.number == 6:
-            self.x -= 2
-            self.y += 2
-        elif self.number == 7:
-            self.x -= 2
-        elif self.number == 8:
-            self.x -= 2
-            self.y -= 2
+        walk(self, game)
 
     def edge(self, dirr, position):
         if dirr == 'top':
             if position == 0:
-                self.number = random.randint(3, 7)
+                self.number = self.rng.randint(3, 7)
         elif dirr == 'left':
             if position == 0:
-                self.number = random.randint(1, 5)
+                self.number = self.rng.randint(1, 5)
         elif dirr == 'bottom':
-            if position == 600:
-                self.number = random.choice([1, 2, 3, 7, 8])
+            if position == self.hei:
+                self.number = self.rng.choice([1, 2, 3, 7, 8])
         elif dirr == 'right':
-            if position == 600:
-                self.number = random.choice([1, 5, 6, 7, 8])
+            if position == self.wid:
+                self.number = self.rng.choice([1, 5, 6, 7, 8])
 
     def draw(self, win):
         if self.mask == True:
-            win.ellipse(self.x, self.y, self.diameter,
-                        self.diameter, self.color)
+            body = win.ellipse(self.x, self.y, self.diameter,
+                                self.diameter, self.color)
             win.rectangle(self.x - 8, self.y, 16, 8, self.mask_color)
             win.ellipse(self.x - 5, self.y - 5, 3,
                         3, "black")
             win.ellipse(self.x + 5, self.y - 5, 3,
                         3, "black")
         else:
-            win.ellipse(self.x, self.y, self.diameter,
-                        self.diameter, self.color)
+            body = win.ellipse(self.x, self.y, self.diameter,
+                                self.diameter, self.color)
             win.ellipse(self.x - 5, self.y - 5, 3,
                         3, "black")
             win.ellipse(self.x + 5, self.y - 5, 3,
                         3, "black")
             win.ellipse(self.x, self.y + 4, 8,
                         2, "black")
+        # the item that gets recolored if self.color changes
+        return body
 
 
 class Infected:
@@ -233,7 +476,9 @@ class Infected:
 
     The constructor builds an infected person; the person is represented
     by a circle and the color red with the size of 20. The person
-    also spawns in random areas of the canvas.
+    also spawns in random areas of the canvas. Every random choice the
+    person makes comes from rng (usually the game's rng); ident is the
+    person's id (from game.new_id()).
 
     Methods:
         get_xy: gettors for the coordinates of the object
@@ -245,11 +490,16 @@ class Infected:
         draw: draws the object onto the canvas
     '''
 
-    def __init__(self, wid, hei, mask_type):
-        self.x = random.randint(0, wid)
-        self.y = random.randint(0, hei)
+    def __init__(self, wid, hei, mask_type, rng=random, ident=None):
+        self.id = ident
+        self.rng = rng
+        self.x = self.rng.randint(0, wid)
+        self.y = self.rng.randint(0, hei)
+        # where the right and bottom walls are
+        self.wid = wid
+        self.hei = hei
         self.diameter = 20
-        self.number = random.randint(1, 8)
+        self.number = self.rng.randint(1, 8)
         self.mask_type = mask_type
         self.mask = None
         self.color = "#FC3547"
@@ -267,36 +517,16 @@ class Infected:
 
     def nearby(self, other, dist, game):
         new_infection = False
-        if dist <= 20:
+        if dist <= INFECTION_RADIUS:
             if isinstance(other, Healthy) and other.tagged == False:
-                if self.mask_type == "none" and other.mask_type == "none":
-                    if random.randint(0, 100) < 95:
-                        other.color = "#FD878E"
-                        other.tagged = True
-                        new_infection = True
-                    else:
-                        pass
-                elif self.mask_type == "none" and other.mask_type == "mask":
-                    if random.randint(0, 100) < 70:
-                        other.color = "#FD878E"
-                        other.tagged = True
-                        new_infection = True
-                    else:
-                        pass
-                elif self.mask_type == "mask" and other.mask_type == "none":
-                    if random.randint(0, 100) < 5:
-                        other.color = "#FD878E"
-                        other.tagged = True
-                        new_infection = True
-                    else:
-                        pass
-                elif self.mask_type == "mask" and other.mask_type == "mask":
-                    if random.randint(0, 100) < 2:
-                        other.color = "#FD878E"
-                        other.tagged = True
-                        new_infection = True
-                    else:
-                        pass
+                percent = TRANSMISSION_PERCENT[(self.mask_type, other.mask_type)]
+                if self.rng.randint(0, 100) < percent:
+                    other.color = "#FD878E"
+                    other.tagged = True
+                    new_infection = True
+                    if game.event_log is not None:
+                        game.event_log.record(game.get_tick(), self.id, other.id,
+                                              mask_pair_code(self.mask_type, other.mask_type), dist)
         if new_infection:
             global cur_healthy, cur_infected, newly_infected
             cur_healthy -= 1
@@ -304,45 +534,26 @@ class Infected:
             newly_infected += 1
 
     def move(self, game):
-        if self.number == 1:
-            self.y -= 2
-        elif self.number == 2:
-            self.x += 2
-            self.y -= 2
-        elif self.number == 3:
-            self.x += 2
-        elif self.number == 4:
-            self.x += 2
-            self.y += 2
-        elif self.number == 5:
-            self.y += 2
-        elif self.number == 6:
-            self.x -= 2
-            self.y += 2
-        elif self.number == 7:
-            self.x -= 2
-        elif self.number == 8:
-            self.x -= 2
-            self.y -= 2
+        walk(self, game)
 
     def edge(self, dirr, position):
         if dirr == 'top':
             if position == 0:
-                self.number = random.randint(3, 7)
+                self.number = self.rng.randint(3, 7)
         elif dirr == 'left':
             if position == 0:
-                self.number = random.randint(1, 5)
+                self.number = self.rng.randint(1, 5)
         elif dirr == 'bottom':
-            if position == 600:
-                self.number = random.choice([1, 2, 3, 7, 8])
+            if position == self.hei:
+                self.number = self.rng.choice([1, 2, 3, 7, 8])
         elif dirr == 'right':
-            if position == 600:
-                self.number = random.choice([1, 5, 6, 7, 8])
+            if position == self.wid:
+                self.number = self.rng.choice([1, 5, 6, 7, 8])
 
     def draw(self, win):
         if self.mask == True:
-            win.ellipse(self.x, self.y, self.diameter,
-                        self.diameter, self.color)
+            body = win.ellipse(self.x, self.y, self.diameter,
+                                self.diameter, self.color)
 
             win.ellipse(self.x - 5, self.y - 5, 3,
                         3, "black")
@@ -352,14 +563,16 @@ class Infected:
             win.rectangle(self.x - 8, self.y, 16, 8, self.mask_color)
             # mask
         else:
-            win.ellipse(self.x, self.y, self.diameter,
-                        self.diameter, self.color)
+            body = win.ellipse(self.x, self.y, self.diameter,
+                                self.diameter, self.color)
             win.ellipse(self.x - 5, self.y - 5, 3,
                         3, "black")
             win.ellipse(self.x + 5, self.y - 5, 3,
                         3, "black")
             win.ellipse(self.x, self.y + 4, 8,
                         2, "black")
+        # the item that gets recolored if self.color changes
+        return body
 
 
 if __name__ == "__main__":
@@ -0,0 +1,314 @@
+"""File: event_engine.py
+
+   Author: Brian Vu
+
+   Purpose: An event-driven engine for covidSim games.  People walk in
+            straight lines (MOVES) and only change direction in edge(), so
+            we can work out exactly when the next interesting thing will
+            happen - a person touching a wall, or a susceptible person
+            coming within INFECTION_RADIUS of an infected one - and jump
+            straight there, instead of stepping through every tick in
+            between.
+
+            The ticks where something does happen are run with the normal
+            Game machinery (do_nearby_calls(), edge()), in the same order
+            as the tick loop in run_headless(), so the game's rng is used
+            in exactly the same way and a seed gives exactly the same run.
+            In a sparse room, where most ticks have no contacts, that is
+            a lot of skipped ticks.
+"""
+
+
+import heapq
+import math
+
+import covidSim
+from covidSim import Healthy, Infected, MOVES
+
+
+WALL = 0
+CONTACT = 1
+
+
+def _first_below(start, speed, bound, tau0):
+    """Smallest integer tau >= tau0 with start + speed*tau < bound, or None."""
+    if speed < 0:
+        # (start - bound) / -speed < tau
+        return max(tau0, (start - bound) // -speed + 1)
+    if start + speed*tau0 < bound:
+        return tau0
+    return None
+
+
+def _first_at_least(start, speed, bound, tau0):
+    """Smallest integer tau >= tau0 with start + speed*tau >= bound, or None."""
+    if speed > 0:
+        return max(tau0, -((start - bound) // speed))
+    if start + speed*tau0 >= bound:
+        return tau0
+    return None
+
+
+def first_contact(dx, dy, vx, vy, radius):
+    """Smallest integer tau >= 0 such that the point (dx, dy) + tau*(vx, vy)
+       is within radius of the origin, or None if it never is.  Everything
+       is an integer, so the final check is exact.
+    """
+    r2 = radius*radius
+    a = vx*vx + vy*vy
+    b = 2*(dx*vx + dy*vy)
+    c = dx*dx + dy*dy - r2
+    if a == 0:
+        if c <= 0:
+            return 0
+        return None
+
+    disc = b*b - 4*a*c
+    if disc < 0:
+        return None
+    root = math.sqrt(disc)
+    last = (-b + root) / (2*a)
+    if last < 0:
+        return None
+    tau = max(0, math.ceil((-b - root) / (2*a)) - 1)
+
+    # the float roots are only approximately right; step to the exact one
+    while tau <= last + 1:
+        if a*tau*tau + b*tau + c <= 0:
+            return tau
+        tau += 1
+    return None
+
+
+class EventEngine:
+    """Runs a covidSim game by jumping from event to event.
+
+       The game must be set up like covidSim.build_game() does it: center-
+       to-center distances, no obstacles, and nobody added or removed while
+       the engine runs.  Between events the Healthy / Infected objects aren't moved;
+       call sync() to bring their x, y up to date (run() does that at the
+       end).
+
+       Methods:
+         run: simulates a number of ticks
+         sync: writes the current positions back into the objects
+    """
+
+    def __init__(self, game, radius):
+        """Constructor.
+
+           Parameters: the game, and the contact radius (INFECTION_RADIUS)
+        """
+        # people walk in straight lines only in an empty room
+        assert game.obstacles is None
+
+        # the first tick of a new game just adds the spawned people
+        if game.has_pending_changes():
+            game.do_nearby_calls()
+            game.do_move_calls()
+            game.do_edge_calls()
+            game.execute_removes()
+
+        self._game = game
+        self._radius = radius
+        self._wid, self._hei = game.get_size()
+
+        self._objs = list(game.get_objs())
+        n = len(self._objs)
+
+        # the path of person k is: at tick _anchor[k] it is at (_x0, _y0),
+        # and every tick after that it moves by (_vx, _vy)
+        t = game.get_tick()
+        self._anchor = [t] * n
+        self._x0 = [o.x for o in self._objs]
+        self._y0 = [o.y for o in self._objs]
+        self._vx = [0] * n
+        self._vy = [0] * n
+        self._version = [0] * n
+        self._rad = [o.get_radius() for o in self._objs]
+
+        self._sources = []
+        self._is_source = [False] * n
+        self._susceptible = []
+        for k in range(n):
+            o = self._objs[k]
+            self._vx[k], self._vy[k] = MOVES[o.number]
+            if isinstance(o, Infected):
+                self._sources.append(k)
+                self._is_source[k] = True
+            elif isinstance(o, Healthy) and not o.tagged:
+                self._susceptible.append(k)
+
+        # (tick, kind, k, other, version of k, version of other)
+        self._events = []
+        for k in range(n):
+            self._schedule_wall(k, t)
+        for i in self._sources:
+            for j in self._susceptible:
+                self._schedule_contact(i, j, t)
+
+    def _pos(self, k, tick):
+        steps = tick - self._anchor[k]
+        return (self._x0[k] + self._vx[k]*steps, self._y0[k] + self._vy[k]*steps)
+
+    def _schedule_wall(self, k, tick):
+        """Schedules the first tick >= tick at whose end (that is, after the
+           move) person k touches a wall.
+        """
+        x0, y0 = self._pos(k, tick + 1)
+        vx, vy = self._vx[k], self._vy[k]
+        rad = self._rad[k]
+
+        taus = (_first_below(x0, vx, rad, 0),
+                _first_below(y0, vy, rad, 0),
+                _first_at_least(x0, vx, self._wid - rad, 0),
+                _first_at_least(y0, vy, self._hei - rad, 0))
+        taus = [tau for tau in taus if tau is not None]
+        if len(taus) > 0:
+            heapq.heappush(self._events,
+                           (tick + min(taus), WALL, k, -1, self._version[k], 0))
+
+    def _schedule_contact(self, i, j, tick):
+        """Schedules the first tick >= tick at whose start person j is within
+           the radius of person i.
+        """
+        xi, yi = self._pos(i, tick)
+        xj, yj = self._pos(j, tick)
+        tau = first_contact(xj - xi, yj - yi, self._vx[j] - self._vx[i],
+                            self._vy[j] - self._vy[i], self._radius)
+        if tau is not None:
+            heapq.heappush(self._events, (tick + tau, CONTACT, i, j,
+                                          self._version[i], self._version[j]))
+
+    def _is_live(self, event):
+        tick, kind, k, other, ver_k, ver_other = event
+        if self._version[k] != ver_k:
+            return False
+        if kind == CONTACT:
+            if self._version[other] != ver_other:
+                return False
+            if self._objs[other].tagged:
+                return False
+        return True
+
+    def sync(self):
+        """Writes everybody's current position into the objects."""
+        t = self._game.get_tick()
+        for k in range(len(self._objs)):
+            self._objs[k].x, self._objs[k].y = self._pos(k, t)
+
+    def _edge(self, k, tick):
+        """The do_edge_calls() logic for person k, at the end of a tick."""
+        o = self._objs[k]
+        x, y = self._pos(k, tick + 1)
+        o.x, o.y = x, y
+        rad = self._rad[k]
+
+        if x < rad:
+            o.edge("left", 0)
+        if y < rad:
+            o.edge("top", 0)
+
+        if x+rad >= self._wid:
+            o.edge("right", self._wid)
+        if y+rad >= self._hei:
+            o.edge("bottom", self._hei)
+
+        # from the next tick on, it walks in the (maybe) new direction
+        self._anchor[k] = tick + 1
+        self._x0[k], self._y0[k] = x, y
+        self._vx[k], self._vy[k] = MOVES[o.number]
+        self._version[k] += 1
+
+    def run(self, ticks, on_tick=None):
+        """Simulates ticks ticks.  on_tick(tick), if given, is called at the
+           end of every tick - including the skipped ones, so avoid it if
+           you want the full speedup.
+
+           Returns the number of ticks that actually had to be run.
+        """
+        game = self._game
+        end = game.get_tick() + ticks
+        busy = 0
+
+        while True:
+            while len(self._events) > 0 and not self._is_live(self._events[0]):
+                heapq.heappop(self._events)
+
+            t = game.get_tick()
+            if len(self._events) > 0:
+                next_tick = min(self._events[0][0], end)
+            else:
+                next_tick = end
+
+            # nothing happens on these ticks; just walk past them
+            while t < next_tick:
+                game.skip_ticks(1)
+                if on_tick is not None:
+                    on_tick(t)
+                t += 1
+            if t == end:
+                break
+
+            # everything that happens on tick t
+            walls = []
+            contacts = []
+            while len(self._events) > 0 and self._events[0][0] == t:
+                event = heapq.heappop(self._events)
+                if not self._is_live(event):
+                    continue
+                if event[1] == WALL:
+                    walls.append(event[2])
+                else:
+                    contacts.append((event[2], event[3]))
+            busy += 1
+
+            if len(contacts) > 0:
+                self.sync()
+                game.do_nearby_calls()
+
+            # the objects are in the game's iteration order, so sorting by
+            # index calls edge() (and the rng) in the same order as the
+            # tick loop does
+            walls.sort()
+            for k in walls:
+                self._edge(k, t)
+                self._schedule_wall(k, t + 1)
+                if self._is_source[k]:
+                    for j in self._susceptible:
+                        if not self._objs[j].tagged:
+                            self._schedule_contact(k, j, t + 1)
+                elif not self._objs[k].tagged:
+                    for i in self._sources:
+                        self._schedule_contact(i, k, t + 1)
+
+            # pairs that were in contact may still be next tick
+            for i, j in contacts:
+                if not self._objs[j].tagged:
+                    self._schedule_contact(i, j, t + 1)
+
+            game.execute_removes()
+            if on_tick is not None:
+                on_tick(t)
+
+        self.sync()
+        return busy
+
+
+def run_events(config):
+    """The event-driven version of covidSim.run_headless(): same config,
+       same result (for the same seed), often much faster.
+    """
+    game = covidSim.build_game(config, headless=True)
+    counts = []
+    if config.ticks == 0:
+        return counts
+
+    # the constructor runs the first tick
+    engine = EventEngine(game, covidSim.INFECTION_RADIUS)
+    counts.append(covidSim.cur_infected)
+
+    def on_tick(tick):
+        counts.append(covidSim.cur_infected)
+    engine.run(config.ticks - 1, on_tick)
+    return counts
@@ -10,6 +10,9 @@ import time
 import sys
 
 
+# frame_is_late() lets at most this many frames in a row go undrawn
+MAX_SKIPPED_FRAMES = 5
+
 
 class graphics:
     def __init__(self, w, h, title):
@@ -28,6 +31,17 @@ class graphics:
         self.mouse_y = 0
         self.__handle_motion()
 
+        # tag(s) given to every item created from now on; see set_tag()
+        self._tag = None
+
+        # the frame scheduler; see frame_space() and frame_is_late()
+        self._deadline = None
+        self._fps_start = None
+        self._frames_shown = 0
+        self._skipped_in_row = 0
+        self._achieved_fps = 0.0
+        self.skipped_frames = 0
+
         self.setup_kill_events()
 
     def setup_kill_events(self):
@@ -67,6 +81,9 @@ class graphics:
             return True
 
 
+    def set_title(self, title):
+        self.primary.title(title)
+
     def mainloop(self):
         self.primary.mainloop()
 
@@ -94,8 +111,7 @@ class graphics:
         Must always specify the text, x, y position.
         Can optionally specify the fill color and size.
         '''
-        text = self.canvas.create_text(x, y, text=content, fill=fill, font=('Arial', size), anchor='nw')
-        self.canvas.move(text, 0, 0)
+        return self.canvas.create_text(x, y, text=content, fill=fill, font=('Arial', size), anchor='nw', tags=self._tag)
 
     def set_left_click_action(self, callee):
         ''' Call the callee function whenever the left click happens.
@@ -137,41 +153,87 @@ class graphics:
         ''' Draw a triangle.
         The three corners of the triangle are specified with the parameter coordinates.
         '''
-        r = self.canvas.create_polygon(x1, y1, x2, y2, x3, y3, fill=fill)
-        self.canvas.move(r, 0, 0)
+        return self.canvas.create_polygon(x1, y1, x2, y2, x3, y3, fill=fill, tags=self._tag)
 
     def line(self, x1, y1, x2, y2, fill='black', width=3):
         ''' Draw a line.
         The two ends of the line are specified with the parameter coordinates.
         '''
-        r = self.canvas.create_line(x1, y1, x2, y2, fill=fill, width=width)
-        self.canvas.move(r, 0, 0)
+        return self.canvas.create_line(x1, y1, x2, y2, fill=fill, width=width, tags=self._tag)
 
     def ellipse(self, x, y, w, h, fill='black'):
         ''' Draw an ellipse on the canvas.
         Specify x, y (center of ellipse) and width / height.
         '''
-        r = self.canvas.create_oval(x-(w/2), y-(h/2), x+(w/2), y+(h/2), fill=fill)
-        self.canvas.move(r, 0, 0)
+        return self.canvas.create_oval(x-(w/2), y-(h/2), x+(w/2), y+(h/2), fill=fill, tags=self._tag)
 
     def rectangle(self, x, y, w, h, fill='black'):
         ''' Draw a rectangle on the canvas.
         Specify x, y (top-left corner) and width / height.
         '''
-        r = self.canvas.create_rectangle(x, y, x+w, h+y, fill=fill, outline='')
-        self.canvas.move(r, 0, 0)
+        return self.canvas.create_rectangle(x, y, x+w, h+y, fill=fill, outline='', tags=self._tag)
 
     def update(self):
         ''' Does an idle task update and regular update.
         '''
+        self._skipped_in_row = 0
+        self._frames_shown += 1
         self.primary.update_idletasks()
         self.primary.update()
 
     def frame_space(self, frame_rate):
-        ''' Sleeps for a time that corresponds to the provided frame rate.
+        ''' Sleeps until the deadline of the current frame, so that frames
+        come out frame_rate times a second no matter how long the work in
+        between took.  The deadlines are kept with time.monotonic(); if the
+        program falls more than a whole frame behind, the schedule starts
+        over from now instead of trying to catch up.
+        '''
+        period = 1.0 / float(frame_rate)
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + period
+            self._fps_start = now
+
+        remaining = self._deadline - now
+        if remaining > 0:
+            time.sleep(remaining)
+            self._deadline += period
+        elif remaining > -period:
+            self._deadline += period
+        else:
+            self._deadline = now + period
+
+        # achieved frame rate, measured over (roughly) every second
+        now = time.monotonic()
+        if now - self._fps_start >= 1.0:
+            self._achieved_fps = self._frames_shown / (now - self._fps_start)
+            self._fps_start = now
+            self._frames_shown = 0
+
+    def frame_is_late(self):
+        ''' Returns True if the deadline of the current frame has already
+        passed - the caller should skip drawing it, and just call
+        skip_frame() and frame_space().  Never returns True for more than
+        MAX_SKIPPED_FRAMES frames in a row, so that something still gets
+        drawn when every frame is late.
+        '''
+        if self._deadline is None or self._skipped_in_row >= MAX_SKIPPED_FRAMES:
+            return False
+        return time.monotonic() > self._deadline
+
+    def skip_frame(self):
+        ''' Processes window events without redrawing anything; the
+        replacement for update() on a late frame.
+        '''
+        self._skipped_in_row += 1
+        self.skipped_frames += 1
+        self.primary.update()
+
+    def get_fps(self):
+        ''' Returns the number of frames actually drawn per second, over
+        the last second or so (0 until the first second has passed).
         '''
-        sleep_ms = 1.0 / float(frame_rate)
-        time.sleep(sleep_ms)
+        return self._achieved_fps
 
     def update_frame(self, frame_rate):
         ''' Updates and sleeps.
@@ -185,3 +247,34 @@ class graphics:
         '''
         self.canvas.delete('all')
 
+    # The drawing functions above all return the id of the canvas item they
+    # create.  The functions below change existing items, for programs which
+    # keep their items around between frames instead of calling clear().
+
+    def set_tag(self, tag):
+        ''' Every item drawn after this call gets this tag (or tuple of
+        tags), until set_tag(None) is called.  Tags can be passed to
+        move_item(), set_fill(), delete() and raise_item() in place of an id.
+        '''
+        self._tag = tag
+
+    def move_item(self, item, dx, dy):
+        ''' Moves an item (or every item with a tag) by dx, dy.
+        '''
+        self.canvas.move(item, dx, dy)
+
+    def set_fill(self, item, fill):
+        ''' Changes the fill color of an item (or every item with a tag).
+        '''
+        self.canvas.itemconfigure(item, fill=fill)
+
+    def raise_item(self, item):
+        ''' Moves an item (or every item with a tag) on top of all others.
+        '''
+        self.canvas.tag_raise(item)
+
+    def delete(self, item):
+        ''' Deletes an item (or every item with a tag).
+        '''
+        self.canvas.delete(item)
+
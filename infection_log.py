@@ -0,0 +1,162 @@
+"""File: infection_log.py
+
+   Author: Brian Vu
+
+   Purpose: A log of every transmission in a run: who infected whom, on
+            which tick, with which masks, from how far away.  The events
+            are kept in preallocated typed arrays (a few dozen bytes per
+            event instead of a Python object each), and indexed by tick and
+            by agent as they are recorded, so contact-tracing questions
+            ("who did agent 17 infect?") can be answered after a big run
+            without rescanning the log or re-running the simulation.
+"""
+
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+# the mask_pair column holds an index into this tuple:
+# (infected person's mask_type, healthy person's mask_type)
+MASK_PAIRS = (("none", "none"), ("none", "mask"),
+              ("mask", "none"), ("mask", "mask"))
+
+
+def mask_pair_code(source_mask_type, target_mask_type):
+    return 2 * (source_mask_type == "mask") + (target_mask_type == "mask")
+
+
+class InfectionLog:
+    """Every transmission in a run, stored as columns.
+
+       Columns (read them with column()):
+         tick      - the tick the transmission happened on
+         source    - id of the infected person
+         target    - id of the person who caught it
+         mask_pair - index into MASK_PAIRS
+         distance  - how far apart they were
+
+       Ticks must be recorded in non-decreasing order (which is how the
+       game produces them); that's what makes the tick index a binary
+       search.
+
+       Methods:
+         record: adds one event
+         record_many: adds a batch of events from the same tick
+         events_at: the events of a tick (or range of ticks)
+         caused_by: the events where an agent was the source
+         infected_by: the event where an agent caught it
+         descendants: everybody infected by an agent, directly or not
+    """
+
+    def __init__(self, capacity=1024):
+        """Constructor.  Preallocates room for capacity events; the arrays
+           double in size whenever they fill up.
+        """
+        self._capacity = max(1, capacity)
+        self._cols = {
+            "tick": array("q", [0]) * self._capacity,
+            "source": array("q", [0]) * self._capacity,
+            "target": array("q", [0]) * self._capacity,
+            "mask_pair": array("b", [0]) * self._capacity,
+            "distance": array("d", [0.0]) * self._capacity,
+        }
+        self._len = 0
+
+        # agent id -> array of event numbers, and agent id -> event number
+        self._by_source = {}
+        self._by_target = {}
+
+    def __len__(self):
+        return self._len
+
+    def _grow(self):
+        for name in self._cols:
+            col = self._cols[name]
+            col.extend(col)    # doubles it; the new half is garbage
+        self._capacity *= 2
+
+    def record(self, tick, source, target, mask_pair, distance):
+        """Adds one transmission event.
+
+           Parameters: tick, source id, target id, mask pair code (see
+           mask_pair_code()), distance
+        """
+        k = self._len
+        assert k == 0 or tick >= self._cols["tick"][k-1]
+        if k == self._capacity:
+            self._grow()
+
+        self._cols["tick"][k] = tick
+        self._cols["source"][k] = source
+        self._cols["target"][k] = target
+        self._cols["mask_pair"][k] = mask_pair
+        self._cols["distance"][k] = distance
+        self._len += 1
+
+        events = self._by_source.get(source)
+        if events is None:
+            events = array("q")
+            self._by_source[source] = events
+        events.append(k)
+        self._by_target[target] = k
+
+    def record_many(self, tick, sources, targets, mask_pairs, distances):
+        """Adds one event per element of the (equal length) sequences, all
+           on the same tick.
+        """
+        for k in range(len(sources)):
+            self.record(tick, int(sources[k]), int(targets[k]),
+                        int(mask_pairs[k]), float(distances[k]))
+
+    def column(self, name):
+        """Returns one column of the log (a copy, trimmed to its length)."""
+        return self._cols[name][:self._len]
+
+    def event(self, k):
+        """Returns event k as a dict."""
+        assert 0 <= k < self._len
+        result = {}
+        for name in self._cols:
+            result[name] = self._cols[name][k]
+        return result
+
+    def events_at(self, first_tick, last_tick=None):
+        """Returns the event numbers of every event from first_tick through
+           last_tick (default: just first_tick), as a range.
+        """
+        if last_tick is None:
+            last_tick = first_tick
+        ticks = self._cols["tick"]
+        lo = bisect_left(ticks, first_tick, 0, self._len)
+        hi = bisect_right(ticks, last_tick, lo, self._len)
+        return range(lo, hi)
+
+    def caused_by(self, source):
+        """Returns the event numbers where the given agent infected
+           somebody, in the order they happened.
+        """
+        return list(self._by_source.get(source, ()))
+
+    def infected_by(self, target):
+        """Returns the event number where the given agent caught it, or
+           None if it never did (or was infected from the start).
+        """
+        return self._by_target.get(target)
+
+    def descendants(self, source):
+        """Returns the ids of everybody infected because of the given agent,
+           directly or through a chain of other people, in breadth-first
+           order.
+        """
+        targets = self._cols["target"]
+        result = []
+        frontier = [source]
+        while len(frontier) > 0:
+            nxt = []
+            for agent in frontier:
+                for k in self._by_source.get(agent, ()):
+                    result.append(targets[k])
+                    nxt.append(targets[k])
+            frontier = nxt
+        return result
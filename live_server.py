@@ -0,0 +1,503 @@
+"""File: live_server.py
+
+   Author: Brian Vu
+
+   Purpose: Lets a headless run be watched from a web browser.  A small
+            HTTP server (standard library only) runs on a background
+            thread and serves:
+
+              /        a page that draws the people on a <canvas>
+              /ws      a WebSocket that streams every published tick
+              /stats   the display_stats() numbers of the latest tick, as
+                       JSON
+
+              python live_server.py --population 500 --port 8765
+              (then open http://localhost:8765/)
+
+            The ticks are sent as trajectory.py frames (binary WebSocket
+            messages): a delta from the previous tick when a viewer is
+            keeping up, or a keyframe when it isn't.  The simulation only
+            ever encodes the delta, once per published tick, and never waits
+            for a viewer; the keyframe of a tick is encoded (at most once)
+            by the first viewer that needs it.  Every viewer has its own
+            thread that sends whatever the latest tick is when it is ready
+            for more, so a slow viewer just skips ticks, and the cost to the
+            simulation doesn't grow with the number of viewers.
+"""
+
+
+import argparse
+import base64
+import hashlib
+import json
+import select
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import covidSim
+from shm_viewer import STATS_FIELDS, STATE_COLORS, config_stats
+from trajectory import encode_delta, encode_keyframe, snapshot_game
+
+
+# from RFC 6455; the server proves it speaks WebSocket by hashing the
+# client's key with this
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# WebSocket opcodes
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# bytes the kernel may buffer for each viewer
+SEND_BUFFER = 64 * 1024
+
+
+def websocket_accept(key):
+    """The Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
+    digest = hashlib.sha1(key.strip().encode("ascii") + WEBSOCKET_GUID).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def websocket_frame(payload, opcode=OP_BINARY):
+    """Wraps payload in a single (final, unmasked) WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _read_exact(sock_file, count):
+    # an unbuffered socket file can hand back fewer bytes than asked for
+    data = b""
+    while len(data) < count:
+        chunk = sock_file.read(count - len(data))
+        if not chunk:
+            raise ConnectionError("websocket closed")
+        data += chunk
+    return data
+
+
+def read_websocket_frame(sock_file):
+    """Reads one frame sent by a client (clients always mask their frames).
+       Returns (opcode, payload).
+    """
+    b0, b1 = _read_exact(sock_file, 2)
+    length = b1 & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(sock_file, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(sock_file, 8))[0]
+    mask = _read_exact(sock_file, 4) if b1 & 0x80 else b"\0\0\0\0"
+    payload = bytearray(_read_exact(sock_file, length))
+    for k in range(length):
+        payload[k] ^= mask[k % 4]
+    return b0 & 0x0F, bytes(payload)
+
+
+class LiveFrames:
+    """The latest published tick, shared between the simulation (which
+       publishes) and the viewer threads (which wait for new ticks).
+
+       Methods:
+         publish: makes a new tick the latest one
+         publish_game: publish(), from a covidSim game
+         publish_arrays: publish(), from a PopulationArrays
+         frame_for: the bytes a viewer needs to catch up to the latest tick
+         wait: blocks until there is a tick newer than the one given
+    """
+
+    def __init__(self, wid=600, hei=600):
+        assert wid < 32768 and hei < 32768    # positions are int16s
+        self.wid = wid
+        self.hei = hei
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # seq counts published ticks; _delta takes a viewer from seq - 1 to
+        # seq (None if it can't, say because the population changed)
+        self._seq = 0
+        self._tick = None
+        self._x = None
+        self._y = None
+        self._state = None
+        self._delta = None
+        self._keyframe = None
+        self._stats = None
+
+    def publish(self, tick, x, y, state, stats):
+        """Makes (tick, x, y, state) the latest tick, with stats (the
+           STATS_FIELDS numbers).  Encodes the delta from the previous tick,
+           and wakes up the viewers; never waits for them.
+        """
+        x = np.array(x, dtype=np.int64)
+        y = np.array(y, dtype=np.int64)
+        state = np.array(state, dtype=np.int8)
+
+        delta = None
+        if self._x is not None and len(x) == len(self._x):
+            dx = x - self._x
+            dy = y - self._y
+            if len(dx) == 0 or (min(dx.min(), dy.min()) >= -128 and
+                                max(dx.max(), dy.max()) <= 127):
+                changed = np.flatnonzero(state != self._state)
+                delta = encode_delta(tick, dx, dy, changed, state[changed])
+
+        with self._cond:
+            self._seq += 1
+            self._tick = tick
+            self._x = x
+            self._y = y
+            self._state = state
+            self._delta = delta
+            self._keyframe = None
+            self._stats = dict(zip(STATS_FIELDS, [int(v) for v in stats]))
+            self._cond.notify_all()
+
+    def publish_game(self, game, config):
+        self.publish(game.get_tick(), *snapshot_game(game),
+                     config_stats(config, covidSim.cur_healthy,
+                                   covidSim.cur_infected, covidSim.newly_infected))
+
+    def publish_arrays(self, pop, config, newly_infected):
+        cur_infected = pop.cur_infected()
+        self.publish(pop.tick, pop.x, pop.y, pop.state,
+                     config_stats(config, len(pop) - cur_infected, cur_infected,
+                                   newly_infected))
+
+    def frame_for(self, seq):
+        """Returns (latest seq, frame bytes) for a viewer that has seen up to
+           seq: the delta if it only missed one tick, otherwise a keyframe.
+           Returns (seq, None) if nothing new has been published.
+        """
+        with self._cond:
+            latest = self._seq
+            if latest == seq or self._x is None:
+                return seq, None
+            if latest == seq + 1 and self._delta is not None:
+                return latest, self._delta
+            if self._keyframe is not None:
+                return latest, self._keyframe
+            tick, x, y, state = self._tick, self._x, self._y, self._state
+
+        # encoded outside the lock, so publish() doesn't have to wait for it
+        # (the arrays are never changed once published)
+        keyframe = encode_keyframe(tick, x, y, state)
+        with self._cond:
+            if self._seq == latest:
+                self._keyframe = keyframe
+        return latest, keyframe
+
+    def wait(self, seq, timeout=None):
+        """Blocks until a tick newer than seq is published (or timeout
+           seconds go by, or close() is called).  Returns the latest seq.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq or self._closed, timeout)
+            return self._seq
+
+    def stats(self):
+        """Returns the latest tick's stats (a dict), with its tick number."""
+        with self._cond:
+            result = {"tick": self._tick}
+            if self._stats is not None:
+                result.update(self._stats)
+            return result
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        """Tells the viewers that no more ticks are coming."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><title>COVID-19 Simulator</title></head>
+<body style="background: #333; color: white; font-family: Arial">
+<canvas id="floor" width="%(wid)d" height="%(hei)d" style="background: #eee"></canvas>
+<pre id="stats"></pre>
+<script>
+const colors = %(colors)s;
+const canvas = document.getElementById("floor");
+const ctx = canvas.getContext("2d");
+let n = 0, x = null, y = null, state = null;
+
+function apply(buf) {
+  const view = new DataView(buf);
+  const kind = view.getUint8(0);
+  const length = view.getUint32(9, true);
+  let pos = 13;
+  if (kind === 0) {            // keyframe
+    n = length / 5;
+    x = new Int32Array(n); y = new Int32Array(n); state = new Int8Array(n);
+    for (let k = 0; k < n; k++) {
+      x[k] = view.getInt16(pos + 2*k, true);
+      y[k] = view.getInt16(pos + 2*n + 2*k, true);
+      state[k] = view.getInt8(pos + 4*n + k);
+    }
+    return;
+  }
+  if (x === null) return;
+  if (kind === 2) {            // dx, dy packed into one byte
+    for (let k = 0; k < n; k++) {
+      const b = view.getUint8(pos + k);
+      x[k] += ((b >> 4) ^ 8) - 8;
+      y[k] += ((b & 15) ^ 8) - 8;
+    }
+    pos += n;
+  } else {
+    for (let k = 0; k < n; k++) {
+      x[k] += view.getInt8(pos + k);
+      y[k] += view.getInt8(pos + n + k);
+    }
+    pos += 2*n;
+  }
+  const changes = (13 + length - pos) / 5;
+  for (let k = 0; k < changes; k++) {
+    state[view.getUint32(pos + 4*k, true)] = view.getInt8(pos + 4*changes + k);
+  }
+}
+
+function draw() {
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (x !== null) {
+    for (let k = 0; k < n; k++) {
+      ctx.beginPath();
+      ctx.arc(x[k], y[k], %(radius)d, 0, 2*Math.PI);
+      ctx.fillStyle = colors[state[k]];
+      ctx.fill();
+      ctx.stroke();
+    }
+  }
+  requestAnimationFrame(draw);
+}
+
+const ws = new WebSocket("ws://" + location.host + "/ws");
+ws.binaryType = "arraybuffer";
+ws.onmessage = (event) => apply(event.data);
+requestAnimationFrame(draw);
+
+setInterval(() => fetch("/stats").then((r) => r.json()).then((s) => {
+  document.getElementById("stats").textContent = JSON.stringify(s, null, 1);
+}), 1000);
+</script>
+</body>
+</html>
+"""
+
+
+class LiveHandler(BaseHTTPRequestHandler):
+    """Serves one HTTP connection (or one WebSocket, for its whole life)."""
+
+    # keep-alive, so the page's /stats polls don't each open a connection
+    protocol_version = "HTTP/1.1"
+
+    # read straight from the socket: _stream() uses select() to see whether
+    # the viewer sent anything, and select() can't see bytes that are
+    # already sitting in a read buffer
+    rbufsize = 0
+
+    def log_message(self, format, *args):
+        pass    # no access log on stderr
+
+    def _send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        live = self.server.live
+        path = self.path.split("?")[0]
+        if path == "/":
+            page = PAGE % {"wid": live.wid, "hei": live.hei, "radius": 10,
+                           "colors": json.dumps(STATE_COLORS)}
+            self._send_body(page.encode("utf-8"), "text/html; charset=utf-8")
+        elif path == "/stats":
+            stats = live.stats()
+            stats["viewers"] = self.server.viewers
+            self._send_body(json.dumps(stats).encode("utf-8"), "application/json")
+        elif path == "/ws":
+            self._serve_websocket()
+        else:
+            self.send_error(404)
+
+    def _serve_websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if key is None or "websocket" not in self.headers.get("Upgrade", "").lower():
+            self.send_error(400)
+            return
+
+        server = self.server
+        with server.viewers_lock:
+            full = server.viewers >= server.max_viewers
+            if not full:
+                server.viewers += 1
+        if full:
+            self.send_error(503)
+            return
+
+        try:
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", websocket_accept(key))
+            self.end_headers()
+            self.wfile.flush()
+            self._stream(server.live)
+        except (ConnectionError, OSError):
+            pass    # the viewer went away
+        finally:
+            with server.viewers_lock:
+                server.viewers -= 1
+            self.close_connection = True
+
+    def _stream(self, live):
+        """Sends the viewer the latest tick whenever there is a new one, and
+           answers its pings, until it (or the server) closes.
+        """
+        sock = self.connection
+        # keep the kernel from queueing up lots of old ticks for a slow
+        # viewer; once this fills up, the viewer starts skipping ticks
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+
+        seq = 0
+        while True:
+            closed = live.is_closed()
+            latest = live.wait(seq, timeout=0.5)
+
+            # anything from the viewer? (browsers only send pings and
+            # close frames)
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                opcode, payload = read_websocket_frame(self.rfile)
+                if opcode == OP_CLOSE:
+                    self.wfile.write(websocket_frame(b"", OP_CLOSE))
+                    return
+                if opcode == OP_PING:
+                    self.wfile.write(websocket_frame(payload, OP_PONG))
+
+            if latest != seq:
+                seq, data = live.frame_for(seq)
+                if data is not None:
+                    # this blocks for as long as the viewer takes; the
+                    # ticks published meanwhile are skipped
+                    self.wfile.write(websocket_frame(data))
+
+            # (the last tick was sent before closing)
+            if closed:
+                break
+        self.wfile.write(websocket_frame(b"", OP_CLOSE))
+
+
+class LiveServer:
+    """The HTTP server, running on a background thread.
+
+       Fields:
+         live - the LiveFrames to publish ticks to
+
+       Methods:
+         url: the address of the viewer page
+         close: stops the server
+    """
+
+    def __init__(self, wid=600, hei=600, host="127.0.0.1", port=8765, max_viewers=32):
+        """Constructor.  Starts serving right away.
+
+           Parameters: the size of the floor; the address to listen on
+           (port 0 picks a free one); and how many viewers can be
+           connected at once
+        """
+        self.live = LiveFrames(wid, hei)
+        self._httpd = ThreadingHTTPServer((host, port), LiveHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.live = self.live
+        self._httpd.viewers = 0
+        self._httpd.viewers_lock = threading.Lock()
+        self._httpd.max_viewers = max_viewers
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d/" % (host, port)
+
+    def viewers(self):
+        return self._httpd.viewers
+
+    def close(self):
+        self.live.close()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_with_server(config, server, tick_rate=None, publish_every=1):
+    """Runs covidSim.run_headless()'s tick loop, publishing to a LiveServer.
+       Returns the cur_infected counts, like run_headless().
+
+       Parameters: the SimConfig; the server; how many ticks per second to
+       run at most (None means as fast as possible); and how often (in
+       ticks) to publish
+    """
+    game = covidSim.build_game(config, headless=True)
+
+    def after_tick(game):
+        tick = game.get_tick()
+        if tick % publish_every == 0:
+            server.live.publish_game(game, config)
+        if tick_rate is not None:
+            # like graphics.frame_space(), but without a window
+            delay = start + tick / tick_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    start = time.monotonic()
+    return covidSim.run_ticks(game, config.ticks, after_tick=after_tick)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a headless covidSim run in a browser")
+    parser.add_argument("--population", type=int, default=50)
+    parser.add_argument("--infected", type=int, default=1)
+    parser.add_argument("--masks", type=int, default=0)
+    parser.add_argument("--size", type=int, default=600)
+    parser.add_argument("--ticks", type=int, default=10000)
+    parser.add_argument("--tick-rate", type=float, default=40)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    config = covidSim.SimConfig(args.population, args.infected, "none", args.masks,
+                                ticks=args.ticks, wid=args.size, hei=args.size,
+                                seed=args.seed)
+    with LiveServer(config.wid, config.hei, args.host, args.port) as server:
+        print("watch at %s" % server.url())
+        counts = run_with_server(config, server, args.tick_rate)
+        print("done: %d infected" % counts[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""File: metapopulation.py
+
+   Author: Brian Vu
+
+   Purpose: Many venues at once - houses, bars, and so on - with people
+            going from one to another.  Every venue is its own
+            PopulationArrays world (its own floor, furniture and people);
+            every so many ticks, a sparse mobility matrix says what fraction
+            of the people in each venue go to each other venue.  The
+            matrix can change from one transfer to the next (a schedule:
+            say, out to the bars in the evening, home at night).
+
+            The venues are split into batches, and every batch is stepped
+            by its own worker process; the workers only talk to the parent
+            at transfers (to hand over the people who leave).  Every venue
+            has its own random number generators, so a run gives the same
+            results no matter how many workers there are.
+
+            A venue with nobody contagious in it can't have any infections,
+            and where its people are doesn't matter until somebody
+            contagious shows up; so (if skip_idle is on) it isn't stepped at
+            all.  When a contagious person walks in, everybody already there
+            is put at a random spot first, as if they had been walking
+            around the whole time.  Empty venues are never stepped either.
+"""
+
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from population_arrays import PopulationArrays, HEALTHY, INFECTED
+
+
+class MobilityMatrix:
+    """Where people go at a transfer: entry (src, dst) is the chance that a
+       person in venue src moves to venue dst.  The rest of each row (1
+       minus its sum) is the chance of staying put.  Stored as sparse rows,
+       so a matrix over thousands of venues only costs as much as its
+       entries.
+
+       Methods:
+         row: the destinations of a venue, and their cumulative chances
+    """
+
+    def __init__(self, venues, entries):
+        """Constructor.
+
+           Parameters: the number of venues, and a list of (src, dst, chance)
+        """
+        rows = [[] for v in range(venues)]
+        for src, dst, chance in entries:
+            assert 0 <= src < venues and 0 <= dst < venues and src != dst
+            assert chance >= 0
+            rows[src].append((dst, chance))
+
+        self._dsts = []
+        self._cumulative = []
+        for row in rows:
+            row.sort()
+            dsts = np.array([dst for dst, chance in row], dtype=np.int64)
+            cumulative = np.cumsum([chance for dst, chance in row])
+            assert len(cumulative) == 0 or cumulative[-1] <= 1 + 1e-9
+            self._dsts.append(dsts)
+            self._cumulative.append(cumulative)
+
+    def __len__(self):
+        return len(self._dsts)
+
+    def row(self, src):
+        """Returns (destinations, cumulative chances) of venue src."""
+        return self._dsts[src], self._cumulative[src]
+
+
+class VenueBatch:
+    """Some of the venues, and their random number generators.  This is
+       what each worker process holds; with only one worker, the parent
+       uses one directly.
+
+       Methods:
+         arrive: adds the people who walked in
+         run: steps the venues, then (optionally) picks who leaves
+         census: the people and infected count in every venue
+    """
+
+    def __init__(self, first, configs, seeds, first_ids, schedule, skip_idle):
+        """Constructor.
+
+           Parameters: the index of the first venue in the batch; the
+           covidSim.SimConfig of each venue, its SeedSequence, and the id of
+           its first person; the list of MobilityMatrix objects; and whether
+           to skip idle venues
+        """
+        self._first = first
+        self._schedule = schedule
+        self._skip_idle = skip_idle
+
+        self._venues = []
+        self._walk_rngs = []
+        self._travel_rngs = []
+        self._dormant = []
+        for config, seed, first_id in zip(configs, seeds, first_ids):
+            walk_seed, travel_seed = seed.spawn(2)
+            rng = np.random.default_rng(walk_seed)
+            pop = PopulationArrays.from_config(config, rng)
+            pop.ids += first_id
+            self._venues.append(pop)
+            self._walk_rngs.append(rng)
+            self._travel_rngs.append(np.random.default_rng(travel_seed))
+            self._dormant.append(False)
+
+    def _contagious(self, v):
+        return np.any(self._venues[v].state == INFECTED)
+
+    def arrive(self, arrivals):
+        """Adds the people who walked in.
+
+           Parameters: a list of (venue, ids, mask, state), in a fixed order
+        """
+        for venue, ids, mask, state in arrivals:
+            v = venue - self._first
+            pop = self._venues[v]
+            if self._dormant[v] and np.any(state == INFECTED):
+                pop.scatter(self._walk_rngs[v])
+                self._dormant[v] = False
+            pop.place(ids, mask, state, self._walk_rngs[v])
+
+    def run(self, ticks, arrivals, transfer):
+        """Adds the arrivals, steps every venue that needs it ticks times,
+           and then, if transfer is not None, picks the people who leave
+           with schedule[transfer].
+
+           Returns (new infections per tick, departures, venue ticks
+           stepped, venue ticks skipped); departures is a list of (from
+           venue, to venue, ids, mask, state).
+        """
+        self.arrive(arrivals)
+
+        infections = np.zeros(ticks, dtype=np.int64)
+        stepped = 0
+        skipped = 0
+        for v in range(len(self._venues)):
+            pop = self._venues[v]
+            if len(pop) == 0 or (self._skip_idle and not self._contagious(v)):
+                self._dormant[v] = len(pop) > 0
+                skipped += ticks
+                continue
+            self._dormant[v] = False
+            rng = self._walk_rngs[v]
+            for tick in range(ticks):
+                infections[tick] += pop.step(rng)
+            stepped += ticks
+
+        departures = []
+        if transfer is not None:
+            matrix = self._schedule[transfer]
+            for v in range(len(self._venues)):
+                pop = self._venues[v]
+                dsts, cumulative = matrix.row(self._first + v)
+                if len(pop) == 0 or len(dsts) == 0:
+                    continue
+                pick = np.searchsorted(cumulative, self._travel_rngs[v].random(len(pop)),
+                                       side="right")
+                leaving = pick < len(dsts)
+                if not np.any(leaving):
+                    continue
+                where = dsts[pick[leaving]]
+                ids, mask, state = pop.take(leaving)
+                for dst in np.unique(where):
+                    going = where == dst
+                    departures.append((self._first + v, int(dst),
+                                       ids[going], mask[going], state[going]))
+
+        return infections, departures, stepped, skipped
+
+    def census(self):
+        """Returns (people, cur_infected) of every venue in the batch."""
+        return [(len(pop), pop.cur_infected()) for pop in self._venues]
+
+
+def batch_main(conn, args):
+    """The body of a worker process: builds its VenueBatch, and then runs
+       whatever the parent sends until it sends None.
+    """
+    batch = VenueBatch(*args)
+    while True:
+        command = conn.recv()
+        if command is None:
+            break
+        method, params = command
+        conn.send(getattr(batch, method)(*params))
+    conn.close()
+
+
+class Metapopulation:
+    """A set of venues with people moving between them.
+
+       Methods:
+         run: runs many ticks, returning the total infected count after
+              each one
+         census: the people and infected count in every venue
+         close: stops the workers
+    """
+
+    def __init__(self, configs, schedule, interval, seed=0, workers=None,
+                 skip_idle=True):
+        """Constructor.  Spawns every venue, and starts the workers.
+
+           Parameters: a covidSim.SimConfig per venue (its floor size,
+           furniture and starting people; the ticks and seed fields are
+           ignored); a list of MobilityMatrix, used one after another
+           (round and round) at the transfers; the number of ticks between
+           transfers; the seed of the whole run; how many worker processes
+           to use (None means one per core; 1 means none, everything
+           happens in this process); and whether to skip idle venues
+        """
+        assert interval > 0
+        assert len(schedule) > 0
+        for matrix in schedule:
+            assert len(matrix) == len(configs)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(configs)))
+
+        self._interval = interval
+        self._schedule = schedule
+        self.tick = 0
+        self.transfers = 0
+        self.venue_ticks_stepped = 0
+        self.venue_ticks_skipped = 0
+
+        seeds = np.random.SeedSequence(seed).spawn(len(configs))
+
+        # every venue's people get their own range of ids
+        first_ids = np.cumsum([0] + [config.population for config in configs])
+
+        self._infected = 0
+        for config in configs:
+            self._infected += config.infected_pop
+
+        # contiguous batches of (about) the same number of venues
+        self._firsts = [len(configs) * k // workers for k in range(workers + 1)]
+        batch_args = []
+        for k in range(workers):
+            lo, hi = self._firsts[k], self._firsts[k+1]
+            batch_args.append((lo, configs[lo:hi], seeds[lo:hi],
+                               [int(i) for i in first_ids[lo:hi]], schedule, skip_idle))
+
+        self._local = None
+        self._conns = []
+        self._procs = []
+        if workers == 1:
+            self._local = VenueBatch(*batch_args[0])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            for args in batch_args:
+                parent_end, child_end = ctx.Pipe()
+                proc = ctx.Process(target=batch_main, args=(child_end, args), daemon=True)
+                proc.start()
+                child_end.close()
+                self._conns.append(parent_end)
+                self._procs.append(proc)
+
+        # the people who left at the last transfer, by the batch they're
+        # going to; they walk in at the start of the next run() call
+        self._arrivals = [[] for k in range(workers)]
+
+    def _workers(self):
+        return len(self._firsts) - 1
+
+    def _call_all(self, method, params):
+        """Calls method on every batch (with params[k] for batch k), all of
+           them at the same time, and returns the list of results.
+        """
+        if self._local is not None:
+            return [getattr(self._local, method)(*params[0])]
+        for conn, p in zip(self._conns, params):
+            conn.send((method, p))
+        return [conn.recv() for conn in self._conns]
+
+    def _batch_of(self, venue):
+        k = 0
+        while self._firsts[k+1] <= venue:
+            k += 1
+        return k
+
+    def run(self, ticks):
+        """Runs ticks ticks.  Returns a list with the total cur_infected
+           (over every venue) after each tick.
+        """
+        infected = self._infected
+        counts = []
+        left = ticks
+        while left > 0:
+            # run up to the next transfer
+            chunk = min(left, self._interval - self.tick % self._interval)
+            transfer = None
+            if (self.tick + chunk) % self._interval == 0:
+                transfer = self.transfers % len(self._schedule)
+
+            params = [(chunk, self._arrivals[k], transfer) for k in range(self._workers())]
+            results = self._call_all("run", params)
+
+            infections = np.zeros(chunk, dtype=np.int64)
+            departures = []
+            for new, leaving, stepped, skipped in results:
+                infections += new
+                departures += leaving
+                self.venue_ticks_stepped += stepped
+                self.venue_ticks_skipped += skipped
+
+            # arrivals go in in a fixed order (by venue, then by where they
+            # came from), whichever batches they came from
+            departures.sort(key=lambda d: (d[1], d[0]))
+            self._arrivals = [[] for k in range(self._workers())]
+            for src, dst, ids, mask, state in departures:
+                self._arrivals[self._batch_of(dst)].append((dst, ids, mask, state))
+
+            for new in infections:
+                infected += int(new)
+                counts.append(infected)
+
+            self.tick += chunk
+            if transfer is not None:
+                self.transfers += 1
+            left -= chunk
+
+        self._infected = infected
+        return counts
+
+    def census(self):
+        """Returns a list of (people, cur_infected), one per venue.  People
+           who are on their way (they left at the last transfer) are counted
+           where they're going.
+        """
+        result = []
+        for census in self._call_all("census", [()] * self._workers()):
+            result += census
+        for arrivals in self._arrivals:
+            for venue, ids, mask, state in arrivals:
+                people, infected = result[venue]
+                result[venue] = (people + len(ids), infected + int(np.count_nonzero(state != HEALTHY)))
+        return result
+
+    def close(self):
+        """Stops the worker processes."""
+        for conn in self._conns:
+            conn.send(None)
+        for proc in self._procs:
+            proc.join()
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+        self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,155 @@
+"""File: metrics_sink.py
+
+   Author: Brian Vu
+
+   Purpose: Streams per-tick statistics to disk.  A metrics "file" is a
+            directory with one raw binary file per column (64-bit little
+            endian ints) plus a small columns.json manifest.  Rows are
+            buffered in memory and written in bulk, so a run with millions
+            of ticks only ever holds buffer_rows rows; and since every
+            column is a plain array on disk, appending to a run (or reading
+            a single column of it offline) is trivial:
+
+              numpy.fromfile("run/new_infections.i64", dtype="<i8")
+"""
+
+
+import json
+import os
+import sys
+from array import array
+
+
+MANIFEST = "columns.json"
+
+
+def _column_path(directory, name):
+    return os.path.join(directory, name + ".i64")
+
+
+class MetricsSink:
+    """Writes rows of integer columns into a metrics directory.
+
+       Methods:
+         record: adds one row (buffered)
+         flush: writes the buffered rows to disk
+         close: flushes and closes the column files
+    """
+
+    def __init__(self, directory, columns, buffer_rows=4096):
+        """Constructor.  Creates the directory if needed; if it already holds
+           metrics with the same columns, new rows are appended to them
+           (after cutting every column to the shortest one, like
+           read_metrics() does).
+
+           Parameters: the directory, the column names, and how many rows
+           to buffer before writing
+        """
+        self._directory = directory
+        self._columns = tuple(columns)
+        self._buffer_rows = buffer_rows
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                assert tuple(json.load(f)["columns"]) == self._columns
+        else:
+            with open(manifest, "w") as f:
+                json.dump({"columns": list(self._columns), "dtype": "<i8"}, f)
+
+        # if the last writer died in the middle of a flush, some columns got
+        # more rows than others; cut them all to the rows every column has,
+        # or the rows appended now would be out of line with each other
+        rows = None
+        for name in self._columns:
+            path = _column_path(directory, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if rows is None or size // 8 < rows:
+                rows = size // 8
+        for name in self._columns:
+            path = _column_path(directory, name)
+            if os.path.exists(path) and os.path.getsize(path) != rows * 8:
+                os.truncate(path, rows * 8)
+
+        self._files = []
+        self._buffers = []
+        for name in self._columns:
+            self._files.append(open(_column_path(directory, name), "ab"))
+            self._buffers.append(array("q"))
+        self._pending = 0
+
+    def record(self, *values):
+        """Adds one row; the values are in the same order as the columns."""
+        assert len(values) == len(self._columns)
+        for k in range(len(values)):
+            self._buffers[k].append(values[k])
+        self._pending += 1
+        if self._pending >= self._buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if self._pending == 0:
+            return
+        for k in range(len(self._columns)):
+            buf = self._buffers[k]
+            if sys.byteorder == "big":
+                buf.byteswap()
+            buf.tofile(self._files[k])
+            self._files[k].flush()
+            self._buffers[k] = array("q")
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_metrics(directory, columns=None):
+    """Reads a metrics directory back into a dict of column name -> array of
+       ints (read-only numpy arrays if numpy is installed).  If the writer
+       died in the middle of a flush, all columns are cut to the shortest
+       one.
+
+       Parameters: the directory, and optionally which columns to read
+    """
+    with open(os.path.join(directory, MANIFEST)) as f:
+        names = json.load(f)["columns"]
+    if columns is not None:
+        for name in columns:
+            assert name in names
+        names = list(columns)
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    data = {}
+    for name in names:
+        with open(_column_path(directory, name), "rb") as f:
+            raw = f.read()
+        # drop a half-written value at the end, if there is one
+        raw = raw[:len(raw) - len(raw) % 8]
+
+        if np is not None:
+            data[name] = np.frombuffer(raw, dtype="<i8")
+        else:
+            col = array("q")
+            col.frombytes(raw)
+            if sys.byteorder == "big":
+                col.byteswap()
+            data[name] = col
+
+    rows = min(len(col) for col in data.values()) if data else 0
+    for name in data:
+        data[name] = data[name][:rows]
+    return data
@@ -0,0 +1,99 @@
+"""File: neighbor_index.py
+
+   Author: Brian Vu
+
+   Purpose: Spatial indexes used by Game.do_nearby_calls() so that the
+            "nearby" engine doesn't have to look at every pair of objects
+            in the game on every tick.
+"""
+
+
+import math
+
+
+class UniformGrid:
+    """A uniform grid (spatial hash) over the game space.  Every entry is
+       bucketed into a square cell of side cell_size; if cell_size is at
+       least as large as the largest distance we care about, then every
+       partner of a point is in the 3x3 block of cells around it.
+
+       Entries are opaque keys (do_nearby_calls() uses indices into its
+       positions[] array) stored along with their coordinates.
+    """
+
+    def __init__(self, cell_size):
+        """Constructor.  Builds an empty grid.
+
+           Parameters: the side length of a cell (must be positive)
+        """
+        assert cell_size > 0
+        self._cell_size = cell_size
+        self._cells = {}
+
+    def cell_of(self, x, y):
+        """Returns the (column, row) of the cell that contains (x, y)."""
+        return (math.floor(x / self._cell_size),
+                math.floor(y / self._cell_size))
+
+    def insert(self, key, x, y):
+        """Adds an entry to the grid.
+
+           Parameters: the key to store, and its coordinates
+        """
+        cell = self.cell_of(x, y)
+        bucket = self._cells.get(cell)
+        if bucket is None:
+            bucket = []
+            self._cells[cell] = bucket
+        bucket.append((key, x, y))
+
+    def candidates(self, x, y):
+        """Yields (key, x, y) for every entry in the 3x3 block of cells
+           around (x, y).  This is a superset of the entries within
+           cell_size of the point; the caller is responsible for the exact
+           distance check.
+        """
+        cx, cy = self.cell_of(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bucket = self._cells.get((cx+dx, cy+dy))
+                if bucket is not None:
+                    yield from bucket
+
+    def ring(self, cx, cy, r):
+        """Yields (key, x, y) for every entry in the cells that are exactly r
+           cells away from cell (cx, cy) (in the max-norm sense: the ring of
+           cells around the (2r-1)x(2r-1) block centered on it).  Ring 0 is
+           just the cell itself.
+        """
+        if r == 0:
+            bucket = self._cells.get((cx, cy))
+            if bucket is not None:
+                yield from bucket
+            return
+
+        # the top and bottom rows of the ring, then the left and right
+        # columns (without their corners, which the rows already had)
+        for col in range(cx - r, cx + r + 1):
+            for row in (cy - r, cy + r):
+                bucket = self._cells.get((col, row))
+                if bucket is not None:
+                    yield from bucket
+        for row in range(cy - r + 1, cy + r):
+            for col in (cx - r, cx + r):
+                bucket = self._cells.get((col, row))
+                if bucket is not None:
+                    yield from bucket
+
+    def extent(self):
+        """Returns (min column, min row, max column, max row) of the cells
+           that have entries, or None if the grid is empty.
+        """
+        if len(self._cells) == 0:
+            return None
+        cols = [cell[0] for cell in self._cells]
+        rows = [cell[1] for cell in self._cells]
+        return (min(cols), min(rows), max(cols), max(rows))
+
+    def cell_size(self):
+        return self._cell_size
@@ -0,0 +1,138 @@
+"""File: obstacle_map.py
+
+   Author: Brian Vu
+
+   Purpose: Keeps people from walking through the furniture.  The
+            furniture shapes in three_shapes_game.BACKGROUND_SHAPES are
+            rasterized once into a bitmap with one entry per pixel of the
+            floor, so checking whether a spot is blocked is a single index,
+            for one person (blocked()) or for a whole array of them
+            (blocked_many()).
+
+            People are circles, but only their centers are looked up: the
+            furniture is grown by the person's radius when the bitmap is
+            built, so "the center is on a blocked pixel" is the same as "the
+            person would overlap the furniture".
+"""
+
+
+import numpy as np
+
+from three_shapes_game import BACKGROUND_SHAPES, OBSTACLE, CLEAR
+
+
+def _shape_mask(method, args, wid, hei):
+    """Which pixels (by their centers) a background shape covers, as a
+       (hei, wid) bool array.
+    """
+    px = np.arange(wid)[None, :] + 0.5
+    py = np.arange(hei)[:, None] + 0.5
+    if method == "rectangle":
+        x, y, w, h = args[:4]
+        return (px >= x) & (px < x + w) & (py >= y) & (py < y + h)
+    elif method == "ellipse":
+        x, y, w, h = args[:4]
+        return ((px - x) / (w/2))**2 + ((py - y) / (h/2))**2 <= 1
+    else:
+        assert False   # only rectangles and ellipses can be furniture
+
+
+def _grow(mask, radius):
+    """Every pixel within radius of a True pixel of mask."""
+    hei, wid = mask.shape
+    grown = mask.copy()
+    r = int(radius)
+    for oy in range(-r, r + 1):
+        for ox in range(-r, r + 1):
+            if ox*ox + oy*oy > radius*radius or (ox == 0 and oy == 0):
+                continue
+            # grown[y, x] |= mask[y - oy, x - ox]
+            grown[max(oy, 0):hei + min(oy, 0), max(ox, 0):wid + min(ox, 0)] |= \
+                mask[max(-oy, 0):hei - max(oy, 0), max(-ox, 0):wid - max(ox, 0)]
+    return grown
+
+
+class ObstacleMap:
+    """The blocked pixels of the floor.
+
+       Fields:
+         bitmap - (hei, wid) bool array, True where a person's center can't
+                  be
+
+       Methods:
+         blocked: is one spot blocked?
+         blocked_many: the same, for arrays of spots
+         bounce: the direction to take when a step is blocked
+         bounce_many: the same, for arrays of steps
+    """
+
+    def __init__(self, wid=600, hei=600, radius=10, shapes=BACKGROUND_SHAPES):
+        """Constructor.
+
+           Parameters: the size of the floor, the radius of a person, and
+           the shapes (in the format of BACKGROUND_SHAPES)
+        """
+        self.wid = wid
+        self.hei = hei
+
+        furniture = np.zeros((hei, wid), dtype=bool)
+        for method, args, kind in shapes:
+            if kind == OBSTACLE:
+                furniture |= _shape_mask(method, args, wid, hei)
+            elif kind == CLEAR:
+                furniture &= ~_shape_mask(method, args, wid, hei)
+
+        self.bitmap = _grow(furniture, radius)
+        self._flat = self.bitmap.ravel()
+        # a plain bytes copy; indexing it from Python is much cheaper than
+        # indexing a numpy array
+        self._cells = self.bitmap.astype(np.uint8).tobytes()
+
+    def blocked(self, x, y):
+        """True if a person can't stand at x, y.  Anything off the floor
+           isn't blocked (the walls are the game's edge() business).
+        """
+        wid = self.wid
+        if 0 <= x < wid and 0 <= y < self.hei:
+            return self._cells[y*wid + x] == 1
+        return False
+
+    def blocked_many(self, x, y):
+        """blocked() for arrays of (int) positions."""
+        inside = (x >= 0) & (x < self.wid) & (y >= 0) & (y < self.hei)
+        result = np.zeros(len(x), dtype=bool)
+        result[inside] = self._flat[y[inside]*self.wid + x[inside]]
+        return result
+
+    def bounce(self, x, y, dx, dy):
+        """Returns the step a person at x, y should take instead of (dx, dy),
+           if the step is blocked, or None if it isn't.  People who are
+           already inside the furniture (they were spawned there) are let
+           out, so they never get stuck.
+
+           The new step reflects off the furniture like off a wall: if only
+           the horizontal part of the step is blocked, dx flips; if only the
+           vertical part, dy flips; otherwise, both do.
+        """
+        if not self.blocked(x + dx, y + dy) or self.blocked(x, y):
+            return None
+        block_x = self.blocked(x + dx, y)
+        block_y = self.blocked(x, y + dy)
+        if block_x and not block_y:
+            return (-dx, dy)
+        elif block_y and not block_x:
+            return (dx, -dy)
+        return (-dx, -dy)
+
+    def bounce_many(self, x, y, dx, dy):
+        """bounce() for arrays.  Returns (which, new_dx, new_dy): a bool
+           array of the steps that are blocked, and the new steps of those
+           ones.
+        """
+        which = self.blocked_many(x + dx, y + dy) & ~self.blocked_many(x, y)
+        x, y, dx, dy = x[which], y[which], dx[which], dy[which]
+        block_x = self.blocked_many(x + dx, y)
+        block_y = self.blocked_many(x, y + dy)
+        flip_x = block_x | ~block_y
+        flip_y = block_y | ~block_x
+        return which, np.where(flip_x, -dx, dx), np.where(flip_y, -dy, dy)
@@ -0,0 +1,405 @@
+"""File: parallel_arrays.py
+
+   Author: Brian Vu
+
+   Purpose: Runs one big PopulationArrays simulation on several cores.  The
+            floor is cut into vertical strips, one per worker process, and
+            every worker owns the people whose x is in its strip.  The
+            columns live in shared memory, so nobody copies them; each
+            worker only reads and writes the rows it owns, plus (read only)
+            the "halo" of people in its neighbors' strips who are within
+            INFECTION_RADIUS of its border.
+
+            Every tick goes through four barriers:
+
+              1. the parent draws the tick's key (exactly the way
+                 PopulationArrays.step() does) into shared memory; each
+                 worker publishes the people near its two borders
+              2. each worker finds the nearest partner of its contagious
+                 people, among its own people and its neighbors' border
+                 lists, and writes down the infections that succeed,
+                 rolling the dice of its own people with tick_draws()
+              3. each worker moves its people and bounces them off the
+                 walls, and puts the ones that left its strip in an outbox
+                 for the neighbor they walked into
+              4. each worker takes in its neighbors' outboxes; meanwhile,
+                 the parent merges the infections (a target caught by
+                 several people is credited to the lowest one, like in
+                 step_infect()) and marks them
+
+            So a run gives the same results as PopulationArrays.run() with
+            the same rng, no matter how many workers there are.  Apart from
+            setting up its strip, a worker only ever touches its own people
+            and their halo, so its work per tick grows with its strip, not
+            with the whole population (see ParallelRunner.loads()).
+
+              runner = ParallelRunner(pop, workers=8)
+              counts = runner.run(1000, rng)
+              runner.close()
+"""
+
+
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from covidSim import INFECTION_RADIUS
+from population_arrays import (nearest_partners, tick_draws, EDGE_CHOICES,
+                               HEALTHY, INFECTED, STEPS, TAGGED, TRANSMISSION,
+                               DIRECTION_OF)
+
+
+# commands the parent leaves in control[0] before the first barrier of a
+# tick (control[1] holds the tick's key for tick_draws())
+TICK = 0
+QUIT = 1
+
+# the fields of each worker's counts[] array
+# (the "sources" count is also the length of "targets" and "dists"; "load"
+# is the number of people the worker looked at in its last tick - its own
+# and its halo)
+COUNT_FIELDS = ("left_border", "right_border", "out_left", "out_right", "sources",
+                "load")
+
+
+class SharedColumns:
+    """A set of named NumPy arrays carved out of one shared memory block.
+       The parent creates it from a layout, a list of (name, dtype, shape);
+       the workers attach to it by name with the same layout.
+    """
+
+    def __init__(self, layout, name=None):
+        offsets = []
+        size = 0
+        for field, dtype, shape in layout:
+            dtype = np.dtype(dtype)
+            size = -(-size // 8) * 8      # keep every array 8-byte aligned
+            offsets.append(size)
+            size += dtype.itemsize * int(np.prod(shape))
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.arrays = {}
+        for (field, dtype, shape), offset in zip(layout, offsets):
+            self.arrays[field] = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf,
+                                            offset=offset)
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _columns_layout(n):
+    return [("x", np.int64, (n,)),
+            ("y", np.int64, (n,)),
+            ("direction", np.int8, (n,)),
+            ("mask", np.bool_, (n,)),
+            ("state", np.int8, (n,)),
+            ("control", np.int64, (2,))]
+
+
+def _worker_layout(n):
+    # every list can (in the worst case) hold everybody
+    return [("counts", np.int64, (len(COUNT_FIELDS),)),
+            ("left_border", np.int64, (n,)),
+            ("right_border", np.int64, (n,)),
+            ("out_left", np.int64, (n,)),
+            ("out_right", np.int64, (n,)),
+            ("sources", np.int64, (n,)),
+            ("targets", np.int64, (n,)),
+            ("dists", np.float64, (n,))]
+
+
+def strip_bounds(wid, workers, cutoff=INFECTION_RADIUS):
+    """Splits a floor of width wid into (at most) workers strips of equal
+       width, each at least cutoff wide (so that the halo of a strip only
+       ever comes from the strips right next to it).  The first and last
+       strips run off to -inf and +inf, so that everybody is in a strip.
+
+       Returns a list of (x0, x1); a strip holds x0 <= x < x1.
+    """
+    workers = max(1, min(workers, int(wid // cutoff)))
+    edges = [round(wid * k / workers) for k in range(workers + 1)]
+    edges[0] = -np.inf
+    edges[-1] = np.inf
+    return [(edges[k], edges[k+1]) for k in range(workers)]
+
+
+def _count_field(field):
+    if field in ("targets", "dists"):
+        field = "sources"
+    return COUNT_FIELDS.index(field)
+
+
+def _publish(buf, counts, field, values):
+    counts[_count_field(field)] = len(values)
+    buf[field][:len(values)] = values
+
+
+def _read(buf, field):
+    return buf[field][:buf["counts"][_count_field(field)]]
+
+
+def worker_main(k, bounds, n, wid, hei, radius, obstacles, columns_name,
+                worker_names, barrier):
+    """The body of worker k: runs ticks until the parent says QUIT.
+
+       Parameters: the worker's number, the list of every strip's (x0, x1),
+       the number of people, the floor and person size, the ObstacleMap
+       (or None), the names of the shared blocks, and the barrier shared
+       with the parent
+    """
+    cols = SharedColumns(_columns_layout(n), columns_name)
+    bufs = [SharedColumns(_worker_layout(n), name) for name in worker_names]
+    mine_buf = bufs[k]
+    counts = mine_buf["counts"]
+
+    x = cols["x"]
+    y = cols["y"]
+    direction = cols["direction"]
+    mask = cols["mask"]
+    state = cols["state"]
+    control = cols["control"]
+
+    x0, x1 = bounds[k]
+    left = bufs[k-1] if k > 0 else None
+    right = bufs[k+1] if k + 1 < len(bounds) else None
+
+    mine = np.flatnonzero((x >= x0) & (x < x1))
+
+    try:
+        while True:
+            # 1: the parent has drawn the tick's key
+            barrier.wait()
+            if control[0] == QUIT:
+                break
+            key = control[1]
+
+            mx = x[mine]
+            _publish(mine_buf, counts, "left_border", mine[mx < x0 + INFECTION_RADIUS])
+            _publish(mine_buf, counts, "right_border", mine[mx >= x1 - INFECTION_RADIUS])
+            barrier.wait()
+
+            # 2: infections (everybody reads positions; nobody moves yet)
+            halo = [mine]
+            if left is not None:
+                halo.append(_read(left, "right_border"))
+            if right is not None:
+                halo.append(_read(right, "left_border"))
+            candidates = np.concatenate(halo)
+            counts[COUNT_FIELDS.index("load")] = len(candidates)
+
+            sources = mine[state[mine] == INFECTED]
+            src, partner, dist = nearest_partners(x, y, sources, candidates,
+                                                  INFECTION_RADIUS)
+            ok = state[partner] == HEALTHY
+            percent = TRANSMISSION[mask[src].astype(np.int64),
+                                   mask[partner].astype(np.int64)]
+            rolls, _ = tick_draws(key, src)
+            ok &= rolls < percent
+            _publish(mine_buf, counts, "sources", src[ok])
+            _publish(mine_buf, counts, "targets", partner[ok])
+            _publish(mine_buf, counts, "dists", dist[ok])
+            barrier.wait()
+
+            # 3: move and bounce my people (the same as step_move() and
+            # step_edges(), on my rows only)
+            step = STEPS[direction[mine]]
+            dx = step[:, 0]
+            dy = step[:, 1]
+            mx = x[mine]
+            my = y[mine]
+            if obstacles is not None:
+                which, new_dx, new_dy = obstacles.bounce_many(mx, my, dx, dy)
+                direction[mine[which]] = DIRECTION_OF[new_dx + 2, new_dy + 2]
+                dx[which] = 0
+                dy[which] = 0
+            mx += dx
+            my += dy
+            x[mine] = mx
+            y[mine] = my
+
+            hits = (mx < radius, my < radius, mx + radius >= wid, my + radius >= hei)
+            _, choices = tick_draws(key, mine)
+            for e in range(4):
+                hit = hits[e]
+                direction[mine[hit]] = EDGE_CHOICES[e][choices[e][hit]]
+
+            # people only take a couple of steps per tick, so whoever left
+            # my strip is in the one right next to it
+            _publish(mine_buf, counts, "out_left", mine[mx < x0])
+            _publish(mine_buf, counts, "out_right", mine[mx >= x1])
+            mine = mine[(mx >= x0) & (mx < x1)]
+            barrier.wait()
+
+            # 4: migration
+            arrivals = [mine]
+            if left is not None:
+                arrivals.append(_read(left, "out_right"))
+            if right is not None:
+                arrivals.append(_read(right, "out_left"))
+            mine = np.concatenate(arrivals)
+    except BaseException:
+        # don't leave the parent (and the other workers) waiting forever;
+        # this makes their barrier.wait() raise BrokenBarrierError
+        barrier.abort()
+        raise
+    finally:
+        cols.close()
+        for buf in bufs:
+            buf.close()
+
+
+class ParallelRunner:
+    """Steps a PopulationArrays across several worker processes.  The
+       population's columns are moved into shared memory (pop.x and so on
+       become views of it), so pop is up to date after every step().
+
+       Methods:
+         step: runs one tick (like PopulationArrays.step())
+         run: runs many ticks (like PopulationArrays.run())
+         loads: how many people each worker looked at in the last tick
+         close: stops the workers and frees the shared memory
+    """
+
+    def __init__(self, pop, workers=None):
+        """Constructor.  Starts the workers.
+
+           Parameters: the population, and how many worker processes to use
+           (None means one per core; the floor may not be wide enough for
+           that many strips, in which case fewer are used)
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        n = len(pop)
+        self._pop = pop
+        self._bounds = strip_bounds(pop.wid, workers)
+
+        self._cols = SharedColumns(_columns_layout(n))
+        for field in ("x", "y", "direction", "mask", "state"):
+            shared = self._cols[field]
+            shared[:] = getattr(pop, field)
+            setattr(pop, field, shared)
+        self._cols["control"][0] = TICK
+
+        self._bufs = [SharedColumns(_worker_layout(n)) for k in self._bounds]
+        names = [buf.shm.name for buf in self._bufs]
+
+        ctx = multiprocessing.get_context("spawn")
+        self._barrier = ctx.Barrier(len(self._bounds) + 1)
+        self._procs = []
+        for k in range(len(self._bounds)):
+            proc = ctx.Process(target=worker_main,
+                               args=(k, self._bounds, n, pop.wid, pop.hei, pop.radius,
+                                     pop.obstacles, self._cols.shm.name, names,
+                                     self._barrier),
+                               daemon=True)
+            proc.start()
+            self._procs.append(proc)
+
+    def workers(self):
+        """Returns the number of worker processes."""
+        return len(self._procs)
+
+    def loads(self):
+        """Returns a list with the number of people each worker looked at in
+           the last tick: the people in its strip, plus the halo it read
+           from its neighbors.
+        """
+        index = COUNT_FIELDS.index("load")
+        return [int(buf["counts"][index]) for buf in self._bufs]
+
+    def step(self, rng):
+        """Runs one tick.  Draws the tick's key the same way as
+           PopulationArrays.step(), so the result is the same; the workers
+           draw their people's numbers from it themselves.
+
+           Returns the number of newly infected people.
+        """
+        pop = self._pop
+        self._cols["control"][1] = rng.integers(2**63)
+
+        for phase in range(4):
+            self._barrier.wait()
+
+        src = np.concatenate([_read(buf, "sources") for buf in self._bufs])
+        targets = np.concatenate([_read(buf, "targets") for buf in self._bufs])
+        dist = np.concatenate([_read(buf, "dists") for buf in self._bufs])
+
+        # the same as step_infect(): sorted by source, keep the lowest
+        # source of every target
+        order = np.argsort(src, kind="stable")
+        src, targets, dist = src[order], targets[order], dist[order]
+        targets, first = np.unique(targets, return_index=True)
+        src, dist = src[first], dist[first]
+
+        pop.state[targets] = TAGGED
+        if pop.event_log is not None and len(targets) > 0:
+            pairs = 2*pop.mask[src].astype(np.int8) + pop.mask[targets]
+            pop.event_log.record_many(pop.tick, pop.ids[src], pop.ids[targets],
+                                      pairs, dist)
+        pop.tick += 1
+        return len(targets)
+
+    def run(self, ticks, rng):
+        """Runs many ticks, returning a list with cur_infected after each
+           one (like PopulationArrays.run()).
+        """
+        infected = self._pop.cur_infected()
+        counts = []
+        for tick in range(ticks):
+            infected += self.step(rng)
+            counts.append(infected)
+        return counts
+
+    def close(self):
+        """Stops the workers, and gives the population its own (private)
+           copies of the columns back.
+        """
+        if self._procs is None:
+            return
+        self._cols["control"][0] = QUIT
+        try:
+            self._barrier.wait()
+        except threading.BrokenBarrierError:
+            # a worker died; the rest are stuck
+            for proc in self._procs:
+                proc.terminate()
+        for proc in self._procs:
+            proc.join()
+        self._procs = None
+
+        for field in ("x", "y", "direction", "mask", "state"):
+            setattr(self._pop, field, getattr(self._pop, field).copy())
+        self._cols.close()
+        for buf in self._bufs:
+            buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_parallel(config, rng, workers=None):
+    """Runs the simulation described by a covidSim.SimConfig on workers
+       processes.  Returns the same list as PopulationArrays.run().
+    """
+    from population_arrays import PopulationArrays
+    pop = PopulationArrays.from_config(config, rng)
+    with ParallelRunner(pop, workers) as runner:
+        return runner.run(config.ticks, rng)
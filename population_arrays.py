@@ -0,0 +1,405 @@
+"""File: population_arrays.py
+
+   Author: Brian Vu
+
+   Purpose: A structure-of-arrays version of the covidSim population.
+            Instead of one Healthy / Infected object per person, every
+            person is a row in a handful of NumPy columns, and a tick is a
+            few whole-array operations (move, edge, infect) instead of
+            millions of method calls.
+
+            The rules are the ones in covidSim.py: people walk 2 pixels a
+            tick in one of 8 directions, pick a new direction when they
+            touch a wall, and an infected person gets one chance per tick
+            to infect its *nearest* neighbor, if that neighbor is a healthy
+            person within INFECTION_RADIUS.  As in covidSim, people who
+            catch it are only "tagged" - they are not contagious themselves.
+"""
+
+
+import numpy as np
+
+from covidSim import INFECTION_RADIUS, MOVES, TRANSMISSION_PERCENT
+from obstacle_map import ObstacleMap
+
+
+# values of the "state" column
+HEALTHY = 0
+INFECTED = 1    # contagious; an Infected object in covidSim
+TAGGED = 2      # a Healthy object that caught it (other.tagged == True)
+
+# (dx, dy) for each value of the "direction" column; this is covidSim's
+# MOVES (the numbering of self.number in Healthy.move()).  Row 0 is unused.
+STEPS = np.array([(0, 0)] + [MOVES[d] for d in range(1, 9)], dtype=np.int64)
+
+# the direction of each (dx, dy), indexed by [dx + 2, dy + 2]
+DIRECTION_OF = np.zeros((5, 5), dtype=np.int8)
+for d in MOVES:
+    DIRECTION_OF[MOVES[d][0] + 2, MOVES[d][1] + 2] = d
+
+# the new directions Healthy.edge() picks from, one row per wall, in the
+# order that Game.do_edge_calls() checks them: left, top, right, bottom
+EDGE_CHOICES = np.array([[1, 2, 3, 4, 5],
+                         [3, 4, 5, 6, 7],
+                         [1, 5, 6, 7, 8],
+                         [1, 2, 3, 7, 8]], dtype=np.int8)
+
+# TRANSMISSION_PERCENT, indexed by [infected mask, healthy mask]
+TRANSMISSION = np.array(
+    [[TRANSMISSION_PERCENT[("none", "none")], TRANSMISSION_PERCENT[("none", "mask")]],
+     [TRANSMISSION_PERCENT[("mask", "none")], TRANSMISSION_PERCENT[("mask", "mask")]]],
+    dtype=np.int64)
+
+
+class PopulationArrays:
+    """Every person in the simulation, stored as columns.
+
+       Columns (all of length n):
+         ids       - stable id of each person (used in the event log)
+         x, y      - position (ints, like the objects in covidSim)
+         direction - 1..8, see STEPS
+         mask      - True if the person wears a mask
+         state     - HEALTHY, INFECTED or TAGGED
+
+       Other fields:
+         tick      - number of completed ticks
+         event_log - if not None, an infection_log.InfectionLog that gets
+                     every transmission
+         obstacles - if not None, an obstacle_map.ObstacleMap that people
+                     walk around (see covidSim.walk())
+
+       Methods:
+         from_config: spawns a population the way covidSim.build_game() does
+         step: runs one whole tick (infect, move, edge)
+         run: runs many ticks, returning the infected count after each one
+         take: removes some people, returning their ids, masks and states
+         place: adds people at random spots
+         scatter: moves everybody to random spots
+    """
+
+    def __init__(self, x, y, direction, mask, state, wid=600, hei=600,
+                 radius=10, ids=None):
+        """Constructor.  Takes ownership of the (equal length) columns.
+
+           Parameters: the columns, the size of the floor, and the radius of
+           a person (used for the walls, like get_radius())
+        """
+        n = len(x)
+        assert len(y) == n and len(direction) == n
+        assert len(mask) == n and len(state) == n
+
+        self.x = np.asarray(x, dtype=np.int64)
+        self.y = np.asarray(y, dtype=np.int64)
+        self.direction = np.asarray(direction, dtype=np.int8)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.state = np.asarray(state, dtype=np.int8)
+        if ids is None:
+            ids = np.arange(n)
+        self.ids = np.asarray(ids, dtype=np.int64)
+
+        self.wid = wid
+        self.hei = hei
+        self.radius = radius
+
+        self.tick = 0
+        self.event_log = None
+        self.obstacles = None
+
+    @classmethod
+    def from_config(cls, config, rng):
+        """Spawns the population described by a covidSim.SimConfig: first
+           the healthy people with masks, then the ones without, then the
+           infected ones.
+
+           Parameters: the config, and a numpy.random.Generator
+        """
+        n = config.population
+        healthy_no_masks = config.population - config.infected_pop - config.healthy_masks
+
+        x = rng.integers(0, config.wid, size=n, endpoint=True)
+        y = rng.integers(0, config.hei, size=n, endpoint=True)
+        direction = rng.integers(1, 8, size=n, endpoint=True)
+
+        mask = np.zeros(n, dtype=bool)
+        mask[:config.healthy_masks] = True
+        if config.infected_mask_type == "mask":
+            mask[n - config.infected_pop:] = True
+
+        state = np.full(n, HEALTHY, dtype=np.int8)
+        state[config.healthy_masks + healthy_no_masks:] = INFECTED
+
+        pop = cls(x, y, direction, mask, state, config.wid, config.hei)
+        if config.obstacles:
+            pop.obstacles = ObstacleMap(config.wid, config.hei, pop.radius)
+        return pop
+
+    def __len__(self):
+        return len(self.x)
+
+    def count(self, state):
+        """Returns how many people are in the given state."""
+        return int(np.count_nonzero(self.state == state))
+
+    def cur_infected(self):
+        """Same as covidSim's cur_infected: contagious plus tagged people."""
+        return int(np.count_nonzero(self.state != HEALTHY))
+
+    def take(self, which):
+        """Removes the people selected by which (a bool array) and returns
+           their (ids, mask, state) columns; used to move people between
+           venues (see metapopulation.py).
+        """
+        taken = (self.ids[which], self.mask[which], self.state[which])
+        keep = ~which
+        for field in ("x", "y", "direction", "mask", "state", "ids"):
+            setattr(self, field, getattr(self, field)[keep])
+        return taken
+
+    def place(self, ids, mask, state, rng):
+        """Adds people (columns like the ones take() returns) at random spots,
+           walking in random directions.
+        """
+        k = len(ids)
+        self.x = np.concatenate((self.x, rng.integers(0, self.wid, size=k, endpoint=True)))
+        self.y = np.concatenate((self.y, rng.integers(0, self.hei, size=k, endpoint=True)))
+        self.direction = np.concatenate(
+            (self.direction, rng.integers(1, 8, size=k, endpoint=True).astype(np.int8)))
+        self.mask = np.concatenate((self.mask, np.asarray(mask, dtype=bool)))
+        self.state = np.concatenate((self.state, np.asarray(state, dtype=np.int8)))
+        self.ids = np.concatenate((self.ids, np.asarray(ids, dtype=np.int64)))
+
+    def scatter(self, rng):
+        """Puts everybody at a random spot, walking in a random direction."""
+        n = len(self)
+        self.x = rng.integers(0, self.wid, size=n, endpoint=True)
+        self.y = rng.integers(0, self.hei, size=n, endpoint=True)
+        self.direction = rng.integers(1, 8, size=n, endpoint=True).astype(np.int8)
+
+    def step_infect(self, rolls):
+        """The vectorized version of Infected.nearby().  Every contagious
+           person finds its nearest neighbor (of any kind); if that is a
+           healthy person within INFECTION_RADIUS, it infects it when its
+           roll is below TRANSMISSION[source mask, target mask].
+
+           If several people have the same nearest neighbor, the target is
+           infected if any of their rolls succeed - which is the same
+           chance as trying them one after another - and the infection is
+           credited to the first (lowest index) of them.
+
+           Parameters: rolls - ints in [0, 100], one per person (only the
+           rolls of contagious people are used)
+
+           Returns (sources, targets, dists) of the new infections, as
+           indices into the columns; every target appears once.
+        """
+        sources = np.flatnonzero(self.state == INFECTED)
+        everybody = np.arange(len(self))
+        src, partner, dist = nearest_partners(self.x, self.y, sources,
+                                              everybody, INFECTION_RADIUS)
+
+        ok = self.state[partner] == HEALTHY
+        percent = TRANSMISSION[self.mask[src].astype(np.int64),
+                               self.mask[partner].astype(np.int64)]
+        ok &= rolls[src] < percent
+
+        src, partner, dist = src[ok], partner[ok], dist[ok]
+
+        # src is sorted, so this keeps the lowest source of every target
+        partner, first = np.unique(partner, return_index=True)
+        src, dist = src[first], dist[first]
+
+        self.state[partner] = TAGGED
+        return src, partner, dist
+
+    def step_move(self):
+        """The vectorized version of Healthy.move()."""
+        step = STEPS[self.direction]
+        dx = step[:, 0]
+        dy = step[:, 1]
+        if self.obstacles is not None:
+            # whoever would walk into the furniture stays put and turns
+            which, new_dx, new_dy = self.obstacles.bounce_many(self.x, self.y, dx, dy)
+            self.direction[which] = DIRECTION_OF[new_dx + 2, new_dy + 2]
+            dx[which] = 0
+            dy[which] = 0
+        self.x += dx
+        self.y += dy
+
+    def step_edges(self, choices):
+        """The vectorized version of Game.do_edge_calls() + Healthy.edge().
+           Anybody touching a wall picks a new direction; the walls are
+           checked in the same order as do_edge_calls(), so a corner is
+           decided by the last wall.
+
+           Parameters: choices - ints in [0, 4], shape (4, n); row k picks
+           from EDGE_CHOICES[k]
+        """
+        rad = self.radius
+        hits = (self.x < rad,
+                self.y < rad,
+                self.x + rad >= self.wid,
+                self.y + rad >= self.hei)
+        for k in range(4):
+            hit = hits[k]
+            self.direction[hit] = EDGE_CHOICES[k][choices[k][hit]]
+
+    def step(self, rng):
+        """Runs one tick: infect, move, edge.  The rng only gives the tick
+           a key; every person's random numbers come from tick_draws() on
+           that key and their row, so the result only depends on the rng
+           and not on how the work is split up.
+
+           Parameters: a numpy.random.Generator
+
+           Returns the number of newly infected people.
+        """
+        rolls, choices = tick_draws(rng.integers(2**63), np.arange(len(self)))
+
+        src, targets, dist = self.step_infect(rolls)
+        if self.event_log is not None and len(targets) > 0:
+            pairs = 2*self.mask[src].astype(np.int8) + self.mask[targets]
+            self.event_log.record_many(self.tick, self.ids[src], self.ids[targets],
+                                       pairs, dist)
+        self.step_move()
+        self.step_edges(choices)
+        self.tick += 1
+        return len(targets)
+
+    def run(self, ticks, rng):
+        """Runs many ticks, returning a list with cur_infected after each
+           one (like covidSim.run_headless()).
+        """
+        infected = self.cur_infected()
+        counts = []
+        for tick in range(ticks):
+            infected += self.step(rng)
+            counts.append(infected)
+        return counts
+
+
+def nearest_partners(x, y, sources, candidates, cutoff):
+    """For every index in sources, finds the nearest index in candidates
+       (other than itself) that is within cutoff of it.  Ties are broken by
+       the lower index, like the ordering of Game.do_nearby_calls().
+
+       This is the array version of the "grid" nearby engine: candidates
+       are sorted by grid cell, and every source looks at the 3x3 block of
+       cells around it with a handful of searchsorted() calls.
+
+       Parameters: the x and y columns, the index arrays, and the cutoff
+
+       Returns (sources, partners, dists) for the sources that have a
+       partner within the cutoff.
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+             np.zeros(0, dtype=np.float64))
+    if len(sources) == 0 or len(candidates) == 0:
+        return empty
+
+    sources = np.asarray(sources, dtype=np.int64)
+    candidates = np.asarray(candidates, dtype=np.int64)
+
+    # only look up the cells of the people we were given (a worker of
+    # parallel_arrays passes its own strip, not the whole floor)
+    both = np.concatenate((sources, candidates))
+    cx = np.floor_divide(x[both], cutoff).astype(np.int64)
+    cy = np.floor_divide(y[both], cutoff).astype(np.int64)
+
+    # turn (cx, cy) into a single sortable key, leaving a one cell border
+    # so that the neighbors of the outermost cells still have valid keys
+    cx0 = cx.min() - 1
+    cy0 = cy.min() - 1
+    rows = cy.max() - cy0 + 2
+
+    def key(cols, rws):
+        return (cols - cx0) * rows + (rws - cy0)
+
+    ns = len(sources)
+    cand_keys = key(cx[ns:], cy[ns:])
+    order = np.argsort(cand_keys, kind="stable")
+    sorted_keys = cand_keys[order]
+    sorted_cands = candidates[order]
+
+    src_cx = cx[:ns]
+    src_cy = cy[:ns]
+
+    # gather every (source, candidate) pair from the 3x3 block of cells
+    pair_src = []
+    pair_cand = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            k = key(src_cx + dx, src_cy + dy)
+            lo = np.searchsorted(sorted_keys, k, side="left")
+            hi = np.searchsorted(sorted_keys, k, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            # positions lo[i], lo[i]+1, ..., hi[i]-1 for every source i
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            pos = starts + np.arange(total)
+            pair_src.append(np.repeat(sources, counts))
+            pair_cand.append(sorted_cands[pos])
+
+    if len(pair_src) == 0:
+        return empty
+    pair_src = np.concatenate(pair_src)
+    pair_cand = np.concatenate(pair_cand)
+
+    keep = pair_src != pair_cand
+    pair_src = pair_src[keep]
+    pair_cand = pair_cand[keep]
+
+    dx = (x[pair_src] - x[pair_cand]).astype(np.float64)
+    dy = (y[pair_src] - y[pair_cand]).astype(np.float64)
+    dist = np.sqrt(dx*dx + dy*dy)
+
+    keep = dist <= cutoff
+    pair_src = pair_src[keep]
+    pair_cand = pair_cand[keep]
+    dist = dist[keep]
+
+    # sort by source, then distance, then candidate, and keep the first
+    # pair of every source
+    order = np.lexsort((pair_cand, dist, pair_src))
+    pair_src = pair_src[order]
+    first = np.ones(len(pair_src), dtype=bool)
+    first[1:] = pair_src[1:] != pair_src[:-1]
+
+    return pair_src[first], pair_cand[order][first], dist[order][first]
+
+
+def _mix(z):
+    # splitmix64's finalizer: scrambles every bit of z into every bit of
+    # the result (uint64 arithmetic wraps around, which is what we want)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def tick_draws(key, rows):
+    """The random numbers of a tick, for some of the people.  Every
+       person's numbers only depend on the tick's key and their row (they
+       are a hash of the two, not the next numbers out of a generator), so
+       any subset of the rows can be drawn, in any order, by anybody - a
+       worker of parallel_arrays draws the numbers of its own strip only,
+       and gets the same ones as the serial step().
+
+       Parameters: the key (a non-negative int, drawn once per tick), and
+       an array of rows
+
+       Returns (rolls, choices): rolls are ints in [0, 100], one per row;
+       choices are ints in [0, 4], shape (4, len(rows)), like the arguments
+       of step_infect() and step_edges()
+    """
+    rows = np.asarray(rows, dtype=np.int64).astype(np.uint64)
+    golden = np.uint64(0x9E3779B97F4A7C15)
+    base = _mix(np.uint64(key) + golden * (rows + np.uint64(1)))
+
+    # five numbers per person: one roll, and a choice for each wall
+    offsets = golden * np.arange(5, dtype=np.uint64)
+    draws = _mix(base + offsets[:, None])
+    rolls = (draws[0] % np.uint64(101)).astype(np.int64)
+    choices = (draws[1:] % np.uint64(5)).astype(np.int64)
+    return rolls, choices
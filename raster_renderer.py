@@ -0,0 +1,459 @@
+"""File: raster_renderer.py
+
+   Author: Brian Vu
+
+   Purpose: Draws covidSim frames into a NumPy RGB framebuffer instead of a
+            tkinter canvas, so videos of big runs can be exported on a
+            machine without a display, and faster than real time.
+
+            RasterCanvas has the drawing methods of graphics (rectangle,
+            ellipse, text, line, triangle), so the normal drawing code -
+            draw_background(), display_stats(), Healthy.draw() - draws on it
+            unchanged.  The background is drawn once, the stats panel once
+            per change, and every kind of person is drawn once into a
+            sprite; a frame is then a copy of the background plus one big
+            batch of sprite pixels.
+
+            Tk's Arial isn't available without a display, so text uses a
+            small built-in 5x7 bitmap font; it doesn't look like Arial, but
+            it is in the same place and the same size.
+"""
+
+
+import json
+import os
+import random
+import struct
+import zlib
+
+import numpy as np
+
+import covidSim
+from three_shapes_game import draw_background, display_stats, STATS_HEIGHT
+from population_arrays import HEALTHY, INFECTED, TAGGED
+
+
+# the colors of the state column (see covidSim's Healthy / Infected)
+STATE_COLORS = {HEALTHY: "white", INFECTED: "#FC3547", TAGGED: "#FD878E"}
+
+NAMED_COLORS = {"black": (0, 0, 0), "white": (255, 255, 255),
+                "red": (255, 0, 0), "green": (0, 128, 0), "blue": (0, 0, 255),
+                "yellow": (255, 255, 0), "gray": (190, 190, 190)}
+
+# 7 rows of 5 bits per character, as hex; see _glyph()
+FONT_5X7 = {
+    'A': "0e11111f111111", 'B': "1e11111e11111e", 'C': "0e11101010110e",
+    'D': "1c12111111121c", 'E': "1f10101e10101f", 'F': "1f10101e101010",
+    'G': "0e11101711110f", 'H': "1111111f111111", 'I': "0e04040404040e",
+    'J': "0702020202120c", 'K': "11121418141211", 'L': "1010101010101f",
+    'M': "111b1515111111", 'N': "11111915131111", 'O': "0e11111111110e",
+    'P': "1e11111e101010", 'Q': "0e11111115120d", 'R': "1e11111e141211",
+    'S': "0f10100e01011e", 'T': "1f040404040404", 'U': "1111111111110e",
+    'V': "11111111110a04", 'W': "1111111515150a", 'X': "11110a040a1111",
+    'Y': "11110a04040404", 'Z': "1f01020408101f", 'a': "00000e010f110f",
+    'b': "1010161911111e", 'c': "00000e1010110e", 'd': "01010d1311110f",
+    'e': "00000e111f100e", 'f': "0609081c080808", 'g': "000f11110f010e",
+    'h': "10101619111111", 'i': "04000c0404040e", 'j': "0200060202120c",
+    'k': "10101214181412", 'l': "0c04040404040e", 'm': "00001a15151111",
+    'n': "00001619111111", 'o': "00000e1111110e", 'p': "00001e111e1010",
+    'q': "00000d130f0101", 'r': "00001619101010", 's': "00000e100e011e",
+    't': "08081c08080906", 'u': "0000111111130d", 'v': "00001111110a04",
+    'w': "0000111115150a", 'x': "0000110a040a11", 'y': "000011110f010e",
+    'z': "00001f0204081f", '0': "0e11131519110e", '1': "040c040404040e",
+    '2': "0e11010204081f", '3': "1f02040201110e", '4': "02060a121f0202",
+    '5': "1f101e0101110e", '6': "0608101e11110e", '7': "1f010204080808",
+    '8': "0e11110e11110e", '9': "0e11110f01020c", ':': "000c0c000c0c00",
+    '/': "00010204081000", '?': "0e110102040004", '.': "00000000000c0c",
+    ',': "000000000c0408", '-': "0000001f000000", '(': "02040808080402",
+    ')': "08040202020408", "'": "0c040800000000", '!': "04040404040004",
+    '%': "18190204081303", '=': "00001f001f0000",
+}
+
+
+def _rgb(fill):
+    """(r, g, b) of a tkinter color: a name, or "#rrggbb"."""
+    if fill.startswith("#"):
+        assert len(fill) == 7
+        return (int(fill[1:3], 16), int(fill[3:5], 16), int(fill[5:7], 16))
+    assert fill in NAMED_COLORS    # add it to NAMED_COLORS
+    return NAMED_COLORS[fill]
+
+
+def _glyph(ch):
+    """A 7x5 bool array with the bitmap of a character."""
+    code = FONT_5X7.get(ch)
+    if code is None:
+        code = FONT_5X7["?"]
+    rows = [int(code[k:k+2], 16) for k in range(0, 14, 2)]
+    return np.array([[(row >> (4 - col)) & 1 for col in range(5)] for row in rows],
+                    dtype=bool)
+
+
+class RasterCanvas:
+    """A framebuffer with the drawing methods of graphics.
+
+       Fields:
+         pixels  - (height, width, 3) uint8 array
+         painted - (height, width) bool array, True wherever something has
+                   been drawn (used to cut out sprites)
+    """
+
+    def __init__(self, wid, hei):
+        self.wid = wid
+        self.hei = hei
+        self.pixels = np.zeros((hei, wid, 3), dtype=np.uint8)
+        self.painted = np.zeros((hei, wid), dtype=bool)
+
+    def _paint(self, mask, x0, y0, fill):
+        """Paints the pixels where mask (whose top left corner is at x0, y0)
+           is True, clipped to the canvas.
+        """
+        h, w = mask.shape
+        cx0 = max(x0, 0)
+        cy0 = max(y0, 0)
+        cx1 = min(x0 + w, self.wid)
+        cy1 = min(y0 + h, self.hei)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        mask = mask[cy0-y0:cy1-y0, cx0-x0:cx1-x0]
+        self.pixels[cy0:cy1, cx0:cx1][mask] = _rgb(fill)
+        self.painted[cy0:cy1, cx0:cx1] |= mask
+
+    def rectangle(self, x, y, w, h, fill='black'):
+        # like create_rectangle() with no outline: [x, x+w) by [y, y+h)
+        x0 = int(round(x))
+        y0 = int(round(y))
+        x1 = int(round(x + w))
+        y1 = int(round(y + h))
+        if x1 > x0 and y1 > y0:
+            self._paint(np.ones((y1 - y0, x1 - x0), dtype=bool), x0, y0, fill)
+
+    def _inside_ellipse(self, x, y, w, h, grow):
+        """Which pixels (by their centers) are inside the ellipse centered
+           at x, y with size w, h plus grow pixels all around; returns
+           (mask, x0, y0).
+        """
+        rx = w/2 + grow
+        ry = h/2 + grow
+        x0 = int(np.floor(x - rx))
+        y0 = int(np.floor(y - ry))
+        x1 = int(np.ceil(x + rx))
+        y1 = int(np.ceil(y + ry))
+        if rx <= 0 or ry <= 0:
+            return np.zeros((0, 0), dtype=bool), x0, y0
+        px = np.arange(x0, x1) + 0.5
+        py = np.arange(y0, y1) + 0.5
+        mask = (((px[None, :] - x) / rx)**2 + ((py[:, None] - y) / ry)**2) <= 1
+        return mask, x0, y0
+
+    def ellipse(self, x, y, w, h, fill='black'):
+        # like create_oval(): filled, with a 1 pixel black outline
+        outer, x0, y0 = self._inside_ellipse(x, y, w, h, 0.5)
+        self._paint(outer, x0, y0, "black")
+        inner, ix0, iy0 = self._inside_ellipse(x, y, w, h, -0.5)
+        if inner.size > 0:
+            self._paint(inner, ix0, iy0, fill)
+
+    def line(self, x1, y1, x2, y2, fill='black', width=3):
+        steps = int(max(abs(x2 - x1), abs(y2 - y1))) + 1
+        half = width / 2
+        for k in range(steps + 1):
+            t = k / steps
+            x = x1 + (x2 - x1)*t
+            y = y1 + (y2 - y1)*t
+            self.rectangle(x - half, y - half, width, width, fill)
+
+    def triangle(self, x1, y1, x2, y2, x3, y3, fill='black'):
+        x0 = int(np.floor(min(x1, x2, x3)))
+        y0 = int(np.floor(min(y1, y2, y3)))
+        xe = int(np.ceil(max(x1, x2, x3)))
+        ye = int(np.ceil(max(y1, y2, y3)))
+        px = np.arange(x0, xe)[None, :] + 0.5
+        py = np.arange(y0, ye)[:, None] + 0.5
+
+        def side(ax, ay, bx, by):
+            return (bx - ax)*(py - ay) - (by - ay)*(px - ax)
+        s1 = side(x1, y1, x2, y2)
+        s2 = side(x2, y2, x3, y3)
+        s3 = side(x3, y3, x1, y1)
+        mask = ((s1 >= 0) & (s2 >= 0) & (s3 >= 0)) | ((s1 <= 0) & (s2 <= 0) & (s3 <= 0))
+        self._paint(mask, x0, y0, fill)
+
+    def text(self, x, y, content, fill='black', size=17):
+        # anchored at the top left, like graphics.text(); the glyphs are
+        # stretched to about the size of Arial at that point size
+        hei = max(7, int(round(size * 0.8)))
+        wid = max(5, int(round(size * 0.42)))
+        rows = (np.arange(hei) * 7) // hei
+        cols = (np.arange(wid) * 5) // wid
+        cx = int(x)
+        for ch in content:
+            if ch != " ":
+                glyph = _glyph(ch)[rows[:, None], cols[None, :]]
+                self._paint(glyph, cx, int(y) + size // 8, fill)
+            cx += wid + max(1, wid // 5)
+
+    # the graphics methods for retained drawing; nothing to do here
+    def set_tag(self, tag):
+        pass
+
+
+class _Surface:
+    """Just enough of a Game for draw_background() / display_stats(): they
+       only need a _win, and the size of the floor.
+    """
+
+    def __init__(self, win, wid, hei):
+        self._win = win
+        self._wid = wid
+        self._hei = hei
+
+    def get_size(self):
+        return (self._wid, self._hei)
+
+
+class Sprite:
+    """The pixels of one kind of person, relative to its center: dy, dx
+       and rgb arrays (one entry per pixel, in no particular order).
+    """
+
+    def __init__(self, person):
+        size = 2 * int(person.get_radius()) + 8
+        canvas = RasterCanvas(size, size)
+        person.x = size // 2
+        person.y = size // 2
+        person.draw(canvas)
+
+        dy, dx = np.nonzero(canvas.painted)
+        self.rgb = canvas.pixels[dy, dx]
+        self.dy = dy - size // 2
+        self.dx = dx - size // 2
+
+
+class OffscreenRenderer:
+    """Renders covidSim frames into RGB arrays.
+
+       Methods:
+         render: a frame from x, y, state and mask columns
+         render_game: a frame of a covidSim game
+    """
+
+    def __init__(self, wid, hei, stats_height=STATS_HEIGHT, rng=None):
+        """Constructor.
+
+           Parameters: the size of the floor (like the game's or config's
+           wid and hei); the height of the stats panel; and the random
+           number generator to build the sprite people with (they're only
+           drawn, but they still pick a spot and a direction).  By default
+           that's a private one, so the global random module is left alone.
+        """
+        self.wid = wid
+        self.hei = hei
+        self.height = hei + stats_height
+        if rng is None:
+            rng = random.Random(0)
+
+        canvas = RasterCanvas(wid, self.height)
+        draw_background(_Surface(canvas, wid, hei))
+        self._background = canvas.pixels
+
+        self._stats = None
+        self._stats_panel = None
+
+        # (state, mask) -> Sprite, drawn with the real draw() code
+        self._sprites = {}
+        for state in (HEALTHY, INFECTED, TAGGED):
+            for mask in (False, True):
+                mask_type = "mask" if mask else "none"
+                if state == INFECTED:
+                    person = covidSim.Infected(wid, hei, mask_type, rng)
+                else:
+                    person = covidSim.Healthy(wid, hei, mask_type, rng)
+                person.color = STATE_COLORS[state]
+                self._sprites[(state, mask)] = Sprite(person)
+
+    def _panel(self, stats):
+        """The stats part of the frame (below the floor); only redrawn
+           when the numbers change.
+        """
+        if stats != self._stats:
+            canvas = RasterCanvas(self.wid, self.height)
+            canvas.pixels[:] = self._background
+            display_stats(_Surface(canvas, self.wid, self.hei), *stats)
+            self._stats = stats
+            self._stats_panel = canvas.pixels[self.hei:].copy()
+        return self._stats_panel
+
+    def render(self, x, y, state, mask, stats):
+        """Returns a (height, wid, 3) uint8 frame.
+
+           Parameters: the columns of a population (like PopulationArrays),
+           and the arguments of display_stats() after the first one
+           (population, cur_healthy, healthy masks, healthy no masks,
+           infected pop, infected mask type, cur_infected, newly_infected)
+        """
+        frame = self._background.copy()
+        frame[self.hei:] = self._panel(tuple(stats))
+
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        state = np.asarray(state)
+        mask = np.asarray(mask, dtype=bool)
+
+        # one batch for every person's pixels: where they go, what color,
+        # and whose they are
+        where = []
+        colors = []
+        owner = []
+        for key in self._sprites:
+            sprite = self._sprites[key]
+            people = np.flatnonzero((state == key[0]) & (mask == key[1]))
+            if len(people) == 0:
+                continue
+            rows = (y[people][:, None] + sprite.dy[None, :]).ravel()
+            cols = (x[people][:, None] + sprite.dx[None, :]).ravel()
+            ok = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.wid)
+            where.append((rows * self.wid + cols)[ok])
+            colors.append(np.tile(sprite.rgb, (len(people), 1))[ok])
+            owner.append(np.repeat(people, len(sprite.dx))[ok])
+        if len(where) == 0:
+            return frame
+
+        where = np.concatenate(where)
+        colors = np.concatenate(colors)
+        owner = np.concatenate(owner)
+
+        # where people overlap, the one drawn last (highest index) wins,
+        # like on the canvas
+        order = np.argsort(owner, kind="stable")
+        where = where[order][::-1]
+        colors = colors[order][::-1]
+        where, first = np.unique(where, return_index=True)
+        frame.reshape(-1, 3)[where] = colors[first]
+        return frame
+
+    def render_game(self, game, stats):
+        """render() for a covidSim game."""
+        assert game.get_size() == (self.wid, self.hei)   # a renderer for another floor
+        objs = list(game.get_objs())
+        n = len(objs)
+        x = np.fromiter((o.x for o in objs), dtype=np.int64, count=n)
+        y = np.fromiter((o.y for o in objs), dtype=np.int64, count=n)
+        state = np.fromiter((INFECTED if isinstance(o, covidSim.Infected)
+                             else TAGGED if o.tagged else HEALTHY for o in objs),
+                            dtype=np.int8, count=n)
+        mask = np.fromiter((o.mask for o in objs), dtype=bool, count=n)
+        return self.render(x, y, state, mask, stats)
+
+
+def encode_png(pixels, level=1):
+    """Returns the bytes of an RGB PNG of a (height, width, 3) uint8 array."""
+    hei, wid = pixels.shape[:2]
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    # every row starts with filter type 0 (none)
+    raw = np.zeros((hei, 1 + 3*wid), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(hei, 3*wid)
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(">IIBBBBB", wid, hei, 8, 2, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) +
+            chunk(b"IEND", b""))
+
+
+class FrameWriter:
+    """Writes frames to a directory: either a numbered PNG sequence
+       (frame_000000.png, ...), or one raw file (frames.rgb, 24 bits per
+       pixel, frame after frame) plus a frames.json with its size - which
+       ffmpeg reads with -f rawvideo -pix_fmt rgb24.
+    """
+
+    def __init__(self, directory, fmt="png", level=1):
+        assert fmt in ("png", "raw")
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._fmt = fmt
+        self._level = level
+        self._count = 0
+        self._shape = None
+        self._raw = None
+        if fmt == "raw":
+            self._raw = open(os.path.join(directory, "frames.rgb"), "wb",
+                             buffering=1 << 22)
+
+    def write(self, frame):
+        self._shape = frame.shape
+        if self._fmt == "png":
+            path = os.path.join(self._directory, "frame_%06d.png" % self._count)
+            with open(path, "wb") as f:
+                f.write(encode_png(frame, self._level))
+        else:
+            self._raw.write(np.ascontiguousarray(frame).tobytes())
+        self._count += 1
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+            hei, wid = self._shape[:2] if self._shape is not None else (0, 0)
+            with open(os.path.join(self._directory, "frames.json"), "w") as f:
+                json.dump({"width": wid, "height": hei, "frames": self._count,
+                           "pix_fmt": "rgb24"}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_run(config, directory, fmt="png", every=1, engine="objects"):
+    """Runs a whole simulation headless, writing a frame every every
+       ticks.  Returns the number of frames written.
+
+       Parameters: the SimConfig; the output directory and format (see
+       FrameWriter); and "objects" (covidSim's Game) or "arrays"
+       (population_arrays)
+    """
+    renderer = OffscreenRenderer(config.wid, config.hei)
+    healthy_masks = config.healthy_masks
+    healthy_no_masks = config.population - config.infected_pop - healthy_masks
+    answer = "yes" if config.infected_mask_type == "mask" else "no"
+
+    def stats(cur_healthy, cur_infected, newly_infected):
+        return (config.population, cur_healthy, healthy_masks, healthy_no_masks,
+                config.infected_pop, answer, cur_infected, newly_infected)
+
+    frames = 0
+    with FrameWriter(directory, fmt) as writer:
+        if engine == "objects":
+            game = covidSim.build_game(config, headless=True)
+            for tick in range(config.ticks):
+                covidSim.run_ticks(game, 1)
+                if tick % every == 0:
+                    cur_healthy, cur_infected, newly_infected = covidSim.get_counters()
+                    writer.write(renderer.render_game(
+                        game, stats(cur_healthy, cur_infected, newly_infected)))
+                    frames += 1
+
+        elif engine == "arrays":
+            from population_arrays import PopulationArrays
+            from sim_random import SimRandom
+
+            rng = SimRandom(config.seed).generator
+            pop = PopulationArrays.from_config(config, rng)
+            newly_infected = 0
+            for tick in range(config.ticks):
+                newly_infected += pop.step(rng)
+                if tick % every == 0:
+                    cur_infected = pop.cur_infected()
+                    writer.write(renderer.render(
+                        pop.x, pop.y, pop.state, pop.mask,
+                        stats(len(pop) - cur_infected, cur_infected, newly_infected)))
+                    frames += 1
+
+        else:
+            assert False   # unrecognized engine
+    return frames
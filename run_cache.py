@@ -0,0 +1,130 @@
+"""File: run_cache.py
+
+   Author: Brian Vu
+
+   Purpose: Remembers the results of headless runs on disk, so running the
+            same scenario again (same config, same seed, same engine) just
+            reads the answer back instead of simulating it.  A run is only
+            deterministic when it has a seed, so runs with seed=None are
+            never cached.
+
+            Every result is one file, named after the SHA-256 of the run's
+            settings, holding cur_infected for every tick (64-bit little
+            endian ints, like metrics_sink).  The directory is kept under
+            max_bytes by deleting the least recently used files; reading a
+            result counts as using it.
+"""
+
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from batch_runner import run_replicate
+
+
+# Bump this whenever a change to the simulation changes the results of
+# existing configs; that makes every old cache entry a miss.
+ENGINE_VERSION = 3
+
+# SimConfig fields that don't change a headless run's results
+IGNORED_FIELDS = ("frame_rate",)
+
+
+def run_key(config, engine="objects"):
+    """The cache key of a run: a hex SHA-256 of its settings."""
+    settings = {}
+    for name in vars(config):
+        if name not in IGNORED_FIELDS:
+            settings[name] = getattr(config, name)
+    settings["engine"] = engine
+    settings["engine_version"] = ENGINE_VERSION
+    text = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RunCache:
+    """A directory of cached run results.
+
+       Methods:
+         get: the cached counts of a run, or None
+         put: stores the counts of a run
+         run: get(), or run it (and put()) on a miss
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + ".i64")
+
+    def get(self, config, engine="objects"):
+        """Returns the cur_infected counts of the run, or None if it isn't
+           in the cache.
+        """
+        if config.seed is None:
+            return None
+        path = self._path(run_key(config, engine))
+        try:
+            counts = np.fromfile(path, dtype="<i8")
+            os.utime(path)    # mark it as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return counts.tolist()
+
+    def put(self, config, engine, counts):
+        """Stores the counts of a run, and evicts old entries if the cache
+           has grown past max_bytes.
+        """
+        if config.seed is None:
+            return
+        path = self._path(run_key(config, engine))
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        np.asarray(counts, dtype="<i8").tofile(tmp)
+        os.replace(tmp, path)
+        self._evict()
+
+    def run(self, config, engine="objects"):
+        """Returns the cur_infected counts of the run, from the cache if
+           possible.
+        """
+        counts = self.get(config, engine)
+        if counts is None:
+            params = dict(vars(config))
+            seed = params.pop("seed")
+            counts = run_replicate(params, seed, engine)
+            self.put(config, engine, counts)
+        return counts
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self._directory):
+            if not name.endswith(".i64"):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:    # somebody else evicted it
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+            total += st.st_size
+
+        entries.sort()
+        k = 0
+        while total > self._max_bytes and k < len(entries):
+            mtime, path, size = entries[k]
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            k += 1
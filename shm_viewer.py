@@ -0,0 +1,388 @@
+"""File: shm_viewer.py
+
+   Author: Brian Vu
+
+   Purpose: Runs the simulation and the tkinter window in two different
+            processes, so a slow frame never slows down the model.  The
+            simulation writes everybody's position and state into a
+            multiprocessing.shared_memory buffer after every tick; the
+            viewer process draws whatever the latest snapshot is, at its own
+            frame rate, straight out of the shared buffer.  If the viewer
+            falls behind, it just skips the snapshots it missed.
+
+   Layout of the shared buffer (all little endian):
+       header: HEADER_FIELDS int64s (see below)
+       two slots, each with SLOT_FIELDS int64s, STATS_FIELDS int64s (the
+       display_stats() numbers), x (int32 * n), y (int32 * n) and flags
+       (uint8 * n: bit 0 = mask, bits 1-2 = state)
+
+   The writer always fills the slot the viewer is *not* told to read, then
+   flips "front" and bumps "seq" by one.  Every slot also has its own
+   sequence number (a seqlock): the writer makes it odd before it starts
+   rewriting the slot, and even again when it is done.  A reader keeps what
+   it copied out of a slot only if the slot's number was even before the
+   copy and hadn't changed after it; otherwise the writer was in the slot
+   at some point during the copy, and the frame is dropped.
+"""
+
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import covidSim
+
+
+HEADER_FIELDS = ("seq", "n", "front", "done")
+SLOT_FIELDS = ("seq", "tick")
+STATS_FIELDS = ("population", "cur_healthy", "healthy_masks", "healthy_no_masks",
+                "infected_pop", "infected_mask", "cur_infected", "newly_infected")
+
+# values of the state bits in flags (same numbering as population_arrays)
+HEALTHY = 0
+INFECTED = 1
+TAGGED = 2
+
+STATE_COLORS = ("white", "#FC3547", "#FD878E")
+
+
+def _slot_size(n):
+    return 8 * (len(SLOT_FIELDS) + len(STATS_FIELDS)) + 9 * n
+
+
+def _buffer_size(n):
+    return 8 * len(HEADER_FIELDS) + 2 * _slot_size(n)
+
+
+class SharedSnapshot:
+    """NumPy views onto the shared buffer.  Both sides use this; the writer
+       creates the shared memory, the reader attaches to it by name.
+    """
+
+    def __init__(self, n=None, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_buffer_size(n))
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            n = int(np.ndarray((len(HEADER_FIELDS),), dtype="<i8",
+                               buffer=self.shm.buf)[HEADER_FIELDS.index("n")])
+
+        buf = self.shm.buf
+        offset = 0
+        self.header = np.ndarray((len(HEADER_FIELDS),), dtype="<i8", buffer=buf, offset=offset)
+        offset += 8 * len(HEADER_FIELDS)
+
+        # (meta, stats, x, y, flags) per slot; meta holds SLOT_FIELDS
+        self.slots = []
+        for k in range(2):
+            meta = np.ndarray((len(SLOT_FIELDS),), dtype="<i8", buffer=buf, offset=offset)
+            offset += 8 * len(SLOT_FIELDS)
+            stats = np.ndarray((len(STATS_FIELDS),), dtype="<i8", buffer=buf, offset=offset)
+            offset += 8 * len(STATS_FIELDS)
+            x = np.ndarray((n,), dtype="<i4", buffer=buf, offset=offset)
+            offset += 4 * n
+            y = np.ndarray((n,), dtype="<i4", buffer=buf, offset=offset)
+            offset += 4 * n
+            flags = np.ndarray((n,), dtype="u1", buffer=buf, offset=offset)
+            offset += n
+            self.slots.append((meta, stats, x, y, flags))
+
+        if self.owner:
+            self.header[:] = 0
+            self.header[HEADER_FIELDS.index("n")] = n
+            for slot in self.slots:
+                slot[0][:] = 0
+        self.n = n
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def get(self, field):
+        return int(self.header[HEADER_FIELDS.index(field)])
+
+    def set(self, field, value):
+        self.header[HEADER_FIELDS.index(field)] = value
+
+    def read(self):
+        """Copies the front slot out (with NumPy; no per-person Python
+           objects).  Returns (tick, x array, y array, flags array, stats
+           tuple), or None if the writer was rewriting the slot while we
+           copied it (or nothing has been published yet).
+        """
+        if self.get("seq") == 0:
+            return None
+        meta, stats, x, y, flags = self.slots[self.get("front")]
+        before = int(meta[0])
+        if before % 2 == 1:
+            return None
+        tick = int(meta[1])
+        result = (tick, np.copy(x), np.copy(y), np.copy(flags), tuple(stats.tolist()))
+        if int(meta[0]) != before:
+            return None
+        return result
+
+    def close(self):
+        # the views have to go before the buffer can be closed
+        self.header = self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SnapshotWriter:
+    """The simulation side: publishes snapshots into a SharedSnapshot.
+
+       Methods:
+         publish: publishes raw columns
+         publish_game: publishes a covidSim game
+         publish_arrays: publishes a population_arrays.PopulationArrays
+    """
+
+    def __init__(self, n):
+        self.snapshot = SharedSnapshot(n)
+
+    def publish(self, tick, x, y, flags, stats):
+        """Copies one tick's columns into the back slot and makes it the
+           front one.  Never waits for the reader.
+        """
+        snap = self.snapshot
+        back = 1 - snap.get("front")
+        meta, sstats, sx, sy, sflags = snap.slots[back]
+
+        # odd while we're writing (a reader may still be copying this slot
+        # from before the last flip)
+        meta[0] += 1
+        meta[1] = tick
+        sstats[:] = stats
+        sx[:] = x
+        sy[:] = y
+        sflags[:] = flags
+        meta[0] += 1
+
+        snap.set("front", back)
+        snap.set("seq", snap.get("seq") + 1)
+
+    def publish_game(self, game, config):
+        objs = list(game.get_objs())
+        n = len(objs)
+        x = np.fromiter((o.x for o in objs), dtype=np.int32, count=n)
+        y = np.fromiter((o.y for o in objs), dtype=np.int32, count=n)
+        flags = np.fromiter((o.mask + 2*(INFECTED if isinstance(o, covidSim.Infected)
+                                         else TAGGED if o.tagged else HEALTHY)
+                             for o in objs), dtype=np.uint8, count=n)
+        self.publish(game.get_tick(), x, y, flags,
+                     config_stats(config, covidSim.cur_healthy,
+                                   covidSim.cur_infected, covidSim.newly_infected))
+
+    def publish_arrays(self, pop, config, newly_infected):
+        flags = pop.mask.astype(np.uint8) + 2*pop.state.astype(np.uint8)
+        cur_infected = pop.cur_infected()
+        self.publish(pop.tick, pop.x, pop.y, flags,
+                     config_stats(config, len(pop) - cur_infected, cur_infected,
+                                   newly_infected))
+
+    def finish(self):
+        """Tells the viewer that no more snapshots are coming."""
+        self.snapshot.set("done", 1)
+
+    def close(self):
+        self.snapshot.close()
+
+
+def config_stats(config, cur_healthy, cur_infected, newly_infected):
+    """The display_stats() numbers (in STATS_FIELDS order) of a run of
+       config, given its current counts.
+    """
+    healthy_no_masks = config.population - config.infected_pop - config.healthy_masks
+    return (config.population, cur_healthy, config.healthy_masks, healthy_no_masks,
+            config.infected_pop, config.infected_mask_type == "mask",
+            cur_infected, newly_infected)
+
+
+class _Canvas:
+    """Just enough of a Game for draw_background() / display_stats(), which
+       only need a _win and the size of the floor.
+    """
+
+    def __init__(self, win, wid, hei):
+        self._win = win
+        self._wid = wid
+        self._hei = hei
+
+    def get_size(self):
+        return (self._wid, self._hei)
+
+
+def viewer_main(name, wid, hei, frame_rate, linger=3.0):
+    """The viewer process: attaches to the shared buffer and draws the
+       latest snapshot frame_rate times a second, until the window is
+       closed - or until the writer has finished, and the last snapshot has
+       been on the screen for linger seconds.  Uses the Healthy / Infected
+       draw() code for the people, and the retained-mode idea from Game:
+       every person's items are drawn once, and then just moved and
+       recolored.  Frames are paced by the window's deadline scheduler
+       (frame_space() / frame_is_late()), so drawing time counts against
+       the frame.
+    """
+    from graphics import graphics
+    from three_shapes_game import draw_background, display_stats, STATS_HEIGHT
+
+    snap = SharedSnapshot(name=name)
+    win = graphics(wid, hei + STATS_HEIGHT, "COVID-19 Simulator (viewer)")
+    canvas = _Canvas(win, wid, hei)
+    draw_background(canvas)
+
+    people = None    # a _People, once the first snapshot is in
+    last_seq = -1
+    last_stats = None
+    finished_at = None
+
+    while not win.is_killed:
+        # read "done" first: if it's set, the seq we read next is the last
+        done = snap.get("done")
+        seq = snap.get("seq")
+        # if drawing took too long, skip this frame (the next one shows
+        # the newest snapshot anyway)
+        late = win.frame_is_late()
+        if not late and seq != last_seq and seq > 0:
+            frame = snap.read()
+            if frame is not None:
+                tick, xs, ys, fl, stats = frame
+                if people is None:
+                    people = _People(win, xs, ys, fl, wid, hei)
+                else:
+                    people.update(win, xs, ys, fl)
+
+                if stats != last_stats:
+                    win.delete("stats")
+                    win.set_tag("stats")
+                    (population, cur_healthy, masks, no_masks, infected_pop,
+                     infected_mask, cur_infected, newly_infected) = stats
+                    display_stats(canvas, population, cur_healthy, masks, no_masks,
+                                  infected_pop, "yes" if infected_mask else "no",
+                                  cur_infected, newly_infected)
+                    win.set_tag(None)
+                    win.raise_item("objs")
+                    last_stats = stats
+                last_seq = seq
+
+        if done and seq == last_seq:
+            # the last snapshot is on the screen
+            if finished_at is None:
+                finished_at = time.monotonic()
+                win.set_title("COVID-19 Simulator (viewer) - finished")
+            elif time.monotonic() - finished_at >= linger:
+                win.primary.destroy()
+                break
+
+        if late:
+            win.skip_frame()
+        else:
+            win.update()
+        win.frame_space(frame_rate)
+
+    snap.close()
+
+
+class _People:
+    """The canvas items of everybody on the viewer's screen, and where
+       (and in what state) they were last drawn.
+
+       Methods:
+         update: moves and recolors the people whose snapshot changed
+    """
+
+    def __init__(self, win, xs, ys, flags, wid, hei):
+        """Constructor.  Draws everybody with the Healthy / Infected draw()
+           code.
+
+           Parameters: the window, the first snapshot's x, y and flags
+           arrays, and the size of the floor
+        """
+        self.tags = []
+        self.bodies = []
+        self.x = xs
+        self.y = ys
+        self.state = flags >> 1
+        for k in range(len(xs)):
+            mask = "mask" if flags[k] & 1 else "none"
+            state = int(self.state[k])
+            if state == INFECTED:
+                o = covidSim.Infected(wid, hei, mask)
+            else:
+                o = covidSim.Healthy(wid, hei, mask)
+            o.x, o.y = int(xs[k]), int(ys[k])
+            o.color = STATE_COLORS[state]
+
+            tag = "obj%d" % k
+            win.set_tag(("objs", tag))
+            self.bodies.append(o.draw(win))
+            win.set_tag(None)
+            self.tags.append(tag)
+
+    def update(self, win, xs, ys, flags):
+        """Moves the people who moved and recolors the ones whose state
+           changed since the last snapshot; nobody else is touched.
+        """
+        moved = np.flatnonzero((xs != self.x) | (ys != self.y))
+        dx = (xs[moved].astype(np.int64) - self.x[moved]).tolist()
+        dy = (ys[moved].astype(np.int64) - self.y[moved]).tolist()
+        for k, ddx, ddy in zip(moved.tolist(), dx, dy):
+            win.move_item(self.tags[k], ddx, ddy)
+
+        state = flags >> 1
+        changed = np.flatnonzero(state != self.state)
+        for k, new in zip(changed.tolist(), state[changed].tolist()):
+            if self.bodies[k] is not None:
+                win.set_fill(self.bodies[k], STATE_COLORS[new])
+
+        self.x = xs
+        self.y = ys
+        self.state = state
+
+
+def run_with_viewer(config, frame_rate=40, publish_every=1, wait=True):
+    """Runs covidSim.run_headless()'s tick loop at full speed, while a
+       separate viewer process shows it.  Returns the cur_infected counts,
+       like run_headless().
+
+       Parameters: the SimConfig, the viewer's frame rate, how often (in
+       ticks) to publish a snapshot, and whether to wait for the viewer
+       to exit before returning (it closes its window a few seconds after
+       the last snapshot, or when the window is closed)
+    """
+    game = covidSim.build_game(config, headless=True)
+
+    # the people are only in the game after the first tick
+    counts = []
+    writer = None
+    proc = None
+    for tick in range(config.ticks):
+        game.do_nearby_calls()
+        game.do_move_calls()
+        game.do_edge_calls()
+        game.execute_removes()
+        counts.append(covidSim.cur_infected)
+
+        if writer is None:
+            writer = SnapshotWriter(len(game.get_objs()))
+            writer.publish_game(game, config)
+            ctx = multiprocessing.get_context("spawn")
+            proc = ctx.Process(target=viewer_main,
+                               args=(writer.snapshot.name, config.wid, config.hei, frame_rate))
+            proc.start()
+        elif tick % publish_every == 0:
+            writer.publish_game(game, config)
+
+    if writer is not None:
+        writer.publish_game(game, config)
+        writer.finish()
+        if wait:
+            proc.join()
+        writer.close()
+    return counts
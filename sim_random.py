@@ -0,0 +1,102 @@
+"""File: sim_random.py
+
+   Author: Brian Vu
+
+   Purpose: A per-simulation random number generator.  Each Game gets its
+            own SimRandom (instead of everybody sharing the global random
+            module), so a seed fully determines a run, and parallel runs
+            get independent streams.
+
+            It has the same randint() / choice() / random() methods as the
+            random module, so the people in covidSim don't care which one
+            they were handed.  Under the hood it draws uniform numbers from
+            a NumPy Generator in blocks, instead of paying for one call per
+            randint().
+"""
+
+
+import random
+
+try:
+    import numpy as np
+except ImportError:    # the tkinter version of covidSim doesn't need numpy
+    np = None
+
+
+class SimRandom:
+    """A seeded random number generator with a random-module-like API.
+
+       Methods:
+         random: a float in [0, 1)
+         randint: an int in [a, b], both ends included
+         choice: a random element of a sequence
+         generator: the underlying numpy.random.Generator (for the
+         vectorized code in population_arrays)
+         getstate / setstate: save and restore the exact position in the
+         stream
+    """
+
+    def __init__(self, seed=None, block=4096):
+        """Constructor.
+
+           Parameters: the seed (None means "pick one from the OS"), and
+           how many numbers to pre-draw at a time
+        """
+        self._block = block
+        self._buf = []
+        self._pos = 0
+        if np is not None:
+            self._gen = np.random.default_rng(seed)
+            self._py = None
+        else:
+            # without numpy we're still deterministic for a given seed; it
+            # just isn't the same stream as with numpy.
+            self._gen = None
+            self._py = random.Random(seed)
+
+    @property
+    def generator(self):
+        assert self._gen is not None   # needs numpy
+        return self._gen
+
+    def _refill(self):
+        if self._gen is not None:
+            self._buf = self._gen.random(self._block).tolist()
+        else:
+            self._buf = [self._py.random() for i in range(self._block)]
+        self._pos = 0
+
+    def random(self):
+        """Returns the next float in [0, 1)."""
+        if self._pos == len(self._buf):
+            self._refill()
+        u = self._buf[self._pos]
+        self._pos += 1
+        return u
+
+    def randint(self, a, b):
+        """Returns an int in [a, b], both ends included (like random.randint)."""
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        """Returns a random element of a non-empty sequence."""
+        return seq[int(self.random() * len(seq))]
+
+    def getstate(self):
+        """Returns an object which setstate() can use to rewind this
+           generator to exactly where it is now.
+        """
+        if self._gen is not None:
+            inner = self._gen.bit_generator.state
+        else:
+            inner = self._py.getstate()
+        return (inner, list(self._buf), self._pos)
+
+    def setstate(self, state):
+        inner, buf, pos = state
+        if self._gen is not None:
+            self._gen.bit_generator.state = inner
+        else:
+            self._py.setstate(inner)
+        self._buf = list(buf)
+        self._pos = pos
@@ -0,0 +1,327 @@
+"""File: sweep_queue.py
+
+   Author: Brian Vu
+
+   Purpose: A parameter sweep that survives crashes.  The grid (the same
+            kind as batch_runner's: the answers to main()'s form, as
+            SimConfig fields) is turned into one job per replicate, and the
+            jobs and their results are kept in a SQLite database.  Any
+            number of workers - processes on this machine, or on other
+            machines that can see the same file - claim jobs from it, run
+            them and write the results back.  If a worker dies, its jobs go
+            back in the queue once their lease runs out; re-running a sweep
+            only runs the jobs that haven't finished.
+
+              python sweep_queue.py sweep.db add masks --grid '{"healthy_masks": [0, 25, 49]}' -r 20
+              python sweep_queue.py sweep.db work -p 4
+              python sweep_queue.py sweep.db status masks
+              python sweep_queue.py sweep.db export masks masks.csv
+
+            A job is claimed inside a BEGIN IMMEDIATE transaction, which
+            takes SQLite's write lock before looking at the queue, so two
+            workers can never claim the same job.  Results are written in
+            one transaction per batch of jobs, not one per row.
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+from batch_runner import (expand_grid, make_jobs, run_replicate, summarize,
+                          write_csv, DEFAULT_QUANTILES)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         INTEGER PRIMARY KEY,
+    sweep      TEXT NOT NULL,
+    params     TEXT NOT NULL,
+    seed       INTEGER NOT NULL,
+    engine     TEXT NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'pending',
+    worker     TEXT,
+    claimed_at REAL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    UNIQUE (sweep, params, seed, engine)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, id);
+
+CREATE TABLE IF NOT EXISTS results (
+    job_id       INTEGER NOT NULL,
+    tick         INTEGER NOT NULL,
+    cur_infected INTEGER NOT NULL,
+    PRIMARY KEY (job_id, tick)
+) WITHOUT ROWID;
+"""
+
+# job status values
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _worker_name():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+class SweepQueue:
+    """The job queue and result store of a sweep database.
+
+       Methods:
+         add_sweep: adds the jobs of a grid (skipping ones already there)
+         claim: takes pending (or abandoned) jobs for a worker
+         complete: stores the results of finished jobs
+         fail: gives a job back after an error
+         status: how many jobs of a sweep are in each state
+         summary: the run_batch() table of a sweep's results
+    """
+
+    def __init__(self, path, lease=3600.0, max_attempts=3, wal=False):
+        """Constructor.
+
+           Parameters: the database file; how many seconds a claimed job
+           may run before another worker can take it over; how many times
+           a failing job is tried; and whether to use WAL journaling -
+           faster, but only safe when every worker is on the same machine
+           (WAL doesn't work over network filesystems)
+        """
+        self._path = path
+        self._lease = lease
+        self._max_attempts = max_attempts
+
+        # isolation_level=None: we do our own BEGIN / COMMIT
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        if wal:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _begin(self):
+        # takes the write lock now, instead of at the first write, so that
+        # what we read can't change before we write
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def add_sweep(self, sweep, grid, replicates, seed=0, engine="objects"):
+        """Adds a job for every replicate of every point of grid.  Jobs that
+           are already in the database (from an earlier call with the same
+           arguments) are left alone, so adding a sweep again is how it is
+           resumed.  A job's seed only depends on its point and replicate
+           (see batch_runner.job_seed()), so adding points or replicates to
+           a sweep only adds the jobs that are new.  Returns the number of
+           new jobs.
+        """
+        jobs = make_jobs(expand_grid(grid), replicates, seed, engine)
+        rows = [(sweep, json.dumps(params, sort_keys=True), seed_k, engine_k)
+                for params, seed_k, engine_k in jobs]
+
+        self._begin()
+        try:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO jobs (sweep, params, seed, engine) "
+                                 "VALUES (?, ?, ?, ?)", rows)
+            added = self._db.total_changes - before
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(self, worker, count=1):
+        """Claims up to count jobs for worker: pending ones first, then
+           running ones whose lease has run out.  Returns a list of
+           (job id, params, seed, engine).
+        """
+        now = time.time()
+        self._begin()
+        try:
+            rows = self._db.execute(
+                "SELECT id, params, seed, engine FROM jobs "
+                "WHERE status = ? OR (status = ? AND claimed_at < ?) "
+                "ORDER BY status = ? DESC, id LIMIT ?",
+                (PENDING, RUNNING, now - self._lease, PENDING, count)).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, worker = ?, claimed_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(RUNNING, worker, now, row[0]) for row in rows])
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return [(job_id, json.loads(params), seed, engine)
+                for job_id, params, seed, engine in rows]
+
+    def complete(self, finished):
+        """Stores the results of finished jobs, all in one transaction.
+
+           Parameters: a list of (job id, cur_infected list)
+        """
+        rows = []
+        for job_id, counts in finished:
+            for tick in range(len(counts)):
+                rows.append((job_id, tick, counts[tick]))
+
+        self._begin()
+        try:
+            # a job whose lease ran out may be finished twice; the results
+            # are the same (it has a fixed seed), so the second copy just
+            # replaces the first
+            self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", rows)
+            self._db.executemany("UPDATE jobs SET status = ?, error = NULL WHERE id = ?",
+                                 [(DONE, job_id) for job_id, counts in finished])
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def fail(self, job_id, error):
+        """Gives a job back after it raised error; it goes back in the queue
+           unless it has already been tried max_attempts times.
+        """
+        self._begin()
+        try:
+            self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ? WHERE id = ?",
+                (self._max_attempts, FAILED, PENDING, str(error), job_id))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def status(self, sweep):
+        """Returns {status: number of jobs} for a sweep."""
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, count in self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE sweep = ? GROUP BY status", (sweep,)):
+            counts[status] = count
+        return counts
+
+    def summary(self, sweep, quantiles=DEFAULT_QUANTILES):
+        """Returns the finished part of a sweep as a run_batch() table: one
+           row per grid point and tick, over the replicates that are done.
+        """
+        runs = {}
+        order = []
+        cursor = self._db.execute(
+            "SELECT jobs.params, results.job_id, results.cur_infected "
+            "FROM jobs JOIN results ON results.job_id = jobs.id "
+            "WHERE jobs.sweep = ? AND jobs.status = ? "
+            "ORDER BY jobs.id, results.tick", (sweep, DONE))
+        last_job = None
+        for params, job_id, cur_infected in cursor:
+            if params not in runs:
+                runs[params] = []
+                order.append(params)
+            if job_id != last_job:
+                runs[params].append([])
+                last_job = job_id
+            runs[params][-1].append(cur_infected)
+
+        rows = []
+        for params in order:
+            rows += summarize(json.loads(params), runs[params], quantiles)
+        return rows
+
+
+def work(path, worker=None, batch=4, lease=3600.0, wal=False):
+    """A worker: claims jobs batch at a time, runs them, and stores their
+       results, until there are no jobs left.  Returns the number of jobs
+       it ran.
+    """
+    if worker is None:
+        worker = _worker_name()
+    queue = SweepQueue(path, lease=lease, wal=wal)
+    ran = 0
+    try:
+        while True:
+            jobs = queue.claim(worker, batch)
+            if len(jobs) == 0:
+                break
+
+            finished = []
+            for job_id, params, seed, engine in jobs:
+                try:
+                    finished.append((job_id, run_replicate(params, seed, engine)))
+                except Exception as e:
+                    queue.fail(job_id, repr(e))
+            queue.complete(finished)
+            ran += len(finished)
+    finally:
+        queue.close()
+    return ran
+
+
+def _work(args):
+    return work(*args)
+
+
+def run_workers(path, processes=None, batch=4, lease=3600.0, wal=False):
+    """Runs processes local workers (None means one per core) until the
+       queue is empty.  Returns the number of jobs run.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    with multiprocessing.Pool(processes) as pool:
+        args = [(path, None, batch, lease, wal)] * processes
+        return sum(pool.map(_work, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable covidSim parameter sweeps")
+    parser.add_argument("db", help="the sweep database (created if needed)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add (or resume) a sweep")
+    add.add_argument("sweep")
+    add.add_argument("--grid", required=True, help="JSON, like batch_runner's grids")
+    add.add_argument("-r", "--replicates", type=int, default=10)
+    add.add_argument("--seed", type=int, default=0)
+    add.add_argument("--engine", default="objects", choices=("objects", "arrays"))
+    add.add_argument("--wal", action="store_true",
+                     help="put the database in write-ahead-log mode")
+
+    run = commands.add_parser("work", help="run jobs until the queue is empty")
+    run.add_argument("-p", "--processes", type=int, default=None)
+    run.add_argument("--batch", type=int, default=4)
+    run.add_argument("--lease", type=float, default=3600.0)
+    run.add_argument("--wal", action="store_true",
+                     help="put the database in write-ahead-log mode")
+
+    status = commands.add_parser("status", help="count the jobs of a sweep")
+    status.add_argument("sweep")
+
+    export = commands.add_parser("export", help="write a sweep's table to a CSV file")
+    export.add_argument("sweep")
+    export.add_argument("csv")
+
+    args = parser.parse_args()
+    if args.command == "add":
+        queue = SweepQueue(args.db, wal=args.wal)
+        added = queue.add_sweep(args.sweep, json.loads(args.grid), args.replicates,
+                                args.seed, args.engine)
+        print("added %d jobs" % added)
+        queue.close()
+    elif args.command == "work":
+        print("ran %d jobs" % run_workers(args.db, args.processes, args.batch, args.lease,
+                                          args.wal))
+    elif args.command == "status":
+        queue = SweepQueue(args.db)
+        print(json.dumps(queue.status(args.sweep)))
+        queue.close()
+    elif args.command == "export":
+        queue = SweepQueue(args.db)
+        write_csv(queue.summary(args.sweep), args.csv)
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
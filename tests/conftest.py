@@ -0,0 +1,13 @@
+"""File: conftest.py
+
+   Author: Brian Vu
+
+   Purpose: Lets the tests import the simulator's modules (which live at
+            the top of the repository, not in a package).
+"""
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
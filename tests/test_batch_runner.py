@@ -0,0 +1,109 @@
+"""File: test_batch_runner.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the batch runner's job seeds and the run cache.
+"""
+
+
+import os
+
+import run_cache
+from batch_runner import expand_grid, job_seed, make_jobs, run_batch
+from covidSim import SimConfig
+from run_cache import RunCache
+
+
+def test_job_seeds_dont_depend_on_the_rest_of_the_grid():
+    small = make_jobs(expand_grid({"population": [20, 40]}), 3, seed=7)
+    big = make_jobs(expand_grid({"population": [10, 20, 30, 40]}), 5, seed=7)
+
+    # every job of the small grid is also a job of the big one
+    assert set((p["population"], s) for p, s, e in small) <= \
+           set((p["population"], s) for p, s, e in big)
+
+    # and the seeds still depend on the base seed
+    other = make_jobs(expand_grid({"population": [20, 40]}), 3, seed=8)
+    assert [s for p, s, e in other] != [s for p, s, e in small]
+
+
+def test_cache_hits_after_adding_a_grid_point(tmp_path):
+    cache = RunCache(str(tmp_path))
+    grid = {"population": [20, 40], "ticks": [30]}
+    first = run_batch(grid, 2, workers=1, seed=3, cache=cache)
+    assert cache.hits == 0
+
+    cache.hits = 0
+    cache.misses = 0
+    grid = {"population": [10, 20, 40], "ticks": [30]}
+    second = run_batch(grid, 2, workers=1, seed=3, cache=cache)
+
+    # only the new point was run
+    assert cache.hits == 4
+    assert cache.misses == 2
+    assert [r for r in second if r["population"] != 10] == first
+
+
+def test_job_seeds_are_stable():
+    # these are part of every cache key and sweep queue; changing how they
+    # are derived would orphan all of them
+    assert job_seed(0, {"population": 50}, 0) == 127067142474418394
+    assert job_seed(7, {"ticks": 30, "population": 20}, 2) == 7092167630437901100
+    assert job_seed(7, {"population": 20, "ticks": 30}, 2) == 7092167630437901100
+
+    seeds = {job_seed(1, {"population": 50}, r) for r in range(100)}
+    assert len(seeds) == 100
+    assert all(0 <= s < 2**63 for s in seeds)
+
+
+def test_batches_dont_depend_on_the_number_of_workers():
+    grid = {"population": [20, 30], "ticks": [40]}
+    one = run_batch(grid, 3, workers=1, seed=5)
+    two = run_batch(grid, 3, workers=2, seed=5)
+    assert one == two
+    assert run_batch(grid, 3, workers=1, seed=6) != one
+
+
+def test_cache_keys(tmp_path, monkeypatch):
+    cache = RunCache(str(tmp_path))
+    config = SimConfig(20, 1, ticks=5, seed=1)
+    assert cache.get(config) is None
+    cache.put(config, "objects", [1, 2, 3, 4, 5])
+    assert cache.get(config) == [1, 2, 3, 4, 5]
+
+    # the frame rate doesn't change a headless run; the engine does
+    assert cache.get(SimConfig(20, 1, ticks=5, seed=1, frame_rate=5)) == [1, 2, 3, 4, 5]
+    assert cache.get(config, "arrays") is None
+    assert cache.get(SimConfig(20, 1, ticks=5, seed=2)) is None
+
+    # unseeded runs aren't repeatable, so they are never cached
+    unseeded = SimConfig(20, 1, ticks=5)
+    cache.put(unseeded, "objects", [1, 2, 3, 4, 5])
+    assert cache.get(unseeded) is None
+
+    monkeypatch.setattr(run_cache, "ENGINE_VERSION", run_cache.ENGINE_VERSION + 1)
+    assert cache.get(config) is None
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    cache = RunCache(str(tmp_path), max_bytes=3 * 80)
+    configs = [SimConfig(20, 1, ticks=10, seed=s) for s in range(4)]
+    for k in range(3):
+        cache.put(configs[k], "objects", list(range(10)))
+        path = os.path.join(str(tmp_path), run_cache.run_key(configs[k]) + ".i64")
+        os.utime(path, (1000 * (k+1), 1000 * (k+1)))
+
+    assert cache.get(configs[0]) is not None     # now the most recent
+    cache.put(configs[3], "objects", list(range(10)))
+    assert cache.get(configs[1]) is None
+    assert cache.get(configs[0]) is not None
+    assert cache.get(configs[2]) is not None
+    assert cache.get(configs[3]) is not None
+
+
+def test_cache_run_simulates_only_on_a_miss(tmp_path):
+    cache = RunCache(str(tmp_path))
+    config = SimConfig(30, 2, ticks=20, seed=4)
+    counts = cache.run(config)
+    assert len(counts) == 20 and cache.misses == 1
+    assert cache.run(config) == counts and cache.hits == 1
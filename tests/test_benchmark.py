@@ -0,0 +1,62 @@
+"""File: test_benchmark.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the benchmark harness.
+"""
+
+
+from benchmark import (compare_exit_code, make_config, run_case, run_case_isolated,
+                       EXIT_SLOWER, EXIT_VERSION_CHANGED)
+
+
+def _report(version, ticks_per_sec):
+    return {"engine_version": version,
+            "results": [{"engine": "grid", "renderer": "headless", "population": 50,
+                         "ticks_per_sec": ticks_per_sec}]}
+
+
+def test_compare_exit_codes():
+    assert compare_exit_code(_report(2, 100.0), _report(2, 99.0)) == 0
+    assert compare_exit_code(_report(2, 100.0), _report(2, 50.0)) == EXIT_SLOWER
+
+    # a new engine version can't pass the gate by accident
+    assert compare_exit_code(_report(1, 100.0), _report(2, 50.0)) == EXIT_VERSION_CHANGED
+    assert compare_exit_code(_report(1, 100.0), _report(2, 50.0),
+                             allow_version_change=True) == 0
+
+
+def test_bigger_cases_keep_the_density():
+    small = make_config(50, 10, "grid", 1)
+    big = make_config(5000, 10, "arrays", 1)
+    assert (small.wid, small.hei) == (600, 600)
+    assert abs(big.population / big.wid**2 - small.population / small.wid**2) < 1e-5
+    assert big.infected_pop == 50
+    # (the arrays population takes the floor and people of a grid game)
+    assert big.nearby_engine == "grid"
+
+
+def test_run_case_reports_every_phase():
+    phases = {"grid": {"nearby", "move", "edge", "removes", "draw", "pairs",
+                       "nearby_calls"},
+              "arrays": {"infect", "move", "edge"}}
+    for engine in ("grid", "arrays"):
+        result = run_case(200, engine, "headless", 5, 1)
+        assert result["engine"] == engine and result["ticks"] == 5
+        assert result["ticks_per_sec"] > 0 and result["peak_rss_kb"] > 0
+        assert set(result["phases"]) == phases[engine]
+        assert all(value is None or value >= 0 for value in result["phases"].values())
+
+
+def test_isolated_cases_that_dont_finish_are_recorded_as_failed():
+    result = run_case_isolated(50, "grid", "headless", 5, 1)
+    assert result["ticks_per_sec"] > 0 and "error" not in result
+
+    # (config_set() rejects the engine, so the worker dies)
+    result = run_case_isolated(50, "no_such_engine", "headless", 5, 1)
+    assert result["ticks_per_sec"] is None
+    assert result["error"].startswith("exited with code")
+
+    result = run_case_isolated(5000, "grid", "headless", 10**6, 1, timeout=0.1)
+    assert result["ticks_per_sec"] is None
+    assert result["error"] == "timed out after 0.1 s"
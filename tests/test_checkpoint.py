@@ -0,0 +1,49 @@
+"""File: test_checkpoint.py
+
+   Author: Brian Vu
+
+   Purpose: A run resumed from a checkpoint has to carry on exactly like
+            the run that was never interrupted.
+"""
+
+
+import numpy as np
+
+import covidSim
+from checkpoint import save_game, resume, save_arrays, load_arrays
+from population_arrays import PopulationArrays
+
+
+def test_resumed_game_matches_an_uninterrupted_run(tmp_path):
+    config = covidSim.SimConfig(40, 3, "mask", 15, ticks=200, wid=400, hei=300, seed=11)
+    expected = covidSim.run_headless(config)
+
+    path = str(tmp_path / "run.ckpt")
+    game = covidSim.build_game(config, headless=True)
+    first = covidSim.run_ticks(game, 80)
+    save_game(path, game, config)
+
+    # scramble the module's counters, like a fresh process would have them
+    covidSim.set_counters(0, 0, 0)
+    rest = resume(path)
+    assert first + rest == expected
+
+
+def test_resumed_arrays_match_an_uninterrupted_run(tmp_path):
+    config = covidSim.SimConfig(500, 10, "none", 200, ticks=150, wid=900, hei=900)
+
+    rng = np.random.default_rng(3)
+    pop = PopulationArrays.from_config(config, rng)
+    expected = pop.run(config.ticks, rng)
+    expected_x = pop.x.copy()
+
+    path = str(tmp_path / "arrays.ckpt")
+    rng = np.random.default_rng(3)
+    pop = PopulationArrays.from_config(config, rng)
+    first = pop.run(60, rng)
+    save_arrays(path, pop, rng, config)
+
+    pop, rng, loaded = load_arrays(path)
+    assert pop.tick == 60
+    assert first + pop.run(config.ticks - 60, rng) == expected
+    assert np.array_equal(pop.x, expected_x)
@@ -0,0 +1,38 @@
+"""File: test_covid_sim.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the covidSim people and the headless game loop.
+"""
+
+
+import covidSim
+from covidSim import SimConfig
+
+
+def test_people_stay_on_a_bigger_floor():
+    # the right and bottom walls are wherever the config puts them, not at
+    # 600
+    config = SimConfig(population=200, infected_pop=5, ticks=1500,
+                       wid=1200, hei=900, seed=3)
+    game = covidSim.build_game(config, headless=True)
+    covidSim.run_ticks(game, config.ticks)
+
+    people = list(game.get_objs())
+    assert len(people) == 200
+    for person in people:
+        rad = person.get_radius()
+        assert -rad <= person.x <= config.wid + rad
+        assert -rad <= person.y <= config.hei + rad
+
+
+def test_people_stay_on_a_smaller_floor():
+    config = SimConfig(population=50, infected_pop=1, ticks=1000,
+                       wid=300, hei=400, seed=4)
+    game = covidSim.build_game(config, headless=True)
+    covidSim.run_ticks(game, config.ticks)
+
+    for person in game.get_objs():
+        rad = person.get_radius()
+        assert -rad <= person.x <= config.wid + rad
+        assert -rad <= person.y <= config.hei + rad
@@ -0,0 +1,44 @@
+"""File: test_event_engine.py
+
+   Author: Brian Vu
+
+   Purpose: The event-driven engine has to give exactly the run that the
+            tick loop gives, for the same seed.
+"""
+
+
+import pytest
+
+import covidSim
+from event_engine import EventEngine, run_events
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("population, wid, hei", [(20, 600, 600), (40, 300, 200),
+                                                  (8, 900, 700)])
+def test_same_run_as_the_tick_loop(seed, population, wid, hei):
+    config = covidSim.SimConfig(population, 2, "mask", population // 3, ticks=300,
+                                wid=wid, hei=hei, seed=seed)
+    expected = covidSim.run_headless(config)
+    assert run_events(config) == expected
+
+
+def _people(game):
+    return [(o.id, o.x, o.y, o.number, getattr(o, "tagged", None), type(o).__name__)
+            for o in game.get_objs()]
+
+
+def test_same_people_at_the_end_and_fewer_ticks_run():
+    config = covidSim.SimConfig(15, 2, "none", 5, ticks=400, wid=800, hei=800, seed=7)
+
+    game = covidSim.build_game(config, headless=True)
+    covidSim.run_ticks(game, config.ticks)
+    expected = _people(game)
+
+    game = covidSim.build_game(config, headless=True)
+    engine = EventEngine(game, covidSim.INFECTION_RADIUS)
+    busy = engine.run(config.ticks - 1)
+    assert game.get_tick() == config.ticks
+    assert _people(game) == expected
+    # a sparse room: most ticks were skipped
+    assert busy < config.ticks // 2
@@ -0,0 +1,124 @@
+"""File: test_graphics.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the deadline-based frame scheduler in graphics.  There
+            is no display here, so the window is built without Tk, and the
+            clock is a fake one.
+"""
+
+
+import pytest
+
+import graphics as graphics_module
+from graphics import graphics, MAX_SKIPPED_FRAMES
+
+
+class _Clock:
+    """Stands in for the time module: sleep() just moves the clock."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class _Tk:
+    def update(self):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(graphics_module, "time", clock)
+    return clock
+
+
+def _window():
+    # the scheduler's part of graphics.__init__(), without a Tk window
+    win = graphics.__new__(graphics)
+    win.primary = _Tk()
+    win._deadline = None
+    win._fps_start = None
+    win._frames_shown = 0
+    win._skipped_in_row = 0
+    win._achieved_fps = 0.0
+    win.skipped_frames = 0
+    return win
+
+
+def test_frames_come_out_on_their_deadlines(clock):
+    win = _window()
+    start = clock.now
+    for frame in range(10):
+        clock.now += 0.03     # the work of the frame
+        win.update()
+        win.frame_space(10)
+    # the sleeps absorb the work: one frame every 0.1 s
+    assert clock.now == pytest.approx(start + 0.03 + 1.0)
+    assert clock.slept[1:] == pytest.approx([0.07] * 9)
+
+
+def test_a_slow_frame_is_made_up_by_the_next_ones(clock):
+    win = _window()
+    start = clock.now
+    win.frame_space(10)              # the next deadline is start + 0.2
+    clock.now += 0.15                # this frame overran by 0.05
+    win.frame_space(10)
+    assert clock.slept == pytest.approx([0.1])
+
+    clock.now += 0.01
+    win.frame_space(10)              # still on the old schedule
+    assert clock.now == pytest.approx(start + 0.3)
+
+
+def test_falling_a_whole_frame_behind_starts_the_schedule_over(clock):
+    win = _window()
+    win.frame_space(10)
+    clock.now += 0.5
+    win.frame_space(10)
+    behind = clock.now
+    clock.now += 0.01
+    win.frame_space(10)
+    assert clock.now == pytest.approx(behind + 0.1)
+
+
+def test_late_frames_are_skipped_at_most_a_few_in_a_row(clock):
+    win = _window()
+    assert not win.frame_is_late()    # no schedule yet
+    win.frame_space(10)
+    assert not win.frame_is_late()
+
+    clock.now += 10.0
+    skipped = 0
+    while win.frame_is_late():
+        win.skip_frame()
+        skipped += 1
+        clock.now += 1.0
+    assert skipped == MAX_SKIPPED_FRAMES
+    assert win.skipped_frames == MAX_SKIPPED_FRAMES
+
+    # drawing a frame lets the next late ones be skipped again
+    win.update()
+    assert win.frame_is_late()
+
+
+def test_fps_counts_the_frames_drawn(clock):
+    win = _window()
+    for frame in range(25):
+        if frame % 2 == 0:
+            win.update()
+        else:
+            win.skip_frame()
+        win.frame_space(20)
+    assert win.get_fps() == pytest.approx(10, rel=0.15)
@@ -0,0 +1,74 @@
+"""File: test_infection_log.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the InfectionLog and its indexes.
+"""
+
+
+import pytest
+
+import covidSim
+from infection_log import InfectionLog, MASK_PAIRS, mask_pair_code
+
+
+def _chain_log():
+    # 0 infects 1 and 2; 1 infects 3; 3 infects 4; 9 infects 8
+    log = InfectionLog(capacity=2)
+    log.record(1, 0, 1, 0, 3.0)
+    log.record(1, 9, 8, 3, 4.5)
+    log.record(4, 0, 2, 1, 7.0)
+    log.record(4, 1, 3, 2, 2.0)
+    log.record(9, 3, 4, 0, 1.0)
+    return log
+
+
+def test_the_columns_grow_past_their_capacity():
+    log = _chain_log()
+    assert len(log) == 5
+    assert list(log.column("target")) == [1, 8, 2, 3, 4]
+    assert list(log.column("distance")) == [3.0, 4.5, 7.0, 2.0, 1.0]
+    assert log.event(1) == {"tick": 1, "source": 9, "target": 8, "mask_pair": 3,
+                            "distance": 4.5}
+
+
+def test_events_by_tick():
+    log = _chain_log()
+    assert log.events_at(1) == range(0, 2)
+    assert log.events_at(4) == range(2, 4)
+    assert log.events_at(2, 8) == range(2, 4)
+    assert len(log.events_at(5)) == 0
+    assert log.events_at(0, 100) == range(0, 5)
+
+    # the tick index needs the ticks in order
+    with pytest.raises(AssertionError):
+        log.record(3, 5, 6, 0, 1.0)
+
+
+def test_events_by_agent():
+    log = _chain_log()
+    assert log.caused_by(0) == [0, 2]
+    assert log.caused_by(4) == []
+    assert log.infected_by(3) == 3
+    assert log.infected_by(0) is None
+    assert log.descendants(0) == [1, 2, 3, 4]
+    assert log.descendants(9) == [8]
+
+
+def test_mask_pair_codes():
+    for k, (source, target) in enumerate(MASK_PAIRS):
+        assert mask_pair_code(source, target) == k
+
+
+def test_a_run_logs_every_new_infection():
+    config = covidSim.SimConfig(150, 5, "none", 50, ticks=200, seed=8)
+    log = InfectionLog()
+    counts = covidSim.run_headless(config, log=log)
+    assert len(log) == counts[-1] - config.infected_pop > 0
+
+    # nobody catches it twice, and the ticks are in order
+    targets = list(log.column("target"))
+    assert len(set(targets)) == len(targets)
+    assert list(log.column("tick")) == sorted(log.column("tick"))
+    for k in range(len(log)):
+        assert log.infected_by(targets[k]) == k
@@ -0,0 +1,50 @@
+"""File: test_live_server.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the live-view HTTP / WebSocket server.
+"""
+
+
+import http.client
+import json
+import socket
+
+from live_server import LiveServer, OP_PING, OP_PONG
+
+
+def _address(server):
+    return server._httpd.server_address[:2]
+
+
+def test_stats_polls_share_one_connection():
+    with LiveServer(port=0) as server:
+        conn = http.client.HTTPConnection(*_address(server), timeout=5)
+        for k in range(3):
+            conn.request("GET", "/stats")
+            response = conn.getresponse()
+            assert response.status == 200 and response.version == 11
+            assert "viewers" in json.loads(response.read())
+        conn.close()
+
+
+def test_ping_sent_with_the_handshake_is_answered():
+    with LiveServer(port=0) as server:
+        sock = socket.create_connection(_address(server), timeout=5)
+        handshake = (b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        # a masked ping, in the same packet as the handshake
+        mask = b"\x01\x02\x03\x04"
+        payload = bytes(b ^ mask[k % 4] for k, b in enumerate(b"hi"))
+        sock.sendall(handshake + bytes([0x80 | OP_PING, 0x80 | 2]) + mask + payload)
+
+        data = b""
+        while b"\r\n\r\n" not in data:
+            data += sock.recv(4096)
+        head, rest = data.split(b"\r\n\r\n", 1)
+        assert head.startswith(b"HTTP/1.1 101")
+        while len(rest) < 4:
+            rest += sock.recv(4096)
+        assert rest[:4] == bytes([0x80 | OP_PONG, 2]) + b"hi"
+        sock.close()
@@ -0,0 +1,41 @@
+"""File: test_metapopulation.py
+
+   Author: Brian Vu
+
+   Purpose: A metapopulation run has to give the same results however many
+            worker processes step its venues.
+"""
+
+
+import covidSim
+from metapopulation import Metapopulation, MobilityMatrix
+
+
+def _venues():
+    configs = []
+    for v in range(6):
+        infected = 2 if v == 0 else 0
+        configs.append(covidSim.SimConfig(40, infected, "none", 10, wid=300, hei=300))
+    # out from every house to the two bars (4 and 5), and back home
+    out = MobilityMatrix(6, [(v, 4 + v % 2, 0.5) for v in range(4)])
+    home = MobilityMatrix(6, [(4, v, 0.1) for v in range(4)] +
+                             [(5, v, 0.1) for v in range(4)])
+    return configs, [out, home]
+
+
+def _run(workers, skip_idle=True):
+    configs, schedule = _venues()
+    with Metapopulation(configs, schedule, 25, seed=9, workers=workers,
+                        skip_idle=skip_idle) as meta:
+        counts = meta.run(180)
+        return counts, meta.census(), meta.venue_ticks_skipped
+
+
+def test_one_and_many_workers_give_the_same_run():
+    counts, census, skipped = _run(1)
+    assert counts[-1] > counts[0]
+    assert sum(people for people, infected in census) == 6 * 40
+    # the venues nobody contagious has reached yet were skipped
+    assert skipped > 0
+
+    assert _run(3) == (counts, census, skipped)
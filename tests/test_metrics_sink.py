@@ -0,0 +1,66 @@
+"""File: test_metrics_sink.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the per-column metrics files.
+"""
+
+
+import os
+
+import covidSim
+from metrics_sink import MetricsSink, read_metrics
+
+
+def test_appending_after_a_torn_flush_keeps_rows_in_line(tmp_path):
+    directory = str(tmp_path / "run")
+    with MetricsSink(directory, ("tick", "infected")) as sink:
+        for tick in range(3):
+            sink.record(tick, 10 * tick)
+
+    # the writer died after writing one more tick, but not its infected
+    # count (and half of a value after that)
+    with open(os.path.join(directory, "tick.i64"), "ab") as f:
+        f.write((3).to_bytes(8, "little") + b"\x04\x00\x00")
+
+    with MetricsSink(directory, ("tick", "infected")) as sink:
+        sink.record(3, 30)
+        sink.record(4, 40)
+
+    data = read_metrics(directory)
+    assert list(data["tick"]) == [0, 1, 2, 3, 4]
+    assert list(data["infected"]) == [0, 10, 20, 30, 40]
+
+
+def test_contacts_dont_depend_on_the_nearby_engine(tmp_path):
+    columns = {}
+    for engine in ("all_pairs", "grid", "lazy", "verlet"):
+        config = covidSim.SimConfig(50, 4, "none", 20, ticks=40, wid=250, hei=250,
+                                    seed=2, nearby_engine=engine)
+        game = covidSim.build_game(config, headless=True)
+        with MetricsSink(str(tmp_path / engine), covidSim.METRIC_COLUMNS) as sink:
+            covidSim.run_ticks(game, config.ticks, sink)
+        # writing metrics doesn't leave pair counting on
+        game.do_nearby_calls()
+        assert game.nearby_counts()[0] is None
+        columns[engine] = list(read_metrics(str(tmp_path / engine))["contacts"])
+
+    assert max(columns["grid"]) > 0
+    for engine in columns:
+        assert columns[engine] == columns["grid"]
+
+
+def test_count_contacts_matches_brute_force():
+    config = covidSim.SimConfig(60, 6, "none", 20, ticks=10, wid=200, hei=200, seed=4)
+    game = covidSim.build_game(config, headless=True)
+    covidSim.run_ticks(game, 10)
+
+    objs = list(game.get_objs())
+    expected = 0
+    for i in range(len(objs)):
+        for j in range(i + 1, len(objs)):
+            a, b = objs[i], objs[j]
+            contagious = isinstance(a, covidSim.Infected) or isinstance(b, covidSim.Infected)
+            close = (a.x - b.x)**2 + (a.y - b.y)**2 <= covidSim.INFECTION_RADIUS**2
+            expected += contagious and close
+    assert covidSim.count_contacts(game) == expected
@@ -0,0 +1,192 @@
+"""File: test_nearby_engines.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the engines behind Game.do_nearby_calls(): which
+            nearby() calls each one makes, and in what order.
+"""
+
+
+import math
+import random
+
+from three_shapes_game import Game
+
+
+class _Dot:
+    """A game object that sits still and writes down its nearby() calls.
+       It keeps going through its partners until it has had limit of them
+       (None means all of them).
+    """
+
+    def __init__(self, name, x, y, calls, limit=None):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.calls = calls
+        self.limit = limit
+        self.seen = 0
+
+    def get_xy(self):
+        return (self.x, self.y)
+
+    def get_radius(self):
+        return 1
+
+    def nearby(self, other, dist, game):
+        self.calls.append((self.name, other.name, dist))
+        self.seen += 1
+        return self.limit is None or self.seen < self.limit
+
+    def move(self, game):
+        pass
+
+    def edge(self, dir, position):
+        pass
+
+    def draw(self, win):
+        pass
+
+
+def _game(engine, points, cutoff=None, limit=None):
+    """Returns a headless game holding a _Dot at every point, and the list
+       their calls go to.
+    """
+    calls = []
+    game = Game("test", 30, 600, 600, headless=True)
+    game.config_set("nearby_engine", engine)
+    game.config_set("nearby_cutoff", cutoff)
+    for k, (x, y) in enumerate(points):
+        game.add_obj(_Dot(k, x, y, calls, limit))
+    game.execute_removes()
+    return game, calls
+
+
+def _dist(p, q):
+    # the same formula as the engines, so that the floats match exactly
+    return math.sqrt((p[0] - q[0])**2 + (p[1] - q[1])**2)
+
+
+def _points(count, seed, size=600):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(0, size), rnd.uniform(0, size)) for k in range(count)]
+
+
+def test_grid_delivers_the_pairs_within_the_cutoff_in_order():
+    points = _points(150, 1)
+    game, calls = _game("grid", points, cutoff=40)
+    game.do_nearby_calls()
+
+    expected = []
+    for i, p in enumerate(points):
+        partners = sorted((_dist(p, q), j) for j, q in enumerate(points)
+                          if j != i and _dist(p, q) <= 40)
+        expected += [(i, j, dist) for dist, j in partners]
+    assert calls == expected
+    assert game.nearby_counts() == (None, len(expected))
+
+
+def test_grid_measures_fewer_pairs_than_all_pairs():
+    points = _points(200, 2)
+    grid, grid_calls = _game("grid", points, cutoff=30)
+    grid.config_set("count_pairs", True)
+    grid.do_nearby_calls()
+
+    pairs, calls = grid.nearby_counts()
+    assert calls == len(grid_calls)
+    assert pairs < 200 * 199 / 4
+
+
+def test_grid_stops_a_left_hand_object_when_nearby_says_so():
+    points = _points(150, 3)
+    game, calls = _game("grid", points, cutoff=60, limit=1)
+    game.do_nearby_calls()
+
+    for i, p in enumerate(points):
+        mine = [(j, dist) for left, j, dist in calls if left == i]
+        partners = sorted((_dist(p, q), j) for j, q in enumerate(points)
+                          if j != i and _dist(p, q) <= 60)
+        assert mine == [(j, dist) for dist, j in partners[:1]]
+
+
+def _int_points(count, seed, size=200):
+    # small integer coordinates, so that there are plenty of ties
+    rnd = random.Random(seed)
+    return [(rnd.randint(0, size), rnd.randint(0, size)) for k in range(count)]
+
+
+def test_lazy_makes_the_same_calls_as_all_pairs():
+    for limit in (None, 1, 3):
+        points = _int_points(120, 4)
+        lazy, lazy_calls = _game("lazy", points, limit=limit)
+        lazy.do_nearby_calls()
+        full, full_calls = _game("all_pairs", points, limit=limit)
+        full.do_nearby_calls()
+        assert lazy_calls == full_calls
+
+
+def test_lazy_measures_only_the_pairs_it_needs():
+    points = _points(400, 5)
+    lazy, lazy_calls = _game("lazy", points, limit=1)
+    lazy.config_set("count_pairs", True)
+    lazy.do_nearby_calls()
+    full, full_calls = _game("all_pairs", points, limit=1)
+    full.config_set("count_pairs", True)
+    full.do_nearby_calls()
+
+    assert lazy.nearby_counts()[1] == full.nearby_counts()[1] == 400
+    # (all-pairs measures every pair once, for both of its objects)
+    assert full.nearby_counts()[0] == 400 * 399 // 2
+    assert lazy.nearby_counts()[0] < full.nearby_counts()[0] // 5
+
+
+def test_verlet_makes_the_same_calls_as_grid_while_people_move():
+    points = _points(200, 6, size=300)
+    verlet, verlet_calls = _game("verlet", points, cutoff=20)
+    grid, grid_calls = _game("grid", points, cutoff=20)
+    rnd = random.Random(6)
+    steps = [(rnd.choice((-2, 0, 2)), rnd.choice((-2, 0, 2))) for p in points]
+
+    for tick in range(40):
+        for game in (verlet, grid):
+            for dot, (dx, dy) in zip(game.get_objs(), steps):
+                dot.x += dx
+                dot.y += dy
+            game.do_nearby_calls()
+        assert verlet_calls == grid_calls
+    # the lists were reused for most of the ticks
+    assert 1 < verlet.nearby_rebuilds() < 40 / 2
+
+
+def test_verlet_rebuilds_only_when_it_has_to():
+    game, calls = _game("verlet", _points(50, 7), cutoff=20)
+    game.config_set("nearby_skin", 10)
+    assert game.nearby_rebuilds() == 0
+    game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 1
+
+    # everybody moves a bit, but nobody more than half the skin in all
+    dots = list(game.get_objs())
+    for tick in range(4):
+        for dot in dots:
+            dot.x += 1
+        game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 1
+
+    # one person goes past it
+    dots[3].y += 6
+    game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 2
+
+    # somebody new shows up
+    game.add_obj(_Dot(50, 10, 10, calls))
+    game.execute_removes()
+    game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 3
+
+    # so do new settings
+    game.config_set("nearby_cutoff", 25)
+    game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 4
+    game.do_nearby_calls()
+    assert game.nearby_rebuilds() == 4
@@ -0,0 +1,62 @@
+"""File: test_neighbor_index.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the UniformGrid spatial index.
+"""
+
+
+import math
+import random
+
+from neighbor_index import UniformGrid
+
+
+def test_cells_are_floored():
+    grid = UniformGrid(10)
+    assert grid.cell_of(0, 0) == (0, 0)
+    assert grid.cell_of(9.9, 10) == (0, 1)
+    assert grid.cell_of(-0.1, -10) == (-1, -1)
+
+
+def test_candidates_hold_every_point_within_a_cell():
+    rnd = random.Random(5)
+    points = [(rnd.uniform(-50, 250), rnd.uniform(-50, 250)) for k in range(300)]
+    grid = UniformGrid(20)
+    for k, (x, y) in enumerate(points):
+        grid.insert(k, x, y)
+
+    for x1, y1 in points[:50]:
+        found = {key for key, x, y in grid.candidates(x1, y1)}
+        near = {k for k, (x2, y2) in enumerate(points)
+                if math.hypot(x1 - x2, y1 - y2) <= 20}
+        assert near <= found
+        # ... and nothing outside the 3x3 block of cells
+        cx, cy = grid.cell_of(x1, y1)
+        for k in found:
+            col, row = grid.cell_of(*points[k])
+            assert abs(col - cx) <= 1 and abs(row - cy) <= 1
+
+
+def test_rings_partition_the_grid():
+    grid = UniformGrid(1)
+    for col in range(-3, 4):
+        for row in range(-3, 4):
+            grid.insert((col, row), col + 0.5, row + 0.5)
+
+    assert [key for key, x, y in grid.ring(0, 0, 0)] == [(0, 0)]
+    seen = []
+    for r in range(4):
+        ring = [key for key, x, y in grid.ring(0, 0, r)]
+        assert all(max(abs(col), abs(row)) == r for col, row in ring)
+        assert len(ring) == (8*r if r > 0 else 1)
+        seen += ring
+    assert len(seen) == len(set(seen)) == 49
+    assert grid.extent() == (-3, -3, 3, 3)
+
+
+def test_empty_grid():
+    grid = UniformGrid(5)
+    assert grid.extent() is None
+    assert list(grid.candidates(1, 1)) == []
+    assert list(grid.ring(0, 0, 2)) == []
@@ -0,0 +1,88 @@
+"""File: test_obstacle_map.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the furniture bitmap, and of people walking around the
+            furniture.
+"""
+
+
+import numpy as np
+
+import covidSim
+from obstacle_map import ObstacleMap
+from population_arrays import PopulationArrays
+from three_shapes_game import OBSTACLE, CLEAR
+
+
+# a 50x40 table with a 10x10 hole cut out of its middle
+SHAPES = [("rectangle", (100, 100, 50, 40, "black"), OBSTACLE),
+          ("rectangle", (120, 115, 10, 10, "white"), CLEAR)]
+
+
+def test_the_bitmap_is_the_furniture():
+    obstacles = ObstacleMap(300, 200, 0, SHAPES)
+    expected = np.zeros((200, 300), dtype=bool)
+    expected[100:140, 100:150] = True
+    expected[115:125, 120:130] = False
+    assert np.array_equal(obstacles.bitmap, expected)
+
+
+def test_the_furniture_is_grown_by_the_radius():
+    obstacles = ObstacleMap(300, 200, 5, SHAPES)
+    assert obstacles.blocked(95, 120)          # 5 left of the table
+    assert not obstacles.blocked(94, 120)
+    assert obstacles.blocked(125, 120)         # (the hole is too small)
+    assert obstacles.blocked(150 + 4, 139)
+    assert not obstacles.blocked(-5, 120) and not obstacles.blocked(500, 120)
+
+    xs = np.array([95, 94, 125, -5, 500])
+    ys = np.array([120, 120, 120, 120, 120])
+    assert list(obstacles.blocked_many(xs, ys)) == [True, False, True, False, False]
+
+
+def test_steps_reflect_off_the_furniture():
+    obstacles = ObstacleMap(300, 200, 0, SHAPES)
+    assert obstacles.bounce(98, 120, 2, 0) == (-2, 0)      # side
+    assert obstacles.bounce(120, 98, 0, 2) == (0, -2)      # top
+    assert obstacles.bounce(98, 110, 2, 2) == (-2, 2)      # side, going down
+    assert obstacles.bounce(98, 98, 2, 2) == (-2, -2)      # corner
+    assert obstacles.bounce(50, 50, 2, 2) is None          # nothing there
+    assert obstacles.bounce(110, 110, 2, 2) is None        # already inside
+
+
+def test_bounce_many_is_bounce():
+    obstacles = ObstacleMap(300, 200, 3, SHAPES)
+    rng = np.random.default_rng(2)
+    x = rng.integers(80, 170, size=2000)
+    y = rng.integers(80, 160, size=2000)
+    moves = np.array([covidSim.MOVES[d] for d in range(1, 9)])
+    step = moves[rng.integers(0, 8, size=2000)]
+    which, new_dx, new_dy = obstacles.bounce_many(x, y, step[:, 0], step[:, 1])
+
+    k = 0
+    for i in range(2000):
+        expected = obstacles.bounce(int(x[i]), int(y[i]), int(step[i, 0]), int(step[i, 1]))
+        assert which[i] == (expected is not None)
+        if expected is not None:
+            assert (new_dx[k], new_dy[k]) == expected
+            k += 1
+
+
+def test_people_never_walk_into_the_furniture():
+    config = covidSim.SimConfig(300, 10, "none", 100, seed=6, obstacles=True)
+    game = covidSim.build_game(config, headless=True)
+    game.execute_removes()
+    people = list(game.get_objs())
+    outside = [p for p in people if not game.obstacles.blocked(p.x, p.y)]
+    assert len(outside) > 0.7 * len(people)
+    for tick in range(300):
+        covidSim.run_ticks(game, 1)
+        for p in outside:
+            assert not game.obstacles.blocked(p.x, p.y)
+
+    pop = PopulationArrays.from_config(config, np.random.default_rng(6))
+    outside = ~pop.obstacles.blocked_many(pop.x, pop.y)
+    for tick in range(300):
+        pop.step(np.random.default_rng(tick))
+        assert not (pop.obstacles.blocked_many(pop.x, pop.y) & outside).any()
@@ -0,0 +1,111 @@
+"""File: test_parallel_arrays.py
+
+   Author: Brian Vu
+
+   Purpose: The strip-decomposed engine has to give the serial
+            PopulationArrays run, however many workers it uses, and each
+            worker should only do the work of its own strip.
+"""
+
+
+import numpy as np
+
+import covidSim
+from covidSim import INFECTION_RADIUS
+from parallel_arrays import ParallelRunner, strip_bounds
+from population_arrays import PopulationArrays, nearest_partners, tick_draws
+
+
+def _serial(config, seed, ticks):
+    rng = np.random.default_rng(seed)
+    pop = PopulationArrays.from_config(config, rng)
+    counts = pop.run(ticks, rng)
+    return counts, pop
+
+
+def test_one_and_many_workers_match_the_serial_run():
+    config = covidSim.SimConfig(600, 12, "none", 250, wid=900, hei=600)
+    ticks = 60
+    expected, serial = _serial(config, 4, ticks)
+    assert expected[-1] > config.infected_pop   # (there are infections to compare)
+
+    for workers in (1, 3):
+        rng = np.random.default_rng(4)
+        pop = PopulationArrays.from_config(config, rng)
+        with ParallelRunner(pop, workers) as runner:
+            assert runner.workers() == workers
+            assert runner.run(ticks, rng) == expected
+            # (the runner keeps pop up to date)
+            assert np.array_equal(pop.x, serial.x)
+            assert np.array_equal(pop.y, serial.y)
+            assert np.array_equal(pop.state, serial.state)
+
+
+def test_strips_cover_the_floor():
+    bounds = strip_bounds(900, 3)
+    assert len(bounds) == 3
+    assert bounds[0][0] <= 0 and bounds[-1][1] >= 900
+    for (lo, hi), (next_lo, next_hi) in zip(bounds, bounds[1:]):
+        assert hi == next_lo
+
+
+def test_workers_only_look_at_their_strip_and_halo():
+    config = covidSim.SimConfig(900, 30, "none", 300, wid=900, hei=600)
+    rng = np.random.default_rng(9)
+    pop = PopulationArrays.from_config(config, rng)
+    with ParallelRunner(pop, 3) as runner:
+        bounds = strip_bounds(pop.wid, 3)
+        for tick in range(3):
+            x = pop.x.copy()
+            runner.step(rng)
+            expected = [int(np.count_nonzero((x >= x0 - INFECTION_RADIUS) &
+                                             (x < x1 + INFECTION_RADIUS)))
+                        for x0, x1 in bounds]
+            assert runner.loads() == expected
+            assert max(runner.loads()) < len(pop) // 2
+
+
+class _Column:
+    """An int column that only allows fancy indexing, and remembers which
+       rows were read.
+    """
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+        self.read = set()
+
+    def __getitem__(self, rows):
+        self.read.update(np.asarray(rows).tolist())
+        return self.values[rows]
+
+
+def test_nearest_partners_only_reads_the_rows_it_was_given():
+    rng = np.random.default_rng(3)
+    x = _Column(rng.integers(0, 300, size=400))
+    y = _Column(rng.integers(0, 300, size=400))
+    sources = np.arange(0, 40)
+    candidates = np.arange(20, 100)
+    src, partner, dist = nearest_partners(x, y, sources, candidates, INFECTION_RADIUS)
+
+    assert len(src) > 0
+    assert x.read <= set(range(100)) and y.read <= set(range(100))
+    expected = nearest_partners(x.values, y.values, sources, candidates,
+                                INFECTION_RADIUS)
+    for got, want in zip((src, partner, dist), expected):
+        assert np.array_equal(got, want)
+
+
+def test_tick_draws_of_some_rows_are_the_same_as_of_all_of_them():
+    rows = np.arange(1000)
+    rolls, choices = tick_draws(77, rows)
+    assert rolls.min() >= 0 and rolls.max() <= 100
+    assert choices.shape == (4, 1000)
+    assert choices.min() >= 0 and choices.max() <= 4
+
+    some = rows[::-7]
+    some_rolls, some_choices = tick_draws(77, some)
+    assert np.array_equal(some_rolls, rolls[some])
+    assert np.array_equal(some_choices, choices[:, some])
+
+    # a different key is a different tick
+    assert not np.array_equal(tick_draws(78, rows)[0], rolls)
@@ -0,0 +1,96 @@
+"""File: test_population_arrays.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the move, edge and infect kernels of PopulationArrays.
+"""
+
+
+import numpy as np
+
+import covidSim
+from population_arrays import (PopulationArrays, EDGE_CHOICES, HEALTHY,
+                               INFECTED, STEPS, TAGGED)
+
+
+def _pop(xs, ys, direction=None, mask=None, state=None, wid=600, hei=600):
+    n = len(xs)
+    if direction is None:
+        direction = np.ones(n)
+    if mask is None:
+        mask = np.zeros(n, dtype=bool)
+    if state is None:
+        state = np.full(n, HEALTHY)
+    return PopulationArrays(xs, ys, direction, mask, state, wid, hei)
+
+
+def test_from_config_spawns_masks_then_no_masks_then_infected():
+    config = covidSim.SimConfig(100, 10, "mask", 30)
+    pop = PopulationArrays.from_config(config, np.random.default_rng(1))
+    assert len(pop) == 100
+    assert pop.mask[:30].all() and not pop.mask[30:90].any() and pop.mask[90:].all()
+    assert (pop.state[:90] == HEALTHY).all() and (pop.state[90:] == INFECTED).all()
+    assert pop.cur_infected() == 10
+
+
+def test_move_takes_one_step_in_each_direction():
+    pop = _pop(np.full(8, 300), np.full(8, 300), direction=np.arange(1, 9))
+    pop.step_move()
+    assert np.array_equal(pop.x, 300 + STEPS[1:, 0])
+    assert np.array_equal(pop.y, 300 + STEPS[1:, 1])
+    for d in range(1, 9):
+        assert tuple(STEPS[d]) == covidSim.MOVES[d]
+
+
+def test_edges_pick_from_the_walls_choices_and_the_last_wall_wins():
+    # left wall, top wall, bottom-right corner, and nobody
+    pop = _pop([5, 300, 595, 300], [300, 5, 595, 300], wid=600, hei=600)
+    choices = np.array([[0, 1, 2, 3],
+                        [1, 2, 3, 4],
+                        [2, 3, 4, 0],
+                        [3, 4, 0, 1]])
+    pop.step_edges(choices)
+    assert pop.direction[0] == EDGE_CHOICES[0][0]
+    assert pop.direction[1] == EDGE_CHOICES[1][2]
+    assert pop.direction[2] == EDGE_CHOICES[3][0]     # bottom beats right
+    assert pop.direction[3] == 1
+
+
+def test_only_the_nearest_neighbor_can_be_infected():
+    # 0 is infected; 1 is its nearest neighbor but already tagged, so 2
+    # (healthy, a bit further) is safe
+    pop = _pop([100, 105, 110], [100, 100, 100],
+               state=np.array([INFECTED, TAGGED, HEALTHY]))
+    src, targets, dist = pop.step_infect(np.zeros(3, dtype=np.int64))
+    assert len(targets) == 0
+    assert (pop.state == [INFECTED, TAGGED, HEALTHY]).all()
+
+
+def test_rolls_are_checked_against_the_masks():
+    # no mask -> no mask is 95%; mask -> mask is 2%
+    for masks, roll, caught in (((False, False), 94, True),
+                                ((False, False), 95, False),
+                                ((True, True), 1, True),
+                                ((True, True), 2, False)):
+        pop = _pop([100, 110], [100, 100], mask=np.array(masks),
+                   state=np.array([INFECTED, HEALTHY]))
+        src, targets, dist = pop.step_infect(np.array([roll, 100]))
+        assert (len(targets) == 1) == caught
+        if caught:
+            assert list(src) == [0] and list(targets) == [1] and dist[0] == 10.0
+            assert pop.state[1] == TAGGED
+
+
+def test_a_target_caught_twice_is_credited_to_the_lowest_source():
+    pop = _pop([90, 100, 110, 300], [100, 100, 100, 300],
+               state=np.array([INFECTED, HEALTHY, INFECTED, HEALTHY]))
+    src, targets, dist = pop.step_infect(np.zeros(4, dtype=np.int64))
+    assert list(src) == [0] and list(targets) == [1]
+    assert pop.count(TAGGED) == 1
+
+
+def test_nobody_further_than_the_radius_is_infected():
+    pop = _pop([100, 100 + covidSim.INFECTION_RADIUS + 1], [100, 100],
+               state=np.array([INFECTED, HEALTHY]))
+    src, targets, dist = pop.step_infect(np.zeros(2, dtype=np.int64))
+    assert len(targets) == 0
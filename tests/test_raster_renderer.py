@@ -0,0 +1,131 @@
+"""File: test_raster_renderer.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the offscreen (numpy) renderer.
+"""
+
+
+import json
+import os
+import random
+import struct
+import zlib
+
+import numpy as np
+
+import covidSim
+from population_arrays import HEALTHY, INFECTED
+from raster_renderer import (OffscreenRenderer, FrameWriter, RasterCanvas, STATE_COLORS,
+                             _rgb, encode_png, export_run)
+from three_shapes_game import FLOOR_COLOR, STATS_HEIGHT
+
+
+STATS = (10, 9, 0, 9, 1, "no", 1, 0)
+
+
+def test_frame_follows_the_floor_size():
+    renderer = OffscreenRenderer(800, 500)
+    frame = renderer.render([], [], [], [], STATS)
+    assert frame.shape == (500 + STATS_HEIGHT, 800, 3)
+
+    floor = tuple(_rgb(FLOOR_COLOR))
+    # the bottom right corner of the floor is floor, not stats panel
+    assert tuple(frame[499, 799]) == floor
+    # and the stats panel starts right below it, all the way across
+    assert tuple(frame[520, 790]) != floor
+    assert tuple(frame[520, 790]) == tuple(frame[520, 300])
+
+
+def test_building_sprites_leaves_the_global_random_alone():
+    random.seed(5)
+    expected = random.random()
+    random.seed(5)
+    OffscreenRenderer(600, 600)
+    assert random.random() == expected
+
+
+def _decode_png(data):
+    """Decodes the kind of PNG encode_png() writes (8-bit RGB, filter 0),
+       checking every chunk's CRC.
+    """
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos = 8
+    idat = b""
+    while True:
+        length, = struct.unpack(">I", data[pos:pos+4])
+        kind = data[pos+4:pos+8]
+        body = data[pos+8:pos+8+length]
+        crc, = struct.unpack(">I", data[pos+8+length:pos+12+length])
+        assert crc == zlib.crc32(kind + body) & 0xffffffff
+        pos += 12 + length
+        if kind == b"IHDR":
+            wid, hei, depth, color, comp, filt, interlace = struct.unpack(">IIBBBBB", body)
+            assert (depth, color, interlace) == (8, 2, 0)
+        elif kind == b"IDAT":
+            idat += body
+        elif kind == b"IEND":
+            break
+    rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(hei, 1 + 3*wid)
+    assert (rows[:, 0] == 0).all()
+    return rows[:, 1:].reshape(hei, wid, 3)
+
+
+def test_png_decodes_to_the_frame():
+    pixels = np.random.default_rng(1).integers(0, 256, size=(5, 7, 3), dtype=np.uint8)
+    assert np.array_equal(_decode_png(encode_png(pixels)), pixels)
+
+    frame = OffscreenRenderer(200, 150).render([50], [60], [INFECTED], [False], STATS)
+    assert np.array_equal(_decode_png(encode_png(frame, level=6)), frame)
+
+
+def test_rectangles_cover_exactly_their_pixels():
+    canvas = RasterCanvas(20, 10)
+    canvas.rectangle(3, 2, 4, 5, "white")
+    canvas.rectangle(18, 8, 10, 10, "#102030")     # clipped
+    expected = np.zeros((10, 20), dtype=bool)
+    expected[2:7, 3:7] = True
+    expected[8:, 18:] = True
+    assert np.array_equal(canvas.painted, expected)
+    assert tuple(canvas.pixels[4, 4]) == (255, 255, 255)
+    assert tuple(canvas.pixels[9, 19]) == (0x10, 0x20, 0x30)
+
+
+def test_people_are_drawn_in_their_state_color_and_the_last_one_wins():
+    renderer = OffscreenRenderer(300, 300)
+    empty = renderer.render([], [], [], [], STATS)
+    healthy = renderer.render([150], [150], [HEALTHY], [False], STATS)
+    infected = renderer.render([150], [150], [INFECTED], [False], STATS)
+
+    # the person changes the pixels around its spot, and nothing else
+    changed = (healthy != empty).any(axis=2)
+    ys, xs = np.nonzero(changed)
+    assert len(ys) > 0
+    assert abs(ys.mean() - 150) < 15 and abs(xs.mean() - 150) < 15
+    assert tuple(healthy[150, 150]) == tuple(_rgb(STATE_COLORS[HEALTHY]))
+    assert tuple(infected[150, 150]) == tuple(_rgb(STATE_COLORS[INFECTED]))
+
+    both = renderer.render([150, 150], [150, 150], [HEALTHY, INFECTED], [False, False], STATS)
+    assert np.array_equal(both, infected)
+
+
+def test_raw_frames_and_their_size(tmp_path):
+    frames = [np.full((4, 6, 3), k, dtype=np.uint8) for k in range(3)]
+    with FrameWriter(str(tmp_path), "raw") as writer:
+        for frame in frames:
+            writer.write(frame)
+    with open(os.path.join(str(tmp_path), "frames.json")) as f:
+        assert json.load(f) == {"width": 6, "height": 4, "frames": 3, "pix_fmt": "rgb24"}
+    raw = np.fromfile(os.path.join(str(tmp_path), "frames.rgb"), dtype=np.uint8)
+    assert np.array_equal(raw.reshape(3, 4, 6, 3), np.stack(frames))
+
+
+def test_export_run_writes_every_nth_tick(tmp_path):
+    config = covidSim.SimConfig(30, 2, "none", 10, ticks=10, wid=200, hei=160, seed=1)
+    for engine in ("objects", "arrays"):
+        directory = os.path.join(str(tmp_path), engine)
+        assert export_run(config, directory, every=3, engine=engine) == 4
+        names = sorted(os.listdir(directory))
+        assert names == ["frame_%06d.png" % k for k in range(4)]
+        with open(os.path.join(directory, names[0]), "rb") as f:
+            assert _decode_png(f.read()).shape == (160 + STATS_HEIGHT, 200, 3)
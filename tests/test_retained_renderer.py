@@ -0,0 +1,135 @@
+"""File: test_retained_renderer.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the "retained" renderer of Game: after the first frame,
+            only what changed is touched on the canvas.
+"""
+
+
+from three_shapes_game import Game
+
+
+class _FakeWindow:
+    """Records what the renderer does to the canvas."""
+
+    def __init__(self):
+        self.items = 0
+        self.clears = 0
+        self.tag = None
+        self.tagged = []
+        self.moves = []
+        self.fills = []
+        self.deleted = []
+
+    def _item(self, *args, **kwargs):
+        self.items += 1
+        self.tagged.append(self.tag)
+        return self.items
+
+    ellipse = rectangle = line = triangle = text = _item
+
+    def clear(self):
+        self.clears += 1
+
+    def set_tag(self, tag):
+        self.tag = tag
+
+    def raise_item(self, item):
+        pass
+
+    def delete(self, item):
+        self.deleted.append(item)
+
+    def move_item(self, item, dx, dy):
+        self.moves.append((item, dx, dy))
+
+    def set_fill(self, item, fill):
+        self.fills.append((item, fill))
+
+
+class _Dot:
+    def __init__(self, x, y, color):
+        self.x = x
+        self.y = y
+        self.color = color
+
+    def get_xy(self):
+        return (self.x, self.y)
+
+    def get_radius(self):
+        return 5
+
+    def draw(self, win):
+        win.line(self.x, self.y, self.x + 1, self.y)
+        return win.ellipse(self.x, self.y, 10, 10, self.color)
+
+
+STATS = (10, 8, 4, 4, 2, "none", 2, 0)
+
+
+def _game(dots):
+    game = Game("test", 30, 600, 600, headless=True)
+    game.config_set("renderer", "retained")
+    game._win = _FakeWindow()
+    for dot in dots:
+        game.add_obj(dot)
+    game.execute_removes()
+    return game, game._win
+
+
+def test_the_first_frame_draws_everything_once():
+    dots = [_Dot(100, 100, "white"), _Dot(200, 200, "red")]
+    game, win = _game(dots)
+    game._draw_retained(STATS)
+    assert win.clears == 1
+    assert win.tagged.count(("objs", "obj0")) == 2
+    assert win.tagged.count(("objs", "obj1")) == 2
+
+    # nothing changed: nothing is drawn, moved, recolored or deleted
+    items = win.items
+    deleted = list(win.deleted)
+    game._draw_retained(STATS)
+    assert win.items == items and win.clears == 1
+    assert win.moves == [] and win.fills == [] and win.deleted == deleted
+
+
+def test_moves_and_recolors_only_the_objects_that_changed():
+    dots = [_Dot(100, 100, "white"), _Dot(200, 200, "white"), _Dot(300, 300, "white")]
+    game, win = _game(dots)
+    game._draw_retained(STATS)
+    body_of_2 = win.items
+
+    dots[0].x += 2
+    dots[0].y -= 2
+    dots[2].color = "red"
+    items = win.items
+    game._draw_retained(STATS)
+
+    assert win.items == items
+    assert win.moves == [("obj0", 2, -2)]
+    assert win.fills == [(body_of_2, "red")]
+
+
+def test_stats_are_redrawn_only_when_they_change():
+    game, win = _game([_Dot(100, 100, "white")])
+    game._draw_retained(STATS)
+    game._draw_retained(STATS)
+    assert win.deleted == ["stats"]
+
+    items = win.items
+    game._draw_retained(STATS[:-1] + (1,))
+    assert win.deleted == ["stats", "stats"]
+    assert win.items > items
+    assert all(tag == "stats" for tag in win.tagged[items:])
+
+
+def test_removed_objects_lose_their_items():
+    dots = [_Dot(100, 100, "white"), _Dot(200, 200, "white")]
+    game, win = _game(dots)
+    game._draw_retained(STATS)
+
+    game.remove_obj(dots[0])
+    game.execute_removes()
+    game._draw_retained(STATS)
+    assert win.deleted[-1] == "obj0"
@@ -0,0 +1,116 @@
+"""File: test_shm_viewer.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the shared-memory snapshot the viewer reads.
+"""
+
+
+import numpy as np
+
+from shm_viewer import SnapshotWriter, SharedSnapshot, _People, STATE_COLORS
+
+
+def _publish(writer, tick, n):
+    x = np.arange(n, dtype=np.int32) + tick
+    y = np.arange(n, dtype=np.int32) * 2
+    flags = np.zeros(n, dtype=np.uint8)
+    writer.publish(tick, x, y, flags, (n, tick, 0, 0, 0, 0, 0, 0))
+
+
+def test_read_gets_the_latest_snapshot_and_its_stats():
+    writer = SnapshotWriter(5)
+    reader = SharedSnapshot(name=writer.snapshot.name)
+    try:
+        assert reader.read() is None
+        for tick in range(4):
+            _publish(writer, tick, 5)
+            tick_read, xs, ys, flags, stats = reader.read()
+            # the stats come from the same slot as the positions
+            assert tick_read == tick and stats[1] == tick
+            assert list(xs) == [k + tick for k in range(5)]
+
+        # a copy, not a view of the slot the writer will reuse
+        tick_read, xs, ys, flags, stats = reader.read()
+        _publish(writer, 10, 5)
+        _publish(writer, 11, 5)
+        assert list(xs) == [k + 3 for k in range(5)]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_read_drops_a_slot_being_rewritten():
+    writer = SnapshotWriter(3)
+    reader = SharedSnapshot(name=writer.snapshot.name)
+    try:
+        _publish(writer, 0, 3)
+        meta = writer.snapshot.slots[writer.snapshot.get("front")][0]
+        meta[0] += 1     # the writer is in the middle of it
+        assert reader.read() is None
+        meta[0] += 1
+        assert reader.read()[0] == 0
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_finish_sets_done():
+    writer = SnapshotWriter(2)
+    reader = SharedSnapshot(name=writer.snapshot.name)
+    try:
+        _publish(writer, 0, 2)
+        assert reader.get("done") == 0
+        writer.finish()
+        assert reader.get("done") == 1
+    finally:
+        reader.close()
+        writer.close()
+
+
+class _FakeWindow:
+    """Records what the viewer does to the canvas."""
+
+    def __init__(self):
+        self.items = 0
+        self.moves = []
+        self.fills = []
+
+    def _item(self, *args):
+        self.items += 1
+        return self.items
+
+    ellipse = rectangle = line = triangle = _item
+
+    def set_tag(self, tag):
+        pass
+
+    def move_item(self, item, dx, dy):
+        self.moves.append((item, dx, dy))
+
+    def set_fill(self, item, fill):
+        self.fills.append((item, fill))
+
+
+def test_only_changed_people_are_touched():
+    win = _FakeWindow()
+    xs = np.array([10, 20, 30, 40], dtype=np.int32)
+    ys = np.array([5, 5, 5, 5], dtype=np.int32)
+    flags = np.array([0, 1, 2, 0], dtype=np.uint8)
+    people = _People(win, xs, ys, flags, 600, 600)
+    body_of_3 = people.bodies[3]
+
+    xs2 = xs.copy()
+    xs2[1] += 2
+    ys2 = ys.copy()
+    ys2[2] -= 4
+    flags2 = flags.copy()
+    flags2[3] = 2 << 1     # tagged
+    people.update(win, xs2, ys2, flags2)
+
+    assert win.moves == [("obj1", 2, 0), ("obj2", 0, -4)]
+    assert win.fills == [(body_of_3, STATE_COLORS[2])]
+
+    # nothing changed: nothing is touched
+    people.update(win, xs2, ys2, flags2)
+    assert len(win.moves) == 2 and len(win.fills) == 1
@@ -0,0 +1,54 @@
+"""File: test_sim_random.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the seeded SimRandom generator, and of seeded runs.
+"""
+
+
+import random
+
+import covidSim
+from sim_random import SimRandom
+
+
+def test_same_seed_same_stream():
+    a = SimRandom(12)
+    b = SimRandom(12)
+    assert [a.randint(0, 100) for k in range(5000)] == [b.randint(0, 100) for k in range(5000)]
+
+    c = SimRandom(13)
+    a = SimRandom(12)
+    assert [a.random() for k in range(100)] != [c.random() for k in range(100)]
+
+
+def test_randint_includes_both_ends():
+    rnd = SimRandom(1)
+    draws = [rnd.randint(3, 7) for k in range(2000)]
+    assert set(draws) == {3, 4, 5, 6, 7}
+
+    assert {rnd.choice("abc") for k in range(200)} == {"a", "b", "c"}
+
+
+def test_setstate_rewinds_the_stream():
+    # (a small block, so that the state crosses a refill)
+    rnd = SimRandom(5, block=7)
+    for k in range(10):
+        rnd.random()
+    state = rnd.getstate()
+    first = [rnd.random() for k in range(20)]
+    rnd.setstate(state)
+    assert [rnd.random() for k in range(20)] == first
+
+
+def test_seeded_runs_repeat_and_leave_the_global_random_alone():
+    config = covidSim.SimConfig(80, 4, "none", 20, ticks=150, seed=21)
+    random.seed(0)
+    before = random.getstate()
+    first = covidSim.run_headless(config)
+    assert random.getstate() == before
+
+    assert covidSim.run_headless(config) == first
+
+    config.seed = 22
+    assert covidSim.run_headless(config) != first
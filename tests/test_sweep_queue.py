@@ -0,0 +1,75 @@
+"""File: test_sweep_queue.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the SQLite sweep queue.
+"""
+
+
+import sqlite3
+import sys
+
+from sweep_queue import SweepQueue, work, main, DONE, PENDING
+
+
+def test_extending_a_sweep_doesnt_duplicate_jobs(tmp_path):
+    path = str(tmp_path / "sweep.db")
+    queue = SweepQueue(path)
+    assert queue.add_sweep("masks", {"healthy_masks": [0, 10], "ticks": [20]}, 2) == 4
+    queue.close()
+    assert work(path) == 4
+
+    # one more point, and one more replicate of every point
+    queue = SweepQueue(path)
+    added = queue.add_sweep("masks", {"healthy_masks": [0, 5, 10], "ticks": [20]}, 3)
+    assert added == 9 - 4
+    queue.close()
+    assert work(path) == 5
+
+    queue = SweepQueue(path)
+    assert queue.status("masks")[DONE] == 9
+    rows = queue._db.execute(
+        "SELECT params, COUNT(*) FROM jobs WHERE sweep = ? GROUP BY params",
+        ("masks",)).fetchall()
+    assert sorted(count for params, count in rows) == [3, 3, 3]
+
+    # adding the same sweep again is a no-op
+    assert queue.add_sweep("masks", {"healthy_masks": [0, 5, 10], "ticks": [20]}, 3) == 0
+
+    # the summary has one row per point and tick, over 3 replicates each
+    summary = queue.summary("masks")
+    assert len(summary) == 3 * 20
+    queue.close()
+
+
+class _Unprintable(Exception):
+    def __str__(self):
+        raise ValueError("no")
+
+
+def test_fail_rolls_back_on_error(tmp_path):
+    queue = SweepQueue(str(tmp_path / "sweep.db"))
+    queue.add_sweep("s", {"ticks": [5]}, 1)
+    (job_id, params, seed, engine), = queue.claim("w")
+    try:
+        queue.fail(job_id, _Unprintable())
+    except ValueError:
+        pass
+    assert not queue._db.in_transaction
+    queue.fail(job_id, "boom")
+    assert queue.status("s")[PENDING] == 1
+    queue.close()
+
+
+def test_cli_can_turn_on_wal(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "sweep.db")
+    monkeypatch.setattr(sys, "argv", ["sweep_queue.py", path, "add", "s",
+                                      "--grid", '{"ticks": [5]}', "-r", "2", "--wal"])
+    main()
+    monkeypatch.setattr(sys, "argv", ["sweep_queue.py", path, "work", "-p", "1", "--wal"])
+    main()
+    assert "ran 2 jobs" in capsys.readouterr().out
+
+    db = sqlite3.connect(path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    db.close()
@@ -0,0 +1,62 @@
+"""File: test_tick_profiler.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the per-tick profiler, and of what the Game counts
+            with and without one.
+"""
+
+
+import csv
+
+import covidSim
+from tick_profiler import TickProfiler
+
+
+def _run_ticks(prof, ticks):
+    for tick in range(ticks):
+        prof.start_tick()
+        prof.add("move", 0.001)
+    prof.close()
+
+
+def test_json_dump_keeps_no_rows(tmp_path):
+    prof = TickProfiler(window=10, dump_path=str(tmp_path / "prof.json"))
+    for tick in range(50):
+        prof.start_tick()
+    assert len(prof._pending_rows) == 0
+    prof.close()
+
+
+def test_csv_rows_are_written_out_every_window(tmp_path):
+    path = str(tmp_path / "prof.csv")
+    prof = TickProfiler(window=10, dump_path=path)
+    for tick in range(25):
+        prof.start_tick()
+        assert len(prof._pending_rows) < 10
+    prof.close()
+
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row["tick"]) for row in rows] == list(range(25))
+
+
+def test_pairs_are_only_counted_when_asked_for():
+    for engine in ("all_pairs", "grid", "lazy", "verlet"):
+        config = covidSim.SimConfig(60, 5, "none", 10, ticks=3, wid=150, hei=150, seed=1,
+                                    nearby_engine=engine)
+        game = covidSim.build_game(config, headless=True)
+        game.do_nearby_calls()
+        game.do_move_calls()
+        game.do_edge_calls()
+        game.execute_removes()
+
+        game.do_nearby_calls()
+        assert game.nearby_counts()[0] is None
+
+        prof = TickProfiler()
+        game.config_set("profiler", prof)
+        game.do_nearby_calls()
+        prof.close()
+        pairs = game.nearby_counts()[0]
+        assert pairs > 0 and prof.summary()["pairs"]["mean"] == pairs
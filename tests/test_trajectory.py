@@ -0,0 +1,44 @@
+"""File: test_trajectory.py
+
+   Author: Brian Vu
+
+   Purpose: Tests of the trajectory file format.
+"""
+
+
+import numpy as np
+import pytest
+
+from trajectory import Trajectory, TrajectoryRecorder, replay
+
+
+def _recorder(path):
+    return TrajectoryRecorder(path, [1, 2, 3], [0, 1, 0], [0, 0, 1], keyframe_every=4)
+
+
+def test_empty_recording(tmp_path):
+    path = str(tmp_path / "empty.traj")
+    _recorder(path).close()
+
+    traj = Trajectory(path)
+    assert traj.ticks() is None
+    traj.seek(10)
+    assert traj.next() is False
+    traj.close()
+
+    with pytest.raises(ValueError):
+        replay(path)
+
+
+def test_ticks_and_seek(tmp_path):
+    path = str(tmp_path / "run.traj")
+    with _recorder(path) as rec:
+        for tick in range(10):
+            rec.record(tick, np.array([tick, 5, 6]), np.array([1, 2, 3]),
+                       np.array([0, 1, 0], dtype=np.int8))
+
+    traj = Trajectory(path)
+    assert traj.ticks() == (0, 9)
+    traj.seek(6)
+    assert traj.tick == 6 and list(traj.x) == [6, 5, 6]
+    traj.close()
@@ -9,37 +9,136 @@
 """
 
 
+import heapq
 import math        # for sqrt
+import random
+import time
 
 from graphics import graphics
+from neighbor_index import UniformGrid
+
+
+# the height of the stats panel below the floor (see display_stats())
+STATS_HEIGHT = 300
 
 
 class Game:
-    def __init__(self, title, frame_rate, wid, hei):
+    def __init__(self, title, frame_rate, wid, hei, headless=False, rng=None):
         """Constructor.  Initializes the game to have zero objets; call
            add_obj() to add objects to the system.
 
-           Parameters: the width and height of the window
+           Parameters: the width and height of the window; if headless is
+           True, no window is ever created, and draw() is a no-op (so the
+           game loop runs as fast as the CPU allows).  rng is the random
+           number generator that the objects should use (anything with the
+           random module's API, like a sim_random.SimRandom); it defaults
+           to the global random module.
         """
         self._wid = wid
         self._hei = hei
 
         self._frame_rate = frame_rate
+        self._title = title
 
-        self._win = graphics(wid, hei + 300, title)
+        # if True, draw() skips rendering the frames whose deadline has
+        # already passed (the tick still runs), so the window keeps up with
+        # _frame_rate when the ticks get slow
+        self._skip_late_frames = True
+        self._shown_fps = None
+
+        self._headless = headless
+        if headless:
+            self._win = None
+        else:
+            self._win = graphics(wid, hei + STATS_HEIGHT, title)
 
         # this is a configuration setting - it changes how we calculate
         # the distance between objects in do_nearby_calls()
         self._account_for_radii_in_dist = False
 
+        # which algorithm do_nearby_calls() uses.  "all_pairs" is the
+        # original one (every pair, every tick); "grid" buckets the objects
+        # into a UniformGrid and only delivers the pairs that are within
+        # _nearby_cutoff of each other.
+        self._nearby_engine = "all_pairs"
+        self._nearby_cutoff = None
+
+        # the "verlet" engine keeps each object's list of possible partners
+        # (everything within _nearby_cutoff + _nearby_skin) from one tick
+        # to the next, and only rebuilds the lists when somebody has moved
+        # more than half the skin since they were built.
+        self._nearby_skin = 16
+        self._verlet_lists = None
+        self._verlet_origins = None
+        self._verlet_version = None
+        self._verlet_reach = None
+        self._nearby_rebuilds = 0
+
+        # bumped whenever objects are added or removed (so the verlet lists
+        # know they're out of date)
+        self._objs_version = 0
+
+        # how draw() works.  "immediate" clears the canvas and redraws
+        # everything every frame; "retained" draws the background once, and
+        # then only moves / recolors the canvas items of each object (see
+        # _draw_retained()).
+        self._renderer = "immediate"
+        self._canvas_items = {}
+        self._next_canvas_tag = 0
+        self._background_drawn = False
+        self._last_stats = None
+
+        # an optional tick_profiler.TickProfiler; see config_set().  When it
+        # is None, the only cost is one "is not None" check per phase.
+        self._profiler = None
+
+        # which types of object actually do something in nearby(); see
+        # register_interaction().  Empty means "every object, with every
+        # other object" (the original behavior).
+        self._interactions = {}
+        self._roles_cache = {}
+
+        # how many pairs the last do_nearby_calls() measured, and how many
+        # nearby() calls it made; see nearby_counts().  Counting the pairs
+        # costs a little in the engines' inner loops, so it's only done when
+        # there is a profiler, or when "count_pairs" is on.
+        self._count_pairs = False
+        self._last_nearby_counts = (None, 0)
+
+        if rng is None:
+            rng = random
+        self.rng = rng
+
+        # number of completed ticks (see execute_removes()); and a counter
+        # for handing out object ids (see new_id())
+        self._tick = 0
+        self._next_id = 0
+
+        # anything that wants to keep a record of what happens during the
+        # game can be put here by the user; the objects find it through the
+        # game parameter of nearby().  (covidSim puts an
+        # infection_log.InfectionLog here.)
+        self.event_log = None
+
+        # the same, for the layout of the room: anything with the methods of
+        # an obstacle_map.ObstacleMap, which the objects can check in
+        # move().  None means an empty room.
+        self.obstacles = None
+
         # the user must call add_obj() to add to this set
-        self._active_objs = set()
+        #
+        # UPDATE: these "sets" are really dicts (with None values), because
+        #         a set of objects iterates in an order that depends on
+        #         their memory addresses - so two runs with the same seed
+        #         would call nearby() / edge() (and thus the rng) in a
+        #         different order.  A dict iterates in insertion order.
+        self._active_objs = {}
 
         # see what remove_obj() and perform_moves() do, to understand this
         # variable.  UPDATE: Also, we're doing this for *adding*, otherwise
         # adding inside of move() will be impossible.
-        self._pending_removes = set()
-        self._pending_adds = set()
+        self._pending_removes = {}
+        self._pending_adds = {}
 
         # I plan to add a feature, where the user can mark the game as "over"
         self._game_over = False
@@ -53,12 +152,176 @@ class Game:
 
            Supported Config Options:
              "account_for_radii_in_dist" -> Boolean
+             "nearby_engine"             -> "all_pairs", "grid", "lazy" or
+                                            "verlet"
+             "nearby_cutoff"             -> number (max distance delivered
+                                            to nearby(); required by "grid"
+                                            and "verlet")
+             "nearby_skin"               -> number (how much further than
+                                            the cutoff the "verlet" lists
+                                            reach)
+             "renderer"                  -> "immediate" or "retained"
+             "profiler"                  -> a tick_profiler.TickProfiler to
+                                            time every phase with, or None
+             "count_pairs"               -> Boolean (count the pairs
+                                            measured even without a
+                                            profiler; see nearby_counts())
+             "skip_late_frames"          -> Boolean
         """
         if param == "account_for_radii_in_dist":
             self._account_for_radii_in_dist = val
+        elif param == "nearby_engine":
+            assert val in ("all_pairs", "grid", "lazy", "verlet")
+            self._nearby_engine = val
+            self._verlet_lists = None
+        elif param == "nearby_cutoff":
+            assert val is None or val > 0
+            self._nearby_cutoff = val
+            self._verlet_lists = None
+        elif param == "nearby_skin":
+            assert val >= 0
+            self._nearby_skin = val
+            self._verlet_lists = None
+        elif param == "renderer":
+            assert val in ("immediate", "retained")
+            self._renderer = val
+        elif param == "profiler":
+            self._profiler = val
+        elif param == "count_pairs":
+            self._count_pairs = val
+        elif param == "skip_late_frames":
+            self._skip_late_frames = val
         else:
             assert False   # unrecognized config parameter
 
+    # INTERACTION REGISTRY
+    #
+    # In a lot of games, most objects don't do anything in nearby() - but
+    # do_nearby_calls() doesn't know that, so it measures and sorts their
+    # distances anyway, only to throw them away.  register_interaction()
+    # lets the user tell the game which types of object have a nearby() that
+    # matters (and, optionally, which types of partners they care about).
+    # Once anything is registered, only objects of a registered type are
+    # used as left-hand objects, and they are only paired with objects of
+    # their partner types.
+    #
+    # Note that restricting the partner types changes which partner is the
+    # "nearest" one; only do that if nearby() really doesn't care about the
+    # other objects.
+
+    def register_interaction(self, left_type, partner_types=None):
+        """Declares that objects of left_type (or a subclass of it) have a
+           nearby() that does something.  partner_types is a type or tuple
+           of types of the right-hand objects it should be called with; None
+           means any object.
+
+           Parameters: the left-hand type, the partner type(s)
+        """
+        if partner_types is not None and not isinstance(partner_types, tuple):
+            partner_types = (partner_types,)
+        self._interactions[left_type] = partner_types
+        self._roles_cache = {}
+
+    def _roles(self, obj):
+        """Returns (is_left, partner_types, is_partner) for an object, from the
+           interaction registry: whether it is a left-hand object, the types
+           of its partners (None means any), and whether it can be anybody's
+           partner.
+        """
+        kind = type(obj)
+        roles = self._roles_cache.get(kind)
+        if roles is not None:
+            return roles
+
+        is_left = False
+        partner_types = ()
+        is_partner = False
+        for left_type, types in self._interactions.items():
+            if issubclass(kind, left_type):
+                is_left = True
+                if types is None or partner_types is None:
+                    partner_types = None
+                else:
+                    partner_types += types
+            if types is None or issubclass(kind, types):
+                is_partner = True
+
+        roles = (is_left, partner_types, is_partner)
+        self._roles_cache[kind] = roles
+        return roles
+
+    def nearby_counts(self):
+        """Returns (pairs, calls): how many object pairs the last
+           do_nearby_calls() measured the distance of, and how many nearby()
+           calls it made.  pairs is None unless there is a profiler or
+           "count_pairs" is on.
+        """
+        return self._last_nearby_counts
+
+    def nearby_rebuilds(self):
+        """Returns how many times the "verlet" engine has rebuilt its
+           neighbor lists.
+        """
+        return self._nearby_rebuilds
+
+    def get_tick(self):
+        """Returns the number of the current tick: 0 during the first round of
+           nearby() / move() calls, and so on.  execute_removes() ends a
+           tick.
+        """
+        return self._tick
+
+    def skip_ticks(self, count):
+        """Advances the tick counter over count ticks in which nothing
+           happened, without making any calls.  This is for engines (like
+           event_engine) which know that nothing *would* happen.
+        """
+        assert count >= 0
+        assert len(self._pending_adds) == 0 and len(self._pending_removes) == 0
+        self._tick += count
+
+    def has_pending_changes(self):
+        """Returns True if there are adds or removes waiting for the next
+           execute_removes().
+        """
+        return len(self._pending_adds) > 0 or len(self._pending_removes) > 0
+
+    def new_id(self):
+        """Returns a new, unique (within this game) id for an object."""
+        self._next_id += 1
+        return self._next_id - 1
+
+    def get_next_id(self):
+        """Returns the id that the next new_id() call will return."""
+        return self._next_id
+
+    def restore(self, objs, tick, next_id):
+        """Replaces the contents of the game with a saved set of objects,
+           which become active right away (in the given order), and sets the
+           tick and id counters.  This is for loading checkpoints; see
+           checkpoint.py.
+        """
+        self._active_objs = dict.fromkeys(objs)
+        self._pending_adds = {}
+        self._pending_removes = {}
+        self._objs_version += 1
+        self._tick = tick
+        self._next_id = next_id
+
+    def get_objs(self):
+        """Returns the active objects (in the order the game iterates them).
+           Don't add or remove objects through this; use add_obj() and
+           remove_obj().
+        """
+        return self._active_objs.keys()
+
+    def get_size(self):
+        """Returns (width, height) of the game space."""
+        return (self._wid, self._hei)
+
+    def is_headless(self):
+        return self._headless
+
     def set_game_over(self):
         self._game_over = True
 
@@ -76,7 +339,7 @@ class Game:
         """
         assert new_obj not in self._active_objs
         assert new_obj not in self._pending_adds
-        self._pending_adds.add(new_obj)
+        self._pending_adds[new_obj] = None
 
     # REMOVE LOGIC
     #
@@ -109,7 +372,7 @@ class Game:
            Arguments: object to remove
         """
         assert bad_obj in self._active_objs
-        self._pending_removes.add(bad_obj)
+        self._pending_removes[bad_obj] = None
 
     def execute_removes(self):
         """Called by the game loop, after all of the nearby() and move() calls
@@ -117,11 +380,25 @@ class Game:
 
            Arguments: None
         """
-        self._active_objs -= self._pending_removes
-        self._pending_removes = set()
+        prof = self._profiler
+        if prof is not None:
+            t0 = time.perf_counter()
+
+        if len(self._pending_removes) > 0 or len(self._pending_adds) > 0:
+            self._objs_version += 1
+
+        for o in self._pending_removes:
+            del self._active_objs[o]
+        self._pending_removes = {}
 
         self._active_objs.update(self._pending_adds)
-        self._pending_adds = set()
+        self._pending_adds = {}
+
+        # this is the last step of every tick
+        self._tick += 1
+
+        if prof is not None:
+            prof.add("removes", time.perf_counter() - t0)
 
     def do_nearby_calls(self):
         """Figures out how close each object is to every other, sorts them by
@@ -131,14 +408,57 @@ class Game:
            inner loop, and then start delivering values for another left-hand
            value.
 
+           If the "grid" engine is selected, only the pairs that are within
+           the "nearby_cutoff" distance are delivered; the ordering (and
+           the early-termination) rules are the same.  The "lazy" engine
+           delivers exactly what the all-pairs one does, but only measures
+           as many pairs as the nearby() calls actually use.  The "verlet"
+           engine delivers the same calls as the "grid" one, but reuses its
+           neighbor lists across ticks.
+
+           If any interactions have been registered (see
+           register_interaction()), only those pairs are delivered.
+
            Parameters: none
         """
+        prof = self._profiler
+        if prof is not None:
+            # a tick starts with the nearby calls
+            prof.start_tick()
+            t0 = time.perf_counter()
+
+        count_pairs = prof is not None or self._count_pairs
+        if self._nearby_engine == "grid":
+            counts = self._do_nearby_calls_grid(count_pairs)
+        elif self._nearby_engine == "lazy":
+            counts = self._do_nearby_calls_lazy()
+        elif self._nearby_engine == "verlet":
+            counts = self._do_nearby_calls_verlet(count_pairs)
+        else:
+            counts = self._do_nearby_calls_all_pairs()
+        if not count_pairs:
+            counts = (None, counts[1])
+        self._last_nearby_counts = counts
+
+        if prof is not None:
+            prof.add("nearby", time.perf_counter() - t0)
+            prof.count("pairs", counts[0])
+            prof.count("nearby_calls", counts[1])
+
+    def _do_nearby_calls_all_pairs(self):
+        """The original version of do_nearby_calls(): measures every pair of
+           objects, and sorts all of them.
 
+           Returns (pairs measured, nearby() calls made)
+        """
         positions = []
         for o in self._active_objs:
             x, y = o.get_xy()
             positions.append((o, x, y))
 
+        if len(self._interactions) > 0:
+            return self._do_nearby_calls_registered(positions)
+
         # Note that we're doing a 2D loop, but because we're only looking for
         # one version of each pair (not the reversed), notice that we do
         # something funny with the lower bound of the inner loop variable.
@@ -179,6 +499,7 @@ class Game:
         # this loop is weird - but we have n different objects, each of which
         # has n-1 partners.  So I will implement each inner loop as looping
         # over a slice of the distances array.
+        calls = 0
         for i in range(n):
             for entry in distances[(n-1)*i: (n-1)*(i+1)]:
                 k1, dist, k2 = entry
@@ -189,14 +510,401 @@ class Game:
 
                 # if the user returns False, then we will terminate this as a
                 # left-hand element.
+                calls += 1
                 if not left.nearby(right, dist, self):
                     break
 
+        return (n*(n-1)//2, calls)
+
+    def _do_nearby_calls_registered(self, positions):
+        """The all-pairs engine, when interactions have been registered: for
+           every left-hand object, measures the distance to each of its
+           possible partners, and sorts only those.
+
+           Returns (pairs measured, nearby() calls made)
+        """
+        roles = []
+        for o, x, y in positions:
+            roles.append(self._roles(o))
+
+        pairs = 0
+        calls = 0
+        for i in range(len(positions)):
+            is_left, partner_types, _ = roles[i]
+            if not is_left:
+                continue
+            left, x1, y1 = positions[i]
+
+            partners = []
+            for j in range(len(positions)):
+                right, x2, y2 = positions[j]
+                if j == i or not roles[j][2]:
+                    continue
+                if partner_types is not None and not isinstance(right, partner_types):
+                    continue
+
+                dist = math.sqrt((x1-x2)**2 + (y1-y2)**2)
+
+                if self._account_for_radii_in_dist:
+                    dist -= left.get_radius()
+                    dist -= right.get_radius()
+
+                partners.append((dist, j))
+            partners.sort()
+
+            # (every pair measured is a partner)
+            pairs += len(partners)
+
+            for dist, j in partners:
+                calls += 1
+                if not left.nearby(positions[j][0], dist, self):
+                    break
+
+        return (pairs, calls)
+
+    def _do_nearby_calls_grid(self, count_pairs):
+        """The "grid" version of do_nearby_calls().  Buckets every object into
+           a UniformGrid whose cells are as large as the longest
+           center-to-center distance that can still be within the cutoff;
+           that way, each left-hand object only has to look at the 3x3
+           block of cells around it, instead of at every other object.
+
+           Returns (pairs measured, nearby() calls made); the pairs are
+           only counted if count_pairs is set
+        """
+        cutoff = self._nearby_cutoff
+        assert cutoff is not None   # the grid engine needs a cutoff
+
+        registered = len(self._interactions) > 0
+
+        positions = []
+        roles = []
+        max_rad = 0
+        for o in self._active_objs:
+            x, y = o.get_xy()
+            positions.append((o, x, y))
+            if registered:
+                roles.append(self._roles(o))
+            if self._account_for_radii_in_dist:
+                max_rad = max(max_rad, o.get_radius())
+
+        # if we're measuring edge-to-edge, then two objects whose centers
+        # are up to (cutoff + both radii) apart still count.
+        reach = cutoff + 2*max_rad
+
+        # only objects which can be somebody's partner go into the grid
+        grid = UniformGrid(reach)
+        for i in range(len(positions)):
+            if registered and not roles[i][2]:
+                continue
+            o, x, y = positions[i]
+            grid.insert(i, x, y)
+
+        pairs = 0
+        calls = 0
+        for i in range(len(positions)):
+            partner_types = None
+            if registered:
+                is_left, partner_types, _ = roles[i]
+                if not is_left:
+                    continue
+            left, x1, y1 = positions[i]
+
+            # same ordering as the all-pairs engine: by distance, then by
+            # the index of the right-hand object.
+            partners = []
+            for j, x2, y2 in grid.candidates(x1, y1):
+                if j == i:
+                    continue
+                if partner_types is not None and not isinstance(positions[j][0], partner_types):
+                    continue
+
+                dist = math.sqrt((x1-x2)**2 + (y1-y2)**2)
+                if count_pairs:
+                    pairs += 1
+
+                if self._account_for_radii_in_dist:
+                    dist -= left.get_radius()
+                    dist -= positions[j][0].get_radius()
+
+                if dist <= cutoff:
+                    partners.append((dist, j))
+            partners.sort()
+
+            for dist, j in partners:
+                right = positions[j][0]
+
+                # if the user returns False, then we will terminate this as a
+                # left-hand element.
+                calls += 1
+                if not left.nearby(right, dist, self):
+                    break
+
+        return (pairs, calls)
+
+    def _do_nearby_calls_verlet(self, count_pairs):
+        """The "verlet" version of do_nearby_calls().  Delivers the same calls
+           as the "grid" engine, but instead of bucketing every object into a
+           new grid on every tick, it keeps a list, for every left-hand
+           object, of the partners within (cutoff + skin) of it, and only
+           measures the distances to those.
+
+           Nobody can have come within the cutoff of an object that is not
+           on its list until one of the two has moved more than half the
+           skin; so the lists are only rebuilt when somebody has moved that
+           far since the last rebuild (or when objects were added or
+           removed).  With people moving a couple of pixels per tick, that
+           is once every few ticks.
+
+           Returns (pairs measured, nearby() calls made); the pairs
+           measured by a rebuild are only counted if count_pairs is set
+        """
+        cutoff = self._nearby_cutoff
+        assert cutoff is not None   # the verlet engine needs a cutoff
+
+        registered = len(self._interactions) > 0
+
+        positions = []
+        max_rad = 0
+        for o in self._active_objs:
+            x, y = o.get_xy()
+            positions.append((o, x, y))
+            if self._account_for_radii_in_dist:
+                max_rad = max(max_rad, o.get_radius())
+
+        # if we're measuring edge-to-edge, then two objects whose centers
+        # are up to (cutoff + both radii) apart still count.
+        reach = cutoff + 2*max_rad
+
+        pairs = 0
+        if self._verlet_lists_stale(positions, reach):
+            pairs += self._build_verlet_lists(positions, reach, registered, count_pairs)
+
+        calls = 0
+        for i, partner_list in self._verlet_lists:
+            left, x1, y1 = positions[i]
+
+            # same ordering as the all-pairs engine: by distance, then by
+            # the index of the right-hand object.
+            pairs += len(partner_list)
+            partners = []
+            for j in partner_list:
+                right, x2, y2 = positions[j]
+
+                dist = math.sqrt((x1-x2)**2 + (y1-y2)**2)
+
+                if self._account_for_radii_in_dist:
+                    dist -= left.get_radius()
+                    dist -= right.get_radius()
+
+                if dist <= cutoff:
+                    partners.append((dist, j))
+            partners.sort()
+
+            for dist, j in partners:
+                # if the user returns False, then we will terminate this as a
+                # left-hand element.
+                calls += 1
+                if not left.nearby(positions[j][0], dist, self):
+                    break
+
+        return (pairs, calls)
+
+    def _verlet_lists_stale(self, positions, reach):
+        """Returns True if the verlet lists have to be rebuilt before they
+           can be used for these positions.
+        """
+        if self._verlet_lists is None:
+            return True
+        if self._verlet_version != self._objs_version or reach > self._verlet_reach:
+            return True
+
+        limit = (self._nearby_skin / 2) ** 2
+        origins = self._verlet_origins
+        for i in range(len(positions)):
+            o, x, y = positions[i]
+            x0, y0 = origins[i]
+            if (x-x0)**2 + (y-y0)**2 > limit:
+                return True
+        return False
+
+    def _build_verlet_lists(self, positions, reach, registered, count_pairs):
+        """Rebuilds the verlet lists: a list of (i, [j, ...]), with an entry
+           for every left-hand object (in order) holding the indices of its
+           partners within reach + skin of it.  Returns the number of pairs
+           measured (0 unless count_pairs is set).
+        """
+        self._nearby_rebuilds += 1
+        if self._profiler is not None:
+            self._profiler.count("rebuilds", 1)
+
+        roles = None
+        if registered:
+            roles = [self._roles(o) for o, x, y in positions]
+
+        outer = reach + self._nearby_skin
+        outer_sq = outer * outer
+
+        grid = UniformGrid(outer)
+        for i in range(len(positions)):
+            if registered and not roles[i][2]:
+                continue
+            o, x, y = positions[i]
+            grid.insert(i, x, y)
+
+        pairs = 0
+        lists = []
+        for i in range(len(positions)):
+            partner_types = None
+            if registered:
+                is_left, partner_types, _ = roles[i]
+                if not is_left:
+                    continue
+            left, x1, y1 = positions[i]
+
+            partner_list = []
+            for j, x2, y2 in grid.candidates(x1, y1):
+                if j == i:
+                    continue
+                if partner_types is not None and not isinstance(positions[j][0], partner_types):
+                    continue
+                if count_pairs:
+                    pairs += 1
+                if (x1-x2)**2 + (y1-y2)**2 <= outer_sq:
+                    partner_list.append(j)
+            lists.append((i, partner_list))
+
+        self._verlet_lists = lists
+        self._verlet_origins = [(x, y) for o, x, y in positions]
+        self._verlet_version = self._objs_version
+        self._verlet_reach = reach
+        return pairs
+
+    def _do_nearby_calls_lazy(self):
+        """The "lazy" version of do_nearby_calls().  Delivers the same calls
+           as the all-pairs engine (every partner, no cutoff, ordered by
+           distance and then index), but finds each left-hand object's
+           partners nearest-first, only as far as its nearby() calls get.
+
+           The objects are bucketed into a UniformGrid, and the search walks
+           outwards from the left-hand object's cell, one ring of cells at a
+           time, pushing what it finds onto a heap.  The top of the heap can
+           be delivered as soon as it is closer than anything in the cells
+           not searched yet.  So if nearby() stops after the first partner
+           (like in covidSim), each object only looks at the few cells
+           around it, instead of measuring (and sorting) all n-1 partners.
+
+           Returns (pairs measured, nearby() calls made)
+        """
+        registered = len(self._interactions) > 0
+
+        positions = []
+        roles = []
+        max_rad = 0
+        for o in self._active_objs:
+            x, y = o.get_xy()
+            positions.append((o, x, y))
+            if registered:
+                roles.append(self._roles(o))
+            if self._account_for_radii_in_dist:
+                max_rad = max(max_rad, o.get_radius())
+        if len(positions) < 2:
+            return (0, 0)
+
+        # a few objects per cell, on average
+        xs = [x for o, x, y in positions]
+        ys = [y for o, x, y in positions]
+        area = max(1, (max(xs) - min(xs)) * (max(ys) - min(ys)))
+        cell = max(1.0, 2 * math.sqrt(area / len(positions)))
+
+        grid = UniformGrid(cell)
+        for i in range(len(positions)):
+            if registered and not roles[i][2]:
+                continue
+            o, x, y = positions[i]
+            grid.insert(i, x, y)
+        extent = grid.extent()
+        if extent is None:
+            return (0, 0)
+        col0, row0, col1, row1 = extent
+
+        pairs = 0
+        calls = 0
+        for i in range(len(positions)):
+            partner_types = None
+            if registered:
+                is_left, partner_types, _ = roles[i]
+                if not is_left:
+                    continue
+            left, x1, y1 = positions[i]
+
+            slack = 0
+            if self._account_for_radii_in_dist:
+                slack = left.get_radius() + max_rad
+
+            cx, cy = grid.cell_of(x1, y1)
+            last_ring = max(cx - col0, col1 - cx, cy - row0, row1 - cy)
+
+            heap = []
+            popped = calls
+            r = 0          # rings 0 .. r-1 have been searched
+            safe = -math.inf
+            while True:
+                # search more rings until the nearest pair found so far is
+                # closer than anything in the rings not searched yet (a tie
+                # isn't enough: an unseen partner with the same distance
+                # might have a lower index)
+                while r <= last_ring and (len(heap) == 0 or heap[0][0] >= safe):
+                    for j, x2, y2 in grid.ring(cx, cy, r):
+                        if j == i:
+                            continue
+                        if partner_types is not None and not isinstance(positions[j][0], partner_types):
+                            continue
+
+                        dist = math.sqrt((x1-x2)**2 + (y1-y2)**2)
+
+                        if self._account_for_radii_in_dist:
+                            dist -= left.get_radius()
+                            dist -= positions[j][0].get_radius()
+                        heapq.heappush(heap, (dist, j))
+
+                    # the distance from the left-hand object to the edge of
+                    # the searched block of cells
+                    if r >= last_ring:
+                        safe = math.inf
+                    else:
+                        safe = min(x1 - (cx - r)*cell, (cx + r + 1)*cell - x1,
+                                   y1 - (cy - r)*cell, (cy + r + 1)*cell - y1) - slack
+                    r += 1
+
+                if len(heap) == 0:
+                    break
+                dist, j = heapq.heappop(heap)
+
+                # if the user returns False, then we will terminate this as a
+                # left-hand element.
+                calls += 1
+                if not left.nearby(positions[j][0], dist, self):
+                    break
+
+            # every pair measured went onto the heap, and was either popped
+            # (one call each) or is still there
+            pairs += len(heap) + calls - popped
+
+        return (pairs, calls)
+
     def do_move_calls(self):
         """Calls move() on every object in the game"""
+        prof = self._profiler
+        if prof is not None:
+            t0 = time.perf_counter()
+
         for o in self._active_objs:
             o.move(self)
 
+        if prof is not None:
+            prof.add("move", time.perf_counter() - t0)
+
     def do_edge_calls(self):
         """Finds any objects that are close to any edge - defined as within the
            radius of it (that is, touching or overlapping) - and calls edge()
@@ -204,6 +912,9 @@ class Game:
 
            Parameters: none
         """
+        prof = self._profiler
+        if prof is not None:
+            t0 = time.perf_counter()
 
         for o in self._active_objs:
             x, y = o.get_xy()
@@ -219,29 +930,143 @@ class Game:
             if y+rad >= self._hei:
                 o.edge("bottom", self._hei)
 
+        if prof is not None:
+            prof.add("edge", time.perf_counter() - t0)
+
     def draw(self, population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks, og_infected_pop, cur_infected, newly_infected, infected_mask_type):
         """Calls draw() on every object in the game.  Also does the rest of the
-           misc calls necessary to animate the window.
+           misc calls necessary to animate the window.  Does nothing for a
+           headless game (there's no window, and no frame delay).
         """
 
+        if self._headless:
+            return
+
         # if the window has been destroyed, then we will throw an exception when
         # we run clear() below.  So check for this condition first!
         if self._win.is_killed:
             self._game_over = True
             return
 
-        self._win.clear()
+        prof = self._profiler
+
+        # the tick took so long that this frame is already late; don't make
+        # it later by drawing it, just keep the window responsive
+        if self._skip_late_frames and self._win.frame_is_late():
+            self._win.skip_frame()
+            if prof is not None:
+                prof.count("late_frames", 1)
+            self._win.frame_space(self._frame_rate)
+            return
+
+        if prof is not None:
+            t0 = time.perf_counter()
+
+        if self._renderer == "retained":
+            self._draw_retained((population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks,
+                                 og_infected_pop, cur_infected, newly_infected, infected_mask_type))
+        else:
+            self._win.clear()
+
+            draw_background(self)
+
+            # make another function?
+            display_stats(self, population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks,
+                          og_infected_pop, cur_infected, newly_infected, infected_mask_type)
+
+            for o in self._active_objs:
+                o.draw(self._win)
+
+        # this is update_frame(), split in two so that the profiler doesn't
+        # count the frame delay as drawing time
+        self._win.update()
+        if prof is not None:
+            prof.add("draw", time.perf_counter() - t0)
+        self._win.frame_space(self._frame_rate)
+        self._show_fps()
+
+    def get_fps(self):
+        """Returns (achieved, target) frames per second; achieved counts
+           only the frames that were actually drawn.  (0, target) for a
+           headless game.
+        """
+        if self._headless:
+            return (0.0, self._frame_rate)
+        return (self._win.get_fps(), self._frame_rate)
+
+    def _show_fps(self):
+        """Puts the achieved vs target frame rate in the window title."""
+        achieved, target = self.get_fps()
+        shown = round(achieved)
+        if shown != self._shown_fps and achieved > 0:
+            self._shown_fps = shown
+            self._win.set_title("%s - %d / %d fps" % (self._title, shown, target))
+
+    # RETAINED RENDERING
+    #
+    # Clearing the canvas and recreating every item on every frame is what
+    # makes the immediate renderer slow: the background alone is ~30 items,
+    # and every person is 4 or 5 more.  In retained mode, the background is
+    # drawn exactly once, the stats are only redrawn when one of the numbers
+    # changes, and each object's items are drawn once (when it first shows
+    # up) under a tag of their own, so that we can move all of them with a
+    # single canvas call.
+    #
+    # For this to work, an object's draw() must return the id of the item
+    # whose fill should follow the object's "color" attribute.
+
+    def _draw_retained(self, stats):
+        """The "retained" version of the drawing part of draw().
 
-        draw_background(self)
+           Parameters: the tuple of stats to pass to display_stats()
+        """
+        win = self._win
+
+        if not self._background_drawn:
+            win.clear()
+            draw_background(self)
+            self._background_drawn = True
 
-        # make another function?
-        display_stats(self, population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks,
-                      og_infected_pop, cur_infected, newly_infected, infected_mask_type)
+        if stats != self._last_stats:
+            win.delete("stats")
+            win.set_tag("stats")
+            display_stats(self, *stats)
+            win.set_tag(None)
+
+            # keep the people on top of the (new) stats items
+            win.raise_item("objs")
+            self._last_stats = stats
 
         for o in self._active_objs:
-            o.draw(self._win)
+            x, y = o.get_xy()
+            color = getattr(o, "color", None)
+
+            entry = self._canvas_items.get(o)
+            if entry is None:
+                tag = "obj%d" % self._next_canvas_tag
+                self._next_canvas_tag += 1
+
+                win.set_tag(("objs", tag))
+                body = o.draw(win)
+                win.set_tag(None)
+
+                self._canvas_items[o] = [tag, body, x, y, color]
+                continue
 
-        self._win.update_frame(self._frame_rate)
+            tag, body, old_x, old_y, old_color = entry
+            if x != old_x or y != old_y:
+                win.move_item(tag, x - old_x, y - old_y)
+                entry[2] = x
+                entry[3] = y
+            if color != old_color and body is not None:
+                win.set_fill(body, color)
+                entry[4] = color
+
+        # get rid of the items of any object that has been removed
+        if len(self._canvas_items) != len(self._active_objs):
+            gone = [o for o in self._canvas_items if o not in self._active_objs]
+            for o in gone:
+                win.delete(self._canvas_items.pop(o)[0])
 
 
 def display_stats(object, population, cur_healthy, cur_healthy_masks, cur_healthy_no_masks,
@@ -252,32 +1077,34 @@ def display_stats(object, population, cur_healthy, cur_healthy_masks, cur_health
     Number of Healthy Non Mask Wearers, Number of Contagious People, mask status of 
     those infected, Current Number of Infected People and Number of Newly Infected People
 
-    Takes in an object (usually a game object) to draw on its window/gui object
+    Takes in an object (usually a game object) to draw on its window/gui object;
+    the stats go right below its floor (see get_size())
     """
-    object._win.rectangle(0, 600, 600, 900, "#e6e047")
-    object._win.line(0, 600, 600, 600)
-    object._win.text(50, 615, "Statistics/Information:", "black", 25)
-    object._win.text(50, 650, "Total Number of People: " + str(population))
-    object._win.text(50, 670, "Current Number of Healthy people: " +
+    wid, top = object.get_size()
+    object._win.rectangle(0, top, wid, STATS_HEIGHT, "#e6e047")
+    object._win.line(0, top, wid, top)
+    object._win.text(50, top + 15, "Statistics/Information:", "black", 25)
+    object._win.text(50, top + 50, "Total Number of People: " + str(population))
+    object._win.text(50, top + 70, "Current Number of Healthy people: " +
                      str(cur_healthy), "#181563")
     object._win.text(
-        50, 690, "Original Number of Healthy Mask Wearers: " + str(cur_healthy_masks), "#181563")
-    draw_person(object, 413, 698, True, "white")
-    object._win.text(50, 710, "Original Number of Healthy Non Mask Wearers: " +
+        50, top + 90, "Original Number of Healthy Mask Wearers: " + str(cur_healthy_masks), "#181563")
+    draw_person(object, 413, top + 98, True, "white")
+    object._win.text(50, top + 110, "Original Number of Healthy Non Mask Wearers: " +
                      str(cur_healthy_no_masks), "#181563")
-    draw_person(object, 450, 718, False, "white")
-    object._win.text(50, 730, "Number of Contagious People : " +
+    draw_person(object, 450, top + 118, False, "white")
+    object._win.text(50, top + 130, "Number of Contagious People : " +
                      str(og_infected_pop), "#66020a")
-    draw_person(object, 322, 738, True, "#FC3547")
-    draw_person(object, 347, 738, False, "#FC3547")
+    draw_person(object, 322, top + 138, True, "#FC3547")
+    draw_person(object, 347, top + 138, False, "#FC3547")
     object._win.text(
-        50, 750, "Are the Contagious People Wearing Masks?: " + str(infected_mask_type), "#66020a")
-    object._win.text(50, 770, "Current Number of Infected People : " +
+        50, top + 150, "Are the Contagious People Wearing Masks?: " + str(infected_mask_type), "#66020a")
+    object._win.text(50, top + 170, "Current Number of Infected People : " +
                      str(cur_infected), "#66020a")
     object._win.text(
-        50, 790, "Number of Newly Infected People : " + str(newly_infected), "#66020a")
-    draw_person(object, 350, 798, True, "#FD878E")
-    draw_person(object, 375, 798, False, "#FD878E")
+        50, top + 190, "Number of Newly Infected People : " + str(newly_infected), "#66020a")
+    draw_person(object, 350, top + 198, True, "#FD878E")
+    draw_person(object, 375, top + 198, False, "#FD878E")
 
 
 def draw_person(object, x, y, mask, color):
@@ -305,44 +1132,64 @@ def draw_person(object, x, y, mask, color):
                             2, "black")
 
 
-def draw_background(object):
-    """
-    Draws the background for the covidSim.py program using multiple
-    shapes. Background is supposed to look like a house for a party 
-    with a living room, dining table, and bar area.
+# Everything draw_background() draws on the floor, in order: (graphics
+# method, its arguments, and what the shape is to the people walking
+# around).  The furniture is laid out for a 600x600 floor; on a bigger one,
+# it stays in the top left corner.
+# OBSTACLE shapes are furniture nobody can walk through; CLEAR shapes are
+# floor painted over furniture (the gap in a chair), and make it walkable
+# again; None is just decoration.  obstacle_map.ObstacleMap builds its
+# bitmap from this table.
+OBSTACLE = "obstacle"
+CLEAR = "clear"
 
-    Takes in an object (usually a game object) to draw on its window/gui object
-    """
-    # floor
-    object._win.rectangle(0, 0, 600, 600, "#969595")
+FLOOR_COLOR = "#969595"
+
+BACKGROUND_SHAPES = [
     # TV and stand
-    object._win.rectangle(210, 20, 185, 18, "#713F1C")
-    object._win.rectangle(225, 10, 150, 15, "black")
+    ("rectangle", (210, 20, 185, 18, "#713F1C"), OBSTACLE),
+    ("rectangle", (225, 10, 150, 15, "black"), OBSTACLE),
     # Sofa 1
-    object._win.rectangle(80, 80, 70, 90, "#424241")
-    object._win.rectangle(110, 98, 40, 54, "#4D4D4D")
+    ("rectangle", (80, 80, 70, 90, "#424241"), OBSTACLE),
+    ("rectangle", (110, 98, 40, 54, "#4D4D4D"), OBSTACLE),
     # Sofa 2
-    object._win.rectangle(450, 80, 70, 90, "#424241")
-    object._win.rectangle(450, 98, 40, 54, "#4D4D4D")
+    ("rectangle", (450, 80, 70, 90, "#424241"), OBSTACLE),
+    ("rectangle", (450, 98, 40, 54, "#4D4D4D"), OBSTACLE),
     # Sofa 3
-    object._win.rectangle(210, 180, 185, 70, "#424241")
-    object._win.rectangle(240, 180, 118, 50, "#4D4D4D")
+    ("rectangle", (210, 180, 185, 70, "#424241"), OBSTACLE),
+    ("rectangle", (240, 180, 118, 50, "#4D4D4D"), OBSTACLE),
     # Coffee table
-    object._win.ellipse(300, 98, 140, 40, "#713F1C")
-    object._win.text(300, 130, "Living Room")
+    ("ellipse", (300, 98, 140, 40, "#713F1C"), OBSTACLE),
+    ("text", (300, 130, "Living Room"), None),
     # Dining table
-    object._win.ellipse(150, 450, 100, 180, "#713F1C")
-    object._win.rectangle(50, 420, 30, 60, "#713F1C")
-    object._win.rectangle(60, 420, 20, 40, "#969595")
-    object._win.rectangle(220, 420, 30, 60, "#713F1C")
-    object._win.rectangle(220, 420, 20, 40, "#969595")
-    object._win.rectangle(135, 280, 30, 60, "#713F1C")
-    object._win.rectangle(135, 280, 20, 40, "#969595")
-    object._win.text(150, 570, "Dining Room")
+    ("ellipse", (150, 450, 100, 180, "#713F1C"), OBSTACLE),
+    ("rectangle", (50, 420, 30, 60, "#713F1C"), OBSTACLE),
+    ("rectangle", (60, 420, 20, 40, "#969595"), CLEAR),
+    ("rectangle", (220, 420, 30, 60, "#713F1C"), OBSTACLE),
+    ("rectangle", (220, 420, 20, 40, "#969595"), CLEAR),
+    ("rectangle", (135, 280, 30, 60, "#713F1C"), OBSTACLE),
+    ("rectangle", (135, 280, 20, 40, "#969595"), CLEAR),
+    ("text", (150, 570, "Dining Room"), None),
     # Bar
-    object._win.rectangle(590, 420, 10, 75, "#583116")
-    object._win.rectangle(530, 405, 30, 105, "#583116")
-    object._win.ellipse(515, 415, 22, 22, "#3A3A3A")
-    object._win.ellipse(515, 450, 22, 22, "#3A3A3A")
-    object._win.ellipse(515, 485, 22, 22, "#3A3A3A")
-    object._win.text(465, 485, "Bar")
+    ("rectangle", (590, 420, 10, 75, "#583116"), OBSTACLE),
+    ("rectangle", (530, 405, 30, 105, "#583116"), OBSTACLE),
+    ("ellipse", (515, 415, 22, 22, "#3A3A3A"), OBSTACLE),
+    ("ellipse", (515, 450, 22, 22, "#3A3A3A"), OBSTACLE),
+    ("ellipse", (515, 485, 22, 22, "#3A3A3A"), OBSTACLE),
+    ("text", (465, 485, "Bar"), None),
+]
+
+
+def draw_background(object):
+    """
+    Draws the background for the covidSim.py program using multiple
+    shapes. Background is supposed to look like a house for a party 
+    with a living room, dining table, and bar area.
+
+    Takes in an object (usually a game object) to draw on its window/gui object;
+    the floor is as big as its get_size()
+    """
+    wid, hei = object.get_size()
+    object._win.rectangle(0, 0, wid, hei, FLOOR_COLOR)
+    for method, args, kind in BACKGROUND_SHAPES:
+        getattr(object._win, method)(*args)
@@ -0,0 +1,162 @@
+"""File: tick_profiler.py
+
+   Author: Brian Vu
+
+   Purpose: Per-tick timing for the Game loop.  Hand a TickProfiler to
+            Game.config_set("profiler", ...) and the game records how long
+            each phase of every tick took (nearby, move, edge, removes,
+            draw), how many pairs do_nearby_calls() looked at, how many
+            nearby() calls it made, whether draw() skipped a late
+            frame, and whether the "verlet" nearby engine rebuilt its
+            neighbor lists.  Keeps a rolling window of the most
+            recent ticks for percentiles, and can dump to a CSV or JSON
+            file every so many ticks.
+"""
+
+
+import csv
+import json
+import os
+from collections import deque
+
+
+PHASES = ("nearby", "move", "edge", "removes", "draw")
+COUNTERS = ("pairs", "nearby_calls", "late_frames", "rebuilds")
+
+
+class TickProfiler:
+    """Collects per-phase timings and counters for every tick.
+
+       A tick starts with do_nearby_calls(), and ends when the next one
+       starts (so draw() is counted with the tick it shows).
+
+       Methods:
+         add: adds seconds to a phase of the current tick
+         count: adds to a counter of the current tick
+         start_tick: closes the current tick (called by the Game)
+         percentile: a percentile of a phase / counter over the window
+         summary: mean and percentiles of every phase and counter
+         dump: writes to the dump file now
+    """
+
+    def __init__(self, window=1000, dump_path=None, dump_every=0):
+        """Constructor.
+
+           Parameters: how many recent ticks to keep for percentiles; and,
+           optionally, a file to dump to every dump_every ticks.  A ".json"
+           file gets overwritten with summary(); anything else is treated
+           as a CSV file, and gets one row appended per tick (the rows are
+           written out at least every window ticks, whatever dump_every is).
+        """
+        self._window_size = window
+        self._window = {}
+        for name in PHASES + COUNTERS:
+            self._window[name] = deque(maxlen=window)
+
+        self._current = None
+        self._pending_rows = []
+        self.ticks = 0
+
+        self._dump_path = dump_path
+        self._dump_every = dump_every
+
+    def _new_record(self):
+        record = {}
+        for name in PHASES + COUNTERS:
+            record[name] = 0
+        return record
+
+    def start_tick(self):
+        """Closes the current tick (if there is one) and starts a new one."""
+        self._close_tick()
+        self._current = self._new_record()
+
+    def _close_tick(self):
+        if self._current is None:
+            return
+
+        record = self._current
+        self._current = None
+        for name in record:
+            self._window[name].append(record[name])
+
+        self.ticks += 1
+        if self._dump_path is not None:
+            # (a JSON dump is just the summary; it has no use for the rows)
+            if not self._dump_path.endswith(".json"):
+                record["tick"] = self.ticks - 1
+                self._pending_rows.append(record)
+            if self._dump_every > 0 and self.ticks % self._dump_every == 0:
+                self.dump()
+            elif len(self._pending_rows) >= self._window_size:
+                # no dump due yet, but don't hold on to more than a
+                # window's worth of rows
+                self._write_rows()
+
+    def add(self, phase, seconds):
+        if self._current is None:
+            self._current = self._new_record()
+        self._current[phase] += seconds
+
+    def count(self, counter, amount):
+        if self._current is None:
+            self._current = self._new_record()
+        self._current[counter] += amount
+
+    def percentile(self, name, pct):
+        """Returns the pct-th percentile (nearest rank) of a phase or
+           counter over the rolling window, or None if there's no data yet.
+        """
+        values = sorted(self._window[name])
+        if len(values) == 0:
+            return None
+        rank = int(round(pct / 100 * (len(values) - 1)))
+        return values[rank]
+
+    def summary(self, pcts=(50, 90, 99)):
+        """Returns a dict like {"ticks": 12, "move": {"mean": ..., "p50": ...,
+           ...}, ...} for every phase and counter.
+        """
+        result = {"ticks": self.ticks}
+        for name in PHASES + COUNTERS:
+            values = self._window[name]
+            stats = {}
+            if len(values) > 0:
+                stats["mean"] = sum(values) / len(values)
+            else:
+                stats["mean"] = None
+            for pct in pcts:
+                stats["p%d" % pct] = self.percentile(name, pct)
+            result[name] = stats
+        return result
+
+    def dump(self):
+        """Writes to the dump file: the summary for a JSON file, or the rows
+           of the ticks since the last dump for a CSV file.
+        """
+        if self._dump_path is None:
+            return
+
+        if self._dump_path.endswith(".json"):
+            with open(self._dump_path, "w") as f:
+                json.dump(self.summary(), f, indent=2)
+        else:
+            self._write_rows()
+
+    def _write_rows(self):
+        """Appends the rows of the ticks since the last write to the CSV
+           file.
+        """
+        fields = ["tick"] + list(PHASES) + list(COUNTERS)
+        new_file = not os.path.exists(self._dump_path)
+        with open(self._dump_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(self._pending_rows)
+        self._pending_rows = []
+
+    def close(self):
+        """Closes the last tick and does a final dump."""
+        self._close_tick()
+        self.dump()
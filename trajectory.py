@@ -0,0 +1,513 @@
+"""File: trajectory.py
+
+   Author: Brian Vu
+
+   Purpose: Records where everybody was on every tick (and who caught it
+            when), so that a run can be watched again - at any speed, or
+            starting from any tick - without re-simulating it.  Replaying
+            is just reading the file and drawing; no nearby() calls, no
+            random numbers.
+
+            People only ever move a couple of pixels a tick, so most ticks
+            are stored as deltas: one byte per person (dx and dy packed in
+            4 bits each), plus a list of the people whose state changed.
+            Every keyframe_every ticks there is a keyframe with the full
+            positions, and the file ends with an index of the keyframes, so
+            seeking to a tick costs one keyframe plus at most
+            keyframe_every - 1 deltas.
+
+   File layout (all little endian):
+       header:  FILE_HEADER (MAGIC, n, wid, hei, keyframe_every, offset of
+                the index - 0 if the recorder was never closed)
+       people:  ids (int64 * n), kinds (uint8 * n, 1 = Infected object),
+                masks (uint8 * n)
+       frames:  FRAME_HEADER (kind, tick, payload length), then the payload
+                (see encode_keyframe() / encode_delta())
+       index:   count (uint64), keyframe ticks (int64 * count), keyframe
+                offsets (int64 * count)
+
+   The frame encoding functions don't depend on the file, so the same
+   frames can be sent somewhere else (like a network connection).
+"""
+
+
+import mmap
+import struct
+
+import numpy as np
+
+import covidSim
+from population_arrays import HEALTHY, INFECTED, TAGGED
+
+
+MAGIC = b"COVIDTR1"
+FILE_HEADER = struct.Struct("<8sIIIIQ")
+FRAME_HEADER = struct.Struct("<BqI")
+INDEX_COUNT = struct.Struct("<Q")
+
+# frame kinds
+KEYFRAME = 0
+DELTA = 1          # dx, dy as int8s
+SMALL_DELTA = 2    # dx, dy in [-8, 7], packed into one byte
+
+
+def encode_keyframe(tick, x, y, state):
+    """Returns the bytes of a keyframe: x and y (int16s) and the state
+       (int8s) of every person.
+    """
+    payload = (np.asarray(x, dtype="<i2").tobytes() +
+               np.asarray(y, dtype="<i2").tobytes() +
+               np.asarray(state, dtype="i1").tobytes())
+    return FRAME_HEADER.pack(KEYFRAME, tick, len(payload)) + payload
+
+
+def encode_delta(tick, dx, dy, changed, new_state):
+    """Returns the bytes of a delta frame: the move of every person since
+       the last frame, and the (index, new state) of everybody whose state
+       changed.  dx and dy must fit in an int8.
+    """
+    dx = np.asarray(dx)
+    dy = np.asarray(dy)
+    if len(dx) == 0 or (dx.min() >= -8 and dx.max() <= 7 and
+                        dy.min() >= -8 and dy.max() <= 7):
+        kind = SMALL_DELTA
+        moves = (((dx & 15) << 4) | (dy & 15)).astype(np.uint8).tobytes()
+    else:
+        kind = DELTA
+        moves = dx.astype("i1").tobytes() + dy.astype("i1").tobytes()
+
+    payload = (moves +
+               np.asarray(changed, dtype="<u4").tobytes() +
+               np.asarray(new_state, dtype="i1").tobytes())
+    return FRAME_HEADER.pack(kind, tick, len(payload)) + payload
+
+
+def decode_frame(buf, offset, n):
+    """Decodes the frame that starts at buf[offset:].
+
+       Returns (kind, tick, a, b, c, next_offset): for a keyframe a, b, c
+       are the x, y and state arrays; for a delta they are dx, dy and a
+       (changed, new_state) pair of arrays.
+    """
+    kind, tick, length = FRAME_HEADER.unpack_from(buf, offset)
+    start = offset + FRAME_HEADER.size
+    end = start + length
+
+    if kind == KEYFRAME:
+        x = np.frombuffer(buf, dtype="<i2", count=n, offset=start)
+        y = np.frombuffer(buf, dtype="<i2", count=n, offset=start + 2*n)
+        state = np.frombuffer(buf, dtype="i1", count=n, offset=start + 4*n)
+        return kind, tick, x, y, state, end
+
+    if kind == SMALL_DELTA:
+        packed = np.frombuffer(buf, dtype=np.uint8, count=n, offset=start)
+        # sign-extend the two 4 bit halves
+        dx = ((packed >> 4).astype(np.int8) ^ 8) - 8
+        dy = ((packed & 15).astype(np.int8) ^ 8) - 8
+        pos = start + n
+    else:
+        assert kind == DELTA
+        dx = np.frombuffer(buf, dtype="i1", count=n, offset=start)
+        dy = np.frombuffer(buf, dtype="i1", count=n, offset=start + n)
+        pos = start + 2*n
+
+    changes = (end - pos) // 5
+    changed = np.frombuffer(buf, dtype="<u4", count=changes, offset=pos)
+    new_state = np.frombuffer(buf, dtype="i1", count=changes, offset=pos + 4*changes)
+    return kind, tick, dx, dy, (changed, new_state), end
+
+
+class FrameEncoder:
+    """Turns a sequence of (tick, x, y, state) snapshots into frames,
+       choosing between keyframes and deltas.
+
+       Methods:
+         encode: returns the bytes of the next frame
+    """
+
+    def __init__(self, keyframe_every=100):
+        self.keyframe_every = keyframe_every
+        self._x = None
+        self._y = None
+        self._state = None
+        self._frames = 0
+
+    def encode(self, tick, x, y, state, keyframe=False):
+        """Returns (is_keyframe, bytes) for the next snapshot.  A keyframe
+           is made when asked for, every keyframe_every frames, and when
+           somebody moved too far for a delta.
+        """
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        state = np.asarray(state, dtype=np.int8)
+
+        if self._x is None or len(x) != len(self._x) or self._frames % self.keyframe_every == 0:
+            keyframe = True
+        if not keyframe:
+            dx = x - self._x
+            dy = y - self._y
+            if len(dx) > 0 and (min(dx.min(), dy.min()) < -128 or
+                                max(dx.max(), dy.max()) > 127):
+                keyframe = True
+
+        if keyframe:
+            data = encode_keyframe(tick, x, y, state)
+        else:
+            changed = np.flatnonzero(state != self._state)
+            data = encode_delta(tick, dx, dy, changed, state[changed])
+
+        self._x = x.copy()
+        self._y = y.copy()
+        self._state = state.copy()
+        self._frames += 1
+        return keyframe, data
+
+
+class FrameDecoder:
+    """Applies frames to a current (x, y, state) snapshot.
+
+       Fields: tick, x, y, state (numpy arrays, updated in place)
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.tick = None
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.state = np.zeros(n, dtype=np.int8)
+
+    def apply(self, buf, offset=0):
+        """Applies the frame at buf[offset:]; returns the offset after it."""
+        kind, tick, a, b, c, end = decode_frame(buf, offset, self.n)
+        if kind == KEYFRAME:
+            self.x[:] = a
+            self.y[:] = b
+            self.state[:] = c
+        else:
+            assert self.tick is not None   # a delta needs a keyframe first
+            self.x += a
+            self.y += b
+            changed, new_state = c
+            self.state[changed] = new_state
+        self.tick = tick
+        return end
+
+
+def snapshot_game(game):
+    """(x, y, state) arrays of a covidSim game, in iteration order."""
+    objs = list(game.get_objs())
+    n = len(objs)
+    x = np.fromiter((o.x for o in objs), dtype=np.int64, count=n)
+    y = np.fromiter((o.y for o in objs), dtype=np.int64, count=n)
+    state = np.fromiter((INFECTED if isinstance(o, covidSim.Infected)
+                         else TAGGED if o.tagged else HEALTHY for o in objs),
+                        dtype=np.int8, count=n)
+    return x, y, state
+
+
+class TrajectoryRecorder:
+    """Writes a trajectory file.  Frames are collected in memory and
+       written in bulk, buffer_bytes at a time.
+
+       Methods:
+         record: adds one tick, from arrays
+         record_game: adds one tick, from a covidSim game
+         record_arrays: adds one tick, from a PopulationArrays
+         close: writes the keyframe index
+    """
+
+    def __init__(self, path, ids, kinds, masks, wid=600, hei=600,
+                 keyframe_every=100, buffer_bytes=1 << 20):
+        """Constructor.
+
+           Parameters: the file name; the id, kind (1 for an Infected
+           object) and mask of every person; the size of the floor; how
+           often to write a keyframe; and how much to buffer
+        """
+        assert wid < 32768 and hei < 32768    # positions are int16s
+        self._n = len(ids)
+        self._wid = wid
+        self._hei = hei
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, self._n, wid, hei, keyframe_every, 0))
+        self._file.write(np.asarray(ids, dtype="<i8").tobytes())
+        self._file.write(np.asarray(kinds, dtype=np.uint8).tobytes())
+        self._file.write(np.asarray(masks, dtype=np.uint8).tobytes())
+
+        self._offset = self._file.tell()
+        self._buffer = []
+        self._buffered = 0
+        self._buffer_bytes = buffer_bytes
+
+        self._encoder = FrameEncoder(keyframe_every)
+        self._key_ticks = []
+        self._key_offsets = []
+
+    @classmethod
+    def for_game(cls, path, game, **kwargs):
+        """A recorder for the people in a covidSim game."""
+        objs = list(game.get_objs())
+        wid, hei = game.get_size()
+        return cls(path, [o.id for o in objs],
+                   [isinstance(o, covidSim.Infected) for o in objs],
+                   [o.mask for o in objs], wid, hei, **kwargs)
+
+    @classmethod
+    def for_arrays(cls, path, pop, **kwargs):
+        """A recorder for a population_arrays.PopulationArrays."""
+        return cls(path, pop.ids, pop.state == INFECTED, pop.mask,
+                   pop.wid, pop.hei, **kwargs)
+
+    def record(self, tick, x, y, state):
+        keyframe, data = self._encoder.encode(tick, x, y, state)
+        if keyframe:
+            self._key_ticks.append(tick)
+            self._key_offsets.append(self._offset)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._offset += len(data)
+        if self._buffered >= self._buffer_bytes:
+            self.flush()
+
+    def record_game(self, game):
+        self.record(game.get_tick(), *snapshot_game(game))
+
+    def record_arrays(self, pop):
+        self.record(pop.tick, pop.x, pop.y, pop.state)
+
+    def flush(self):
+        self._file.write(b"".join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        """Writes the rest of the frames and the keyframe index, and then
+           fills in the index offset in the header.
+        """
+        self.flush()
+        index_offset = self._offset
+        self._file.write(INDEX_COUNT.pack(len(self._key_ticks)))
+        self._file.write(np.asarray(self._key_ticks, dtype="<i8").tobytes())
+        self._file.write(np.asarray(self._key_offsets, dtype="<i8").tobytes())
+
+        self._file.seek(0)
+        self._file.write(FILE_HEADER.pack(MAGIC, self._n, self._wid, self._hei,
+                                          self._encoder.keyframe_every, index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Trajectory:
+    """A trajectory file, opened for reading (through mmap).
+
+       Fields: n, wid, hei, ids, kinds, masks, and the current frame's
+       tick, x, y, state (see FrameDecoder)
+
+       Methods:
+         seek: moves to a tick
+         next: moves to the next frame
+         ticks: the first and last recorded tick (None if there are none)
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._mm
+
+        (magic, self.n, self.wid, self.hei, self.keyframe_every,
+         index_offset) = FILE_HEADER.unpack_from(buf, 0)
+        assert magic == MAGIC    # not a trajectory file
+        n = self.n
+
+        pos = FILE_HEADER.size
+        self.ids = np.frombuffer(buf, dtype="<i8", count=n, offset=pos)
+        self.kinds = np.frombuffer(buf, dtype=np.uint8, count=n, offset=pos + 8*n)
+        self.masks = np.frombuffer(buf, dtype=np.uint8, count=n, offset=pos + 9*n)
+        self._first = pos + 10*n
+
+        if index_offset > 0:
+            self._end = index_offset
+            count, = INDEX_COUNT.unpack_from(buf, index_offset)
+            pos = index_offset + INDEX_COUNT.size
+            self._key_ticks = np.frombuffer(buf, dtype="<i8", count=count, offset=pos)
+            self._key_offsets = np.frombuffer(buf, dtype="<i8", count=count, offset=pos + 8*count)
+        else:
+            # the recorder was never closed; find the keyframes the slow way
+            self._scan()
+
+        self._decoder = FrameDecoder(n)
+        self._offset = self._first
+        self._last_tick = None
+
+    def _scan(self):
+        buf = self._mm
+        ticks = []
+        offsets = []
+        pos = self._first
+        while pos + FRAME_HEADER.size <= len(buf):
+            kind, tick, length = FRAME_HEADER.unpack_from(buf, pos)
+            if pos + FRAME_HEADER.size + length > len(buf):
+                break    # a half-written frame
+            if kind == KEYFRAME:
+                ticks.append(tick)
+                offsets.append(pos)
+            pos += FRAME_HEADER.size + length
+        self._end = pos
+        self._key_ticks = np.array(ticks, dtype=np.int64)
+        self._key_offsets = np.array(offsets, dtype=np.int64)
+
+    @property
+    def tick(self):
+        return self._decoder.tick
+
+    @property
+    def x(self):
+        return self._decoder.x
+
+    @property
+    def y(self):
+        return self._decoder.y
+
+    @property
+    def state(self):
+        return self._decoder.state
+
+    def ticks(self):
+        """Returns (first tick, last tick) of the recording, or None if
+           nothing was recorded.
+        """
+        if len(self._key_offsets) == 0:
+            return None
+        if self._last_tick is None:
+            # walk the frame headers after the last keyframe
+            pos = int(self._key_offsets[-1])
+            while pos < self._end:
+                kind, tick, length = FRAME_HEADER.unpack_from(self._mm, pos)
+                pos += FRAME_HEADER.size + length
+            self._last_tick = tick
+        return (int(self._key_ticks[0]), self._last_tick)
+
+    def next(self):
+        """Moves to the next frame.  Returns False at the end."""
+        if self._offset >= self._end:
+            return False
+        self._offset = self._decoder.apply(self._mm, self._offset)
+        return True
+
+    def seek(self, tick):
+        """Moves to the last frame at or before tick: decodes the keyframe
+           before it, and then the deltas up to it.  Does nothing if nothing
+           was recorded.
+        """
+        if len(self._key_offsets) == 0:
+            return
+        k = int(np.searchsorted(self._key_ticks, tick, side="right")) - 1
+        k = max(k, 0)
+        self._offset = int(self._key_offsets[k])
+        self.next()
+        while self._offset < self._end:
+            next_tick = FRAME_HEADER.unpack_from(self._mm, self._offset)[1]
+            if next_tick > tick:
+                break
+            self.next()
+
+    def close(self):
+        self._decoder = None
+        self.ids = self.kinds = self.masks = None
+        self._key_ticks = self._key_offsets = None
+        self._mm.close()
+
+
+def record_headless(config, path, keyframe_every=100):
+    """covidSim.run_headless(), recording every tick to path.  Returns the
+       cur_infected counts.
+    """
+    game = covidSim.build_game(config, headless=True)
+    if config.ticks == 0:
+        return []
+
+    # the people only join the game at the end of the first tick
+    counts = covidSim.run_ticks(game, 1)
+    with TrajectoryRecorder.for_game(path, game, keyframe_every=keyframe_every) as rec:
+        rec.record_game(game)
+        counts += covidSim.run_ticks(game, config.ticks - 1, after_tick=rec.record_game)
+    return counts
+
+
+def replay(path, speed=1.0, start_tick=None, frame_rate=40):
+    """Plays a trajectory file back in a window, with the usual Healthy /
+       Infected visuals, until it ends or the window is closed.
+
+       Parameters: the file name; how many ticks to advance per frame (can
+       be below 1 for slow motion); the tick to start at (default: the
+       first one); and the frame rate.  Raises ValueError if nothing was
+       recorded.
+    """
+    traj = Trajectory(path)
+    ticks = traj.ticks()
+    if ticks is None:
+        traj.close()
+        raise ValueError("empty recording: %s" % path)
+    first, last = ticks
+
+    game = covidSim.Game("COVID-19 Simulator (replay)", frame_rate,
+                         traj.wid, traj.hei)
+    game.config_set("renderer", "retained")
+
+    people = []
+    kinds = traj.kinds.tolist()
+    masks = traj.masks.tolist()
+    for k in range(traj.n):
+        mask_type = "mask" if masks[k] else "none"
+        if kinds[k]:
+            people.append(covidSim.Infected(traj.wid, traj.hei, mask_type))
+        else:
+            people.append(covidSim.Healthy(traj.wid, traj.hei, mask_type))
+    game.restore(people, 0, traj.n)
+
+    infected_pop = sum(kinds)
+    healthy_masks = sum(masks[k] for k in range(traj.n) if not kinds[k])
+    healthy_no_masks = traj.n - infected_pop - healthy_masks
+    infected_masks = "yes" if infected_pop > 0 and all(
+        masks[k] for k in range(traj.n) if kinds[k]) else "no"
+
+    if start_tick is None:
+        start_tick = first
+    traj.seek(start_tick)
+    position = float(traj.tick)
+
+    while not game.is_over():
+        xs = traj.x.tolist()
+        ys = traj.y.tolist()
+        states = traj.state.tolist()
+        for k in range(traj.n):
+            o = people[k]
+            o.x = xs[k]
+            o.y = ys[k]
+            if states[k] == TAGGED and not kinds[k]:
+                o.tagged = True
+                o.color = "#FD878E"
+
+        cur_infected = sum(1 for s in states if s != HEALTHY)
+        newly_infected = cur_infected - infected_pop
+        game.draw(traj.n, traj.n - cur_infected, healthy_masks, healthy_no_masks,
+                  infected_pop, infected_masks, cur_infected, newly_infected)
+
+        # move on by speed ticks; consecutive ticks are just decoded one by
+        # one, anything further is a seek
+        if traj.tick >= last:
+            break
+        position += speed
+        target = min(int(position), last)
+        if target - traj.tick <= traj.keyframe_every:
+            while traj.tick < target and traj.next():
+                pass
+        else:
+            traj.seek(target)
+
+    traj.close()